@@ -1,9 +1,71 @@
 from django.contrib import admin
-from .models import Post
+from django.contrib.admin.views.main import ChangeList
+from django.utils.html import format_html
+from tg_bot.admin_tools import EstimatedCountPaginator, IndexedSearchMixin
+from .models import Attachment, Post
+from .revisions import last_snapshot_version, record_revision
+
+class AttachmentInline(admin.TabularInline):
+    model = Attachment
+    extra = 0
+    fields = ('kind', 'file', 'caption', 'position')
+
+class AuthorFilter(admin.SimpleListFilter):
+    """
+    Фильтр по автору без перечисления всех пользователей.
+
+    Выбор автора - ссылка в колонке «Автор»; в боковой панели показывается
+    только выбранный автор.
+    """
+    title = 'автор'
+    parameter_name = 'author'
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value or not value.isdigit():
+            return []
+        author = Post._meta.get_field('author').related_model.objects.filter(pk=value).first()
+        return [(value, str(author))] if author else []
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(author_id=value)
+        return queryset
+
+class PostChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        # Текст поста в списке не показывается
+        return super().get_queryset(request, exclude_parameters).defer('content')
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'created_at')
-    list_filter = ('author', 'created_at')
-    search_fields = ('title', 'content', 'author__username')
-    readonly_fields = ('created_at',)
+class PostAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('title', 'author_link', 'created_at', 'publish_at', 'views')
+    list_filter = (AuthorFilter, 'created_at')
+    list_select_related = ('author',)
+    search_prefix_fields = ('title',)
+    search_exact_fields = ('author__username',)
+    search_help_text = 'Начало заголовка (с учетом регистра), точное имя автора или ID поста'
+    autocomplete_fields = ('author',)
+    readonly_fields = ('created_at', 'views')
+    inlines = [AttachmentInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return PostChangeList
+
+    @admin.display(description='Автор', ordering='author__username')
+    def author_link(self, post):
+        if post.author_id is None:
+            return '-'
+        return format_html('<a href="?author={}">{}</a>', post.author_id, post.author)
+
+    def save_model(self, request, obj, form, change):
+        # Изменение в админке тоже попадает в историю правок: без этого
+        # разница следующей редакции применялась бы к другому тексту
+        if change and {'title', 'content'} & set(form.changed_data):
+            last_snapshot = Post.objects.filter(id=obj.id).values_list(last_snapshot_version(), flat=True).get()
+            record_revision(obj.id, obj.version, form.initial['title'], form.initial['content'],
+                            next_content=obj.content, last_snapshot=last_snapshot)
+        super().save_model(request, obj, form, change)
@@ -1,23 +1,21 @@
-from ninja import Router, Schema
-from ninja.security import HttpBearer
-from .models import Post
-from .services import get_all_posts, get_post_by_id, create_post, update_post, delete_post
+from ninja import File, Form, Router, Schema
+from ninja.files import UploadedFile
+from .models import Attachment, Post, PostRevision
+from .counters import POST_VIEWS
+from .services import (
+    get_all_posts, get_most_viewed_posts, get_post_by_id, create_post, update_post, delete_post, add_attachment, delete_attachment,
+    get_post_revisions, get_post_revision, PostVersionConflict,
+)
+from .update_queue import enqueue_updates
+from users.api import AuthBearer
+from tg_bot.throttling import throttle
 from django.conf import settings
-import jwt
+from django.http import HttpResponse
 from typing import List, Optional, Dict, Any
-from django.shortcuts import get_object_or_404
 from datetime import datetime
-
-class AuthBearer(HttpBearer):
-    def authenticate(self, request, token):
-        try:
-            payload = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
-            user_id = payload.get('user_id')
-            if user_id:
-                return user_id
-        except:
-            pass
-        return None
+import hmac
+import json
+import re
 
 class PostSchema(Schema):
     id: int
@@ -25,22 +23,86 @@ class PostSchema(Schema):
     content: str
     author: str
     created_at: str
+    publish_at: Optional[str] = None
 
     class Config:
         model = Post
         model_fields = ['id', 'title', 'content', 'author', 'created_at']
 
+class AttachmentSchema(Schema):
+    id: int
+    kind: str
+    url: str
+    caption: str
+
+class PostDetailSchema(PostSchema):
+    views: int
+    attachments: List[AttachmentSchema]
+
+class PopularPostSchema(Schema):
+    id: int
+    title: str
+    author: str
+    views: int
+
 class PostCreateSchema(Schema):
     title: str
     content: str
+    publish_at: Optional[datetime] = None
 
 class PostUpdateSchema(Schema):
     title: Optional[str] = None
     content: Optional[str] = None
+    publish_at: Optional[datetime] = None
+
+class RevisionSchema(Schema):
+    version: int
+    title: str
+    replaced_at: str
+
+class RevisionListSchema(Schema):
+    version: int
+    revisions: List[RevisionSchema]
+
+class RevisionDetailSchema(Schema):
+    post_id: int
+    version: int
+    title: str
+    content: str
 
 class ErrorSchema(Schema):
     message: str
 
+def attachment_to_dict(request, attachment: Attachment) -> Dict[str, Any]:
+    return {
+        "id": attachment.id,
+        "kind": attachment.kind,
+        "url": request.build_absolute_uri(attachment.file.url),
+        "caption": attachment.caption,
+    }
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+_ETAG = re.compile(r'^(?:W/)?"(\d+)"$')
+
+def if_match_version(request) -> Optional[int]:
+    """
+    Версия поста из заголовка If-Match.
+
+    None - заголовок не передан или равен *, запись выполняется без проверки
+    версии. Признак W/ допускается: tg_bot.middleware.CompressionMiddleware
+    ослабляет ETag сжатого ответа.
+    Значение, которое не может совпасть ни с одной версией (чужой формат,
+    несколько тегов), дает 0 - версии начинаются с 1, поэтому запись
+    завершится 412.
+    """
+    value = request.headers.get('If-Match', '').strip()
+    if not value or value == '*':
+        return None
+    match = _ETAG.match(value)
+    return int(match.group(1)) if match else 0
+
 # Создаем роутер вместо API
 router = Router(auth=AuthBearer(), tags=["Блог"])
 
@@ -68,8 +130,35 @@ def list_posts(request):
         for post in posts
     ]
 
-@router.get("/posts/{post_id}", response={200: PostSchema, 404: ErrorSchema}, auth=None, summary="Получение поста по ID")
-def get_post(request, post_id: int):
+@router.get("/posts/popular", response={200: List[PopularPostSchema]}, auth=None, summary="Самые просматриваемые посты")
+def list_popular_posts(request, limit: int = 10):
+    """
+    Посты по убыванию числа просмотров.
+
+    Просмотры записываются в базу пакетами раз в несколько секунд,
+    поэтому последние просмотры могут еще не учитываться.
+
+    - **limit**: Количество постов (не больше 100)
+
+    Returns:
+    - **id**: ID поста
+    - **title**: Заголовок
+    - **author**: Имя автора
+    - **views**: Количество просмотров
+    """
+    posts = get_most_viewed_posts(min(max(limit, 1), 100))
+    return [
+        {
+            "id": post.id,
+            "title": post.title,
+            "author": post.author.username if post.author else '',
+            "views": post.views,
+        }
+        for post in posts
+    ]
+
+@router.get("/posts/{post_id}", response={200: PostDetailSchema, 404: ErrorSchema}, auth=None, summary="Получение поста по ID")
+def get_post(request, response: HttpResponse, post_id: int):
     """
     Получение поста по ID.
     
@@ -82,20 +171,29 @@ def get_post(request, post_id: int):
     - **content**: Содержание
     - **author**: Имя автора
     - **created_at**: Дата создания
+    - **views**: Количество просмотров (без еще не записанных)
+    - **attachments**: Вложения (id, kind, url, caption)
+
+    Заголовок ETag содержит версию поста для If-Match при изменении и удалении.
     """
     try:
         post = get_post_by_id(post_id)
+        POST_VIEWS.add_post(post)
+        response['ETag'] = etag(post.version)
         return {
             "id": post.id,
             "title": post.title,
             "content": post.content,
             "author": post.author.username,
-            "created_at": post.created_at.strftime("%Y-%m-%d %H:%M:%S")
+            "created_at": post.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "views": post.views,
+            "attachments": [attachment_to_dict(request, attachment) for attachment in post.attachments.all()],
         }
     except Exception as e:
         return 404, {"message": str(e)}
 
 @router.post("/posts", response={201: PostSchema, 400: ErrorSchema}, summary="Создание нового поста")
+@throttle('post_create')
 def create_new_post(request, data: PostCreateSchema):
     """
     Создание нового поста.
@@ -103,6 +201,7 @@ def create_new_post(request, data: PostCreateSchema):
     Args:
     - **title**: Заголовок поста
     - **content**: Содержание поста
+    - **publish_at**: Время отложенной публикации (опционально), до него пост скрыт
     
     Returns:
     - **id**: ID поста
@@ -110,21 +209,23 @@ def create_new_post(request, data: PostCreateSchema):
     - **content**: Содержание
     - **author**: Имя автора
     - **created_at**: Дата создания
+    - **publish_at**: Время публикации (null - опубликован сразу)
     """
     try:
-        post = create_post(request.auth, data.title, data.content)
+        post = create_post(request.auth, data.title, data.content, publish_at=data.publish_at)
         return 201, {
             "id": post.id,
             "title": post.title,
             "content": post.content,
             "author": post.author.username,
-            "created_at": post.created_at.strftime("%Y-%m-%d %H:%M:%S")
+            "created_at": post.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "publish_at": post.publish_at.isoformat() if post.publish_at else None,
         }
     except Exception as e:
         return 400, {"message": str(e)}
 
-@router.put("/posts/{post_id}", response={200: PostSchema, 400: ErrorSchema, 404: ErrorSchema}, summary="Обновление поста")
-def update_existing_post(request, post_id: int, data: PostUpdateSchema):
+@router.put("/posts/{post_id}", response={200: PostSchema, 400: ErrorSchema, 404: ErrorSchema, 412: ErrorSchema}, summary="Обновление поста")
+def update_existing_post(request, response: HttpResponse, post_id: int, data: PostUpdateSchema):
     """
     Обновление существующего поста.
     
@@ -134,19 +235,27 @@ def update_existing_post(request, post_id: int, data: PostUpdateSchema):
     - **post_id**: ID поста
     - **title**: Новый заголовок (опционально)
     - **content**: Новое содержание (опционально)
+    - **publish_at**: Новое время публикации (опционально)
+    - **If-Match**: ETag поста из предыдущего ответа (опционально)
     
-    Возвращает обновленный пост.
+    Возвращает обновленный пост с новым ETag. Если пост изменился после
+    получения ETag, возвращает 412 и ETag текущей версии.
     """
     try:
-        post = update_post(post_id, request.auth, data.title, data.content)
+        post = update_post(post_id, request.auth, data.title, data.content, version=if_match_version(request),
+                           publish_at=data.publish_at)
+        response['ETag'] = etag(post['version'])
         return 200, post
     except Post.DoesNotExist:
         return 404, {"message": "Пост не найден"}
+    except PostVersionConflict as e:
+        response['ETag'] = etag(e.current_version)
+        return 412, {"message": str(e)}
     except Exception as e:
         return 400, {"message": str(e)}
 
-@router.delete("/posts/{post_id}", response={204: None, 400: ErrorSchema, 404: ErrorSchema}, summary="Удаление поста")
-def delete_existing_post(request, post_id: int):
+@router.delete("/posts/{post_id}", response={204: None, 400: ErrorSchema, 404: ErrorSchema, 412: ErrorSchema}, summary="Удаление поста")
+def delete_existing_post(request, response: HttpResponse, post_id: int):
     """
     Удаление поста.
     
@@ -154,14 +263,129 @@ def delete_existing_post(request, post_id: int):
     Только автор может удалять свой пост.
     
     - **post_id**: ID поста
+    - **If-Match**: ETag поста (опционально)
     
-    Возвращает 204 при успешном удалении.
+    Возвращает 204 при успешном удалении, 412 и ETag текущей версии - если
+    пост изменился после получения ETag.
     """
     try:
-        delete_post(post_id, request.auth)
+        delete_post(post_id, request.auth, version=if_match_version(request))
         return 204, None
     except Post.DoesNotExist:
         return 404, {"message": "Пост не найден"}
+    except PostVersionConflict as e:
+        response['ETag'] = etag(e.current_version)
+        return 412, {"message": str(e)}
+    except Exception as e:
+        return 400, {"message": str(e)}
+
+
+@router.get("/posts/{post_id}/revisions", response={200: RevisionListSchema, 404: ErrorSchema}, auth=None, summary="История правок поста")
+def list_post_revisions(request, post_id: int):
+    """
+    Предыдущие редакции поста от новых к старым.
+
+    - **post_id**: ID поста
+
+    Returns:
+    - **version**: Текущая версия поста
+    - **revisions**: Редакции (version, title, replaced_at - когда редакция была заменена)
+    """
+    try:
+        version, revisions = get_post_revisions(post_id)
+    except Post.DoesNotExist:
+        return 404, {"message": "Пост не найден"}
+    return {
+        "version": version,
+        "revisions": [
+            {
+                "version": revision['version'],
+                "title": revision['title'],
+                "replaced_at": revision['replaced_at'].strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            for revision in revisions
+        ],
+    }
+
+@router.get("/posts/{post_id}/revisions/{version}", response={200: RevisionDetailSchema, 404: ErrorSchema}, auth=None, summary="Редакция поста")
+def get_post_revision_by_version(request, post_id: int, version: int):
+    """
+    Заголовок и текст поста в редакции version (текущая версия - текущий пост).
+
+    - **post_id**: ID поста
+    - **version**: Версия из истории правок
+    """
+    try:
+        revision = get_post_revision(post_id, version)
+    except Post.DoesNotExist:
+        return 404, {"message": "Пост не найден"}
+    except PostRevision.DoesNotExist:
+        return 404, {"message": "Редакция не найдена"}
+    return {"post_id": post_id, **revision}
+
+@router.post("/posts/{post_id}/attachments", response={201: AttachmentSchema, 400: ErrorSchema, 404: ErrorSchema}, summary="Добавление вложения")
+def upload_attachment(request, post_id: int, file: UploadedFile = File(...), kind: str = Form(Attachment.PHOTO),
+                      caption: str = Form("")):
+    """
+    Добавление вложения к посту (multipart/form-data).
+
+    Требуется аутентификация.
+    Только автор может добавлять вложения к своему посту.
+
+    - **file**: Файл
+    - **kind**: Тип вложения: photo или document
+    - **caption**: Подпись (опционально)
+    """
+    try:
+        attachment = add_attachment(post_id, request.auth, file, kind, caption)
+        return 201, attachment_to_dict(request, attachment)
+    except Post.DoesNotExist:
+        return 404, {"message": "Пост не найден"}
+    except Exception as e:
+        return 400, {"message": str(e)}
+
+@router.delete("/posts/{post_id}/attachments/{attachment_id}", response={204: None, 400: ErrorSchema, 404: ErrorSchema}, summary="Удаление вложения")
+def delete_existing_attachment(request, post_id: int, attachment_id: int):
+    """
+    Удаление вложения поста.
+
+    Требуется аутентификация.
+    Только автор может удалять вложения своего поста.
+    """
+    try:
+        delete_attachment(post_id, attachment_id, request.auth)
+        return 204, None
+    except Attachment.DoesNotExist:
+        return 404, {"message": "Вложение не найдено"}
     except Exception as e:
         return 400, {"message": str(e)}
 
+
+@router.post("/telegram/webhook", response={200: None, 400: ErrorSchema, 403: ErrorSchema}, auth=None, include_in_schema=False)
+def telegram_webhook(request):
+    """
+    Прием обновлений Telegram в очередь бота.
+
+    Используется при запуске `runbot --workers N --receiver webhook`.
+    Запрос должен содержать заголовок X-Telegram-Bot-Api-Secret-Token
+    со значением TELEGRAM_WEBHOOK_SECRET.
+    """
+    secret = settings.TELEGRAM_WEBHOOK_SECRET
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    # Заголовок может содержать не-ASCII символы, а compare_digest сравнивает
+    # такие строки только в байтах
+    if not secret or not hmac.compare_digest(token.encode(), secret.encode()):
+        return 403, {"message": "Доступ запрещен"}
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return 400, {"message": "Некорректный JSON"}
+    if not isinstance(payload, dict) or not isinstance(payload.get('update_id'), int):
+        return 400, {"message": "Ожидается обновление Telegram с update_id"}
+    try:
+        enqueue_updates([payload])
+    except ValueError as e:
+        # Такое обновление не разобрал бы и воркер, а необработанное оно
+        # остановило бы свою партицию
+        return 400, {"message": f"Некорректное обновление Telegram: {e}"}
+    return 200, None
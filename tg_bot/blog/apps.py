@@ -5,3 +5,8 @@ class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
     verbose_name = 'Блог'
+
+    def ready(self):
+        # Журнал медленных запросов нужен и API, и боту: оба загружают это приложение
+        from tg_bot import slowlog
+        slowlog.install()
@@ -0,0 +1,72 @@
+"""
+Перенос старых постов в архив (ArchivedPost, ArchivedAttachment).
+
+Посты переносятся пакетами, каждый пакет - отдельная транзакция: строки
+поста и его вложений копируются в архивные таблицы с теми же id и
+удаляются из рабочих. Блокировки держатся только на время пакета, а
+прерванный перенос продолжается следующим запуском с того же места.
+
+Пост по ID (services.get_post_by_id и get_posts_by_ids: GET /posts/{id},
+бот) ищется в архиве, если его нет в Post, поэтому ссылки на старые посты
+продолжают работать. Списки, популярные посты и клавиатура бота читают только
+рабочую таблицу. Архивные посты только читаются: изменение и удаление
+через API отвечают 404. История правок (PostRevision) в архив не
+переносится и удаляется вместе с постом.
+
+Запуск: manage.py archive_posts --older-than 365
+"""
+
+from datetime import datetime
+from django.db import transaction
+from .models import ArchivedAttachment, ArchivedPost, Attachment, Post
+from .services import published_posts
+
+POST_FIELDS = ('id', 'title', 'content', 'created_at', 'author_id', 'views', 'version')
+ATTACHMENT_FIELDS = ('id', 'post_id', 'kind', 'file', 'caption', 'position', 'checksum', 'updated_at')
+
+
+def archive_candidates(cutoff: datetime):
+    """Опубликованные посты рабочей таблицы, созданные раньше cutoff"""
+    # В архиве нет отложенной публикации: посты, ожидающие ее, не переносятся
+    return published_posts().filter(created_at__lt=cutoff)
+
+
+def archive_batch(cutoff: datetime, batch_size: int) -> int:
+    """Перенос одного пакета постов в архив, возвращает количество перенесенных постов"""
+    with transaction.atomic():
+        posts = list(
+            archive_candidates(cutoff).select_for_update().order_by('id').values(*POST_FIELDS)[:batch_size]
+        )
+        if not posts:
+            return 0
+        ids = [post['id'] for post in posts]
+        attachments = list(Attachment.objects.filter(post_id__in=ids).values(*ATTACHMENT_FIELDS))
+
+        # Текст копируется в том виде, в каком хранится: сжатое значение
+        # (CompressedText) записывается без распаковки
+        ArchivedPost.objects.bulk_create([ArchivedPost(**post) for post in posts])
+        ArchivedAttachment.objects.bulk_create([ArchivedAttachment(**attachment) for attachment in attachments])
+
+        # Каскад Django выбирает посты и вложения только по ID и удаляет
+        # вложения, их file_id и историю правок
+        Post.objects.filter(id__in=ids).only('id').delete()
+    return len(ids)
+
+
+def archive_posts(cutoff: datetime, batch_size: int = 500) -> int:
+    """
+    Перенос в архив всех постов, созданных раньше cutoff.
+
+    Args:
+        cutoff (datetime): Граница даты создания
+        batch_size (int): Постов в одной транзакции
+
+    Returns:
+        int: Количество перенесенных постов
+    """
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
@@ -1,24 +1,91 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 from telegram.error import BadRequest
-import os
-from dotenv import load_dotenv
 from asgiref.sync import sync_to_async
-from .services import get_all_posts, get_post_by_id
+from django.conf import settings
+from tg_bot.metrics import BOT_UPDATE_QUEUE_SIZE, start_http_server, track_handler
+from .counters import POST_VIEWS
+from .loaders import PostLoader
+from .media import send_attachments, telegram_bot_id
+from .persistence import DjangoPersistence
+from .scheduler import PUBLICATIONS
+from .services import get_post_titles
+from .shutdown import install_stop_signals, stop_application
+from .transport import UploadTimeoutBot, build_requests
+from typing import List, NamedTuple, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BotConfig(NamedTuple):
+    name: str
+    token: str
+
+
+def bot_configs() -> List[BotConfig]:
+    """Боты процесса: TELEGRAM_BOTS или один бот main с TELEGRAM_BOT_TOKEN"""
+    configs = []
+    for item in settings.TELEGRAM_BOTS:
+        if len(item) != 2 or not all(item):
+            raise ValueError(f"Неверный элемент TELEGRAM_BOTS: {'='.join(item)!r}, ожидается имя=токен")
+        configs.append(BotConfig(*item))
+    if not configs and settings.TELEGRAM_BOT_TOKEN:
+        configs.append(BotConfig('main', settings.TELEGRAM_BOT_TOKEN))
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Имена ботов в TELEGRAM_BOTS повторяются: {', '.join(names)}")
+    return configs
 
-# Загружаем переменные окружения из .env файла
-load_dotenv()
 
 class TelegramBot:
     """Основной класс бота"""
     
-    def __init__(self):
-        """Инициализация бота"""
-        self.token = os.getenv('TELEGRAM_BOT_TOKEN')
+    def __init__(self, token=None, base_url=None, name=None):
+        """
+        Инициализация бота
+
+        Args:
+            token (str, optional): Токен бота, по умолчанию первый из bot_configs()
+            base_url (str, optional): Адрес Bot API, по умолчанию TELEGRAM_API_BASE_URL
+                или api.telegram.org
+            name (str, optional): Имя бота для метрик и логов
+        """
+        # Переменные окружения из .env уже загружены в settings
+        if token is None:
+            configs = bot_configs()
+            if configs:
+                name, token = name or configs[0].name, configs[0].token
+        self.token = token
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
-        
-        self.application = Application.builder().token(self.token).build()
+        self.name = name or 'main'
+        self.bot_id = telegram_bot_id(self.token)
+
+        # У каждого бота свои пулы, поэтому медленные ответы одному боту не
+        # занимают соединения других
+        request, updates_request = build_requests(self.name)
+        bot_kwargs = {}
+        base_url = base_url or settings.TELEGRAM_API_BASE_URL
+        if base_url:
+            bot_kwargs['base_url'] = base_url
+        bot = UploadTimeoutBot(self.token, request=request, get_updates_request=updates_request, **bot_kwargs)
+        builder = (
+            Application.builder()
+            .bot(bot)
+            .concurrent_updates(max(settings.BOT_CONCURRENT_UPDATES, 1))
+        )
+        if settings.BOT_PERSISTENCE:
+            builder = builder.persistence(DjangoPersistence(self.bot_id))
+        self.application = builder.build()
+        # Одновременные открытия постов загружаются одним запросом; при обработке
+        # обновлений по очереди объединять нечего, и окно только задерживало бы ответ
+        self.posts = PostLoader(
+            bot_id=self.bot_id, bot_name=self.name,
+            window=None if settings.BOT_CONCURRENT_UPDATES > 1 else 0,
+        )
+        BOT_UPDATE_QUEUE_SIZE.set_function(self.application.update_queue.qsize, self.name)
         self._setup_handlers()
 
     def _setup_handlers(self):
@@ -31,6 +98,7 @@ class TelegramBot:
         # Регистрируем обработчик callback-запросов
         self.application.add_handler(CallbackQueryHandler(self._handle_callback))
 
+    @track_handler
     async def _handle_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         welcome_text = (
@@ -41,9 +109,10 @@ class TelegramBot:
         )
         await update.message.reply_text(welcome_text)
 
+    @track_handler
     async def _handle_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE, is_callback: bool = False):
         """Обработчик команды /posts"""
-        posts = await sync_to_async(get_all_posts)()
+        posts = await sync_to_async(get_post_titles)()
         if not posts:
             message = "😔 Пока нет доступных постов."
             if is_callback:
@@ -86,6 +155,7 @@ class TelegramBot:
             if "Message is not modified" not in str(e):
                 raise
 
+    @track_handler
     async def _handle_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
         help_text = (
@@ -95,6 +165,7 @@ class TelegramBot:
         )
         await update.message.reply_text(help_text, parse_mode='HTML')
 
+    @track_handler
     async def _handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик нажатий на inline кнопки"""
         query = update.callback_query
@@ -106,18 +177,23 @@ class TelegramBot:
         
         if query.data.startswith("post_"):
             post_id = int(query.data.split('_')[1])
-            post = await sync_to_async(get_post_by_id)(post_id)
+            post = await self.posts.load(post_id)
             
             keyboard = [
                 [InlineKeyboardButton("🔙 Назад", callback_data="back_to_list")]
             ]
             
-            message = (
-                f"📝 <b>{post.title}</b>\n\n"
-                f"{post.content}\n\n"
-                f"👤 Автор: {post.author.username}\n"
-                f"📅 Создан: {post.created_at.strftime('%d.%m.%Y %H:%M')}"
-            )
+            if post is None:
+                # Пост удален или снят с публикации после отправки списка
+                message = "😔 Пост не найден. Обновите список постов."
+            else:
+                POST_VIEWS.add_post(post)
+                message = (
+                    f"📝 <b>{post.title}</b>\n\n"
+                    f"{post.content}\n\n"
+                    f"👤 Автор: {post.author.username}\n"
+                    f"📅 Создан: {post.created_at.strftime('%d.%m.%Y %H:%M')}"
+                )
             
             try:
                 await query.edit_message_text(
@@ -128,13 +204,151 @@ class TelegramBot:
             except BadRequest as e:
                 if "Message is not modified" not in str(e):
                     raise
+                # Пост уже открыт, вложения повторно не отправляем
+                return
+
+            if post is None:
+                return
+            # Вложения с file_id этого бота уже загружены вместе с постом (prefetch_related)
+            attachments = list(post.attachments.all())
+            if attachments:
+                await send_attachments(context.bot, query.message.chat_id, attachments)
+
+    async def serve(self, stopping: asyncio.Event = None):
+        """
+        Long polling до сигнала остановки с плавным завершением
+
+        Args:
+            stopping (asyncio.Event, optional): Событие остановки, по умолчанию
+                устанавливается по SIGINT / SIGTERM
+        """
+        await BotGroup([self]).serve(stopping)
+
+    async def start(self):
+        """Инициализация и запуск long polling в текущем цикле событий"""
+        await self.application.initialize()
+        try:
+            await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await self.application.start()
+        except BaseException:
+            if self.application.updater.running:
+                await self.application.updater.stop()
+            await self.application.shutdown()
+            raise
+
+    async def stop(self):
+        """Плавная остановка бота, запущенного start()"""
+        try:
+            await stop_application(self.application, settings.BOT_SHUTDOWN_TIMEOUT)
+        finally:
+            await self.application.shutdown()
+            BOT_UPDATE_QUEUE_SIZE.set_function(None, self.name)
 
     def run(self):
         """Запуск бота"""
-        print("🤖 Бот запущен...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        BotGroup([self]).run()
+
+
+class BotGroup:
+    """
+    Несколько ботов в одном цикле событий.
+
+    Боты используют общие обработчики, соединения с базой и кеши процесса,
+    но у каждого свое Application: своя очередь обновлений, свои пулы
+    соединений и свой long polling. Поэтому бот, которому Telegram
+    ограничил частоту запросов или который медленно отвечает, не
+    задерживает обработку обновлений остальных.
+    """
+
+    def __init__(self, bots: List[TelegramBot]):
+        self.bots = bots
+        self.running: List[TelegramBot] = []
+
+    @classmethod
+    def from_settings(cls, base_url: Optional[str] = None) -> 'BotGroup':
+        """Боты из TELEGRAM_BOTS (или TELEGRAM_BOT_TOKEN)"""
+        configs = bot_configs()
+        if not configs:
+            raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
+        return cls([TelegramBot(token=config.token, base_url=base_url, name=config.name) for config in configs])
+
+    async def start(self):
+        """
+        Запуск всех ботов.
+
+        Бот, который не удалось запустить (например, с отозванным токеном),
+        пропускается; ошибка возникает, только если не запустился ни один.
+        """
+        results = await asyncio.gather(*(bot.start() for bot in self.bots), return_exceptions=True)
+        errors = []
+        for bot, result in zip(self.bots, results):
+            if isinstance(result, BaseException):
+                logger.error('Бот %s не запущен: %r', bot.name, result)
+                errors.append(result)
+            else:
+                self.running.append(bot)
+        if not self.running:
+            raise errors[0]
+
+    async def stop(self):
+        """Одновременная плавная остановка: у каждого бота свои BOT_SHUTDOWN_TIMEOUT секунд"""
+        running, self.running = self.running, []
+        results = await asyncio.gather(*(bot.stop() for bot in running), return_exceptions=True)
+        for bot, result in zip(running, results):
+            if isinstance(result, Exception):
+                logger.error('Ошибка остановки бота %s: %r', bot.name, result)
+
+    async def serve(self, stopping: asyncio.Event = None):
+        """
+        Long polling всех ботов до сигнала остановки
+
+        Args:
+            stopping (asyncio.Event, optional): Событие остановки, по умолчанию
+                устанавливается по SIGINT / SIGTERM
+        """
+        if stopping is None:
+            stopping = asyncio.Event()
+            install_stop_signals(stopping)
+        await self.start()
+        if len(self.bots) == 1:
+            print("🤖 Бот запущен...")
+        else:
+            print(f"🤖 Запущено ботов: {len(self.running)} из {len(self.bots)} "
+                  f"({', '.join(bot.name for bot in self.running)})")
+        try:
+            await stopping.wait()
+        finally:
+            await self.stop()
+
+    def run(self):
+        """Запуск ботов"""
+        if settings.BOT_METRICS_PORT:
+            start_http_server(settings.BOT_METRICS_PORT)
+        POST_VIEWS.start()
+        PUBLICATIONS.start()
+        try:
+            asyncio.run(self.serve())
+        finally:
+            PUBLICATIONS.stop()
+            POST_VIEWS.stop()
+
+def run_bot(profile=None, dry_run=False):
+    """
+    Функция для запуска ботов из TELEGRAM_BOTS (или TELEGRAM_BOT_TOKEN)
 
-def run_bot():
-    """Функция для запуска бота"""
-    bot = TelegramBot()
-    bot.run() 
\ No newline at end of file
+    Args:
+        profile (StartupProfile, optional): Замер этапов запуска для отчета
+        dry_run (bool): Только инициализировать ботов, без запуска polling
+    """
+    if profile is None:
+        group = BotGroup.from_settings()
+    else:
+        with profile.phase('BotGroup.from_settings()'):
+            group = BotGroup.from_settings()
+        for line in profile.lines():
+            print(line)
+        target = settings.BOT_STARTUP_TARGET_SECONDS
+        if target and profile.total > target:
+            print(f"⚠️ Запуск занял {profile.total:.2f} с при целевом времени {target:.2f} с")
+    if not dry_run:
+        group.run()
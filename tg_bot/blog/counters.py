@@ -0,0 +1,131 @@
+"""
+Счетчик просмотров постов с отложенной пакетной записью.
+
+Просмотр (открытие поста в боте или GET /posts/{id}) только увеличивает
+счетчик в памяти процесса. Фоновый поток раз в POST_VIEWS_FLUSH_INTERVAL
+секунд записывает накопленные приращения одним запросом
+UPDATE ... SET views = views + CASE id WHEN ... END WHERE id IN (...),
+поэтому на запрос не приходится ни одной записи в базу, а SQLite получает
+одну транзакцию за интервал вместо UPDATE на каждый просмотр.
+
+Поток запускается процессами, которые обслуживают просмотры (WSGI/ASGI,
+бот), остаток буфера записывается при остановке процесса. Приращения
+складываются, поэтому несколько процессов со своими буферами не мешают
+друг другу; просмотры, не записанные из-за падения процесса, теряются.
+"""
+
+from collections import Counter
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import Case, F, Value, When
+from typing import Optional
+from .models import ArchivedPost, Post
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Постов в одном UPDATE: на пост приходится три параметра запроса
+FLUSH_BATCH_SIZE = 300
+
+
+def apply_view_counts(counts, model=Post) -> int:
+    """Прибавление просмотров к постам (model - Post или ArchivedPost), возвращает количество обновленных постов"""
+    items = list(counts.items())
+    updated = 0
+    for start in range(0, len(items), FLUSH_BATCH_SIZE):
+        batch = items[start:start + FLUSH_BATCH_SIZE]
+        increment = Case(*[When(id=post_id, then=Value(count)) for post_id, count in batch], default=Value(0))
+        updated += model.objects.filter(id__in=[post_id for post_id, _ in batch]).update(
+            views=F('views') + increment
+        )
+    return updated
+
+
+class ViewCounter:
+    """
+    Буфер просмотров процесса.
+
+    Просмотры архивных постов (blog.archive) копятся отдельно и
+    записываются в архивную таблицу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._archived = Counter()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, post_id: int, count: int = 1, archived: bool = False) -> None:
+        """Учет просмотра поста (без обращения к базе)"""
+        with self._lock:
+            (self._archived if archived else self._counts)[post_id] += count
+
+    def add_post(self, post) -> None:
+        """Учет просмотра поста, полученного services.get_post_by_id или get_posts_by_ids"""
+        self.add(post.id, archived=isinstance(post, ArchivedPost))
+
+    def pending(self) -> int:
+        """Количество просмотров, еще не записанных в базу"""
+        with self._lock:
+            return sum(self._counts.values()) + sum(self._archived.values())
+
+    def flush(self) -> int:
+        """
+        Запись накопленных просмотров в базу.
+
+        При ошибке базы приращения возвращаются в буфер и будут записаны
+        следующей попыткой.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            archived, self._archived = self._archived, Counter()
+        updated = 0
+        for model, pending, buffer in ((Post, counts, self._counts), (ArchivedPost, archived, self._archived)):
+            if not pending:
+                continue
+            try:
+                updated += apply_view_counts(pending, model)
+            except DatabaseError:
+                logger.exception('Не удалось записать просмотры %s постов', len(pending))
+                with self._lock:
+                    buffer.update(pending)
+        return updated
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._archived.clear()
+
+    def _loop(self, interval: float) -> None:
+        try:
+            while not self._stopping.wait(interval):
+                close_old_connections()
+                self.flush()
+        finally:
+            connection.close()
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Запуск фоновой записи; остаток буфера записывается при выходе из процесса"""
+        # Поток, унаследованный при fork, в дочернем процессе не работает
+        if self._thread is not None and self._thread.is_alive():
+            return
+        interval = interval if interval is not None else settings.POST_VIEWS_FLUSH_INTERVAL
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name='post-views-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Остановка фоновой записи и запись остатка буфера"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+            atexit.unregister(self.stop)
+        self.flush()
+
+
+POST_VIEWS = ViewCounter()
@@ -0,0 +1,185 @@
+"""
+Локальная замена Telegram Bot API для нагрузочного тестирования бота.
+
+Сервер реализует методы, которые использует бот (getMe, getUpdates,
+sendMessage, editMessageText, answerCallbackQuery, deleteWebhook), хранит
+очередь обновлений в памяти и позволяет добавлять задержку ответа и
+доли ответов 429 Too Many Requests.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import itertools
+import json
+import random
+import threading
+import time
+
+BOT_USER = {
+    'id': 100000001,
+    'is_bot': True,
+    'first_name': 'LoadTest',
+    'username': 'loadtest_bot',
+}
+
+# Методы, для которых добавляются задержка и ошибки 429
+OUTGOING_METHODS = ('sendMessage', 'editMessageText', 'answerCallbackQuery')
+
+# Максимальное время ожидания long polling, чтобы остановка сервера не зависала
+MAX_POLL_TIMEOUT = 5.0
+
+
+class FakeTelegramServer:
+    """HTTP-сервер, эмулирующий Telegram Bot API"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.listeners = []
+        self.stats = {}
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._random = random.Random()
+        self._server = None
+        self._running = False
+
+    @property
+    def base_url(self):
+        """Значение для ApplicationBuilder.base_url()"""
+        return f'http://{self.host}:{self.port}/bot'
+
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        self._server = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._running = True
+        threading.Thread(target=self._server.serve_forever, name='fake-telegram', daemon=True).start()
+        return self
+
+    def stop(self):
+        # Сначала будим ожидающие getUpdates, иначе shutdown ждет их таймаута
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def next_message_id(self):
+        return next(self._message_ids)
+
+    def push_update(self, update):
+        """Добавление обновления в очередь getUpdates"""
+        with self._condition:
+            update = dict(update, update_id=next(self._update_ids))
+            self._updates.append(update)
+            self._condition.notify_all()
+        return update['update_id']
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _notify(self, method, params, ok):
+        for listener in self.listeners:
+            listener(method, params, ok)
+
+    def handle(self, method, params):
+        """Обработка вызова метода API, возвращает (HTTP-статус, тело ответа)"""
+        self._count(method)
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self._get_updates(params)}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+
+        if method in OUTGOING_METHODS:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            if delay:
+                time.sleep(delay)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self._count(f'{method}:429')
+                self._notify(method, params, False)
+                return 429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }
+
+        if method == 'sendMessage':
+            result = self._message(params, next(self._message_ids))
+        elif method == 'editMessageText':
+            result = self._message(params, int(params.get('message_id', 0)))
+        else:
+            # answerCallbackQuery, deleteWebhook и прочие служебные методы
+            result = True
+        self._notify(method, params, True)
+        return 200, {'ok': True, 'result': result}
+
+    def _message(self, params, message_id):
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params['chat_id']), 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = min(float(params.get('timeout') or 0), MAX_POLL_TIMEOUT)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            # Подтвержденные обновления (update_id < offset) удаляются из очереди
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._updates[:limit]
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Заголовки и тело пишутся отдельно; без TCP_NODELAY каждый ответ
+        # ждет delayed ACK клиента (~40 мс)
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            # Путь имеет вид /bot<token>/<method>
+            path, _, query = self.path.partition('?')
+            method = path.rstrip('/').rsplit('/', 1)[-1]
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8') if length else ''
+            params = {key: values[-1] for key, values in parse_qs(query).items()}
+            params.update({key: values[-1] for key, values in parse_qs(body).items()})
+            status, payload = server.handle(method, params)
+            data = json.dumps(payload).encode('utf-8')
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент закрыл соединение при остановке бота
+                self.close_connection = True
+
+        do_GET = do_POST
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
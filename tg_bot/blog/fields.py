@@ -0,0 +1,129 @@
+"""
+Текстовое поле с прозрачным сжатием длинных значений.
+
+Значение хранится в двоичной колонке с байтом-заголовком: короткий текст -
+как есть в UTF-8, текст длиннее порога - сжатым zlib, если это уменьшает
+размер. Из базы сжатое значение приходит как CompressedText и
+распаковывается при первом обращении к атрибуту модели, поэтому запросы,
+которые не читают текст, не тратят время на распаковку. Неизмененный текст
+при save() записывается обратно без распаковки и повторного сжатия.
+
+values() / values_list() возвращают для сжатых строк CompressedText,
+текст из него дает str().
+"""
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+import zlib
+
+PLAIN = b'\x00'
+ZLIB = b'\x01'
+
+
+class CompressedText:
+    """Сжатое значение из базы"""
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def decompress(self) -> str:
+        return zlib.decompress(self.data[1:]).decode('utf-8')
+
+    def __str__(self):
+        return self.decompress()
+
+    def __repr__(self):
+        return f'<CompressedText: {len(self.data)} bytes>'
+
+
+def encode_text(text: str, threshold: int) -> bytes:
+    data = text.encode('utf-8')
+    if len(data) >= threshold:
+        compressed = zlib.compress(data, settings.COMPRESSED_TEXT_LEVEL)
+        if len(compressed) < len(data):
+            return ZLIB + compressed
+    return PLAIN + data
+
+
+def decode_text(value):
+    """Значение из базы: str для несжатого текста, CompressedText для сжатого"""
+    if value is None or isinstance(value, str):
+        # str - строка, еще не сконвертированная миграцией
+        return value
+    value = bytes(value)
+    if value[:1] == ZLIB:
+        return CompressedText(value)
+    return value[1:].decode('utf-8')
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """
+    Распаковка значения при первом обращении к атрибуту.
+
+    В отличие от DeferredAttribute это data descriptor (есть __set__),
+    иначе значение из __dict__ экземпляра возвращалось бы в обход __get__.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedText):
+            value = value.decompress()
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """TextField, хранящий длинные значения сжатыми"""
+    descriptor_class = CompressedTextDescriptor
+
+    def __init__(self, *args, threshold=None, **kwargs):
+        """
+        Args:
+            threshold (int, optional): Минимальный размер текста в байтах для сжатия,
+                по умолчанию COMPRESSED_TEXT_THRESHOLD
+        """
+        self.threshold = threshold
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.threshold is not None:
+            kwargs['threshold'] = self.threshold
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        # Колонка двоичная: BLOB в SQLite, bytea в PostgreSQL
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        return decode_text(value)
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, CompressedText):
+            return value
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, CompressedText):
+            return value
+        return super().get_prep_value(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        if isinstance(value, CompressedText):
+            data = value.data
+        else:
+            threshold = self.threshold if self.threshold is not None else settings.COMPRESSED_TEXT_THRESHOLD
+            data = encode_text(value, threshold)
+        return connection.Database.Binary(data)
@@ -0,0 +1,90 @@
+"""
+Пакетная загрузка постов для обработчиков бота (по образцу DataLoader).
+
+Когда несколько пользователей одновременно открывают посты, каждый
+обработчик вызывает PostLoader.load(post_id), а не get_post_by_id.
+Запросы, пришедшие в течение окна BOT_POST_BATCH_WINDOW, объединяются в
+один запрос services.get_posts_by_ids с одним переходом в поток
+sync_to_async. Результат раздается всем ожидающим; одинаковые ID
+загружаются один раз. Отсутствующий пост - None, а не исключение.
+
+Обработчики бота выполняются одновременно только при
+BOT_CONCURRENT_UPDATES больше 1. При обработке по очереди (по умолчанию)
+в пакете всегда один пост, поэтому бот создает загрузчик без окна, и
+открытие поста не ждет.
+
+Загрузчик не кеширует посты между пакетами: каждый пакет читает
+актуальные данные.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from tg_bot.metrics import BOT_POST_BATCH_SIZE
+from typing import Dict, List, Optional
+from .services import get_posts_by_ids
+import asyncio
+
+
+class PostLoader:
+    """Объединение загрузок постов по ID в пакеты в цикле событий бота"""
+
+    def __init__(self, bot_id: Optional[int] = None, bot_name: str = '', window: Optional[float] = None,
+                 max_batch: Optional[int] = None):
+        """
+        Args:
+            bot_id (int, optional): ID бота, file_id вложений которого загружаются вместе с постами
+            bot_name (str): Имя бота для метки bot в метриках
+            window (float, optional): Окно объединения, секунды, по умолчанию BOT_POST_BATCH_WINDOW
+            max_batch (int, optional): Максимум ID в пакете, по умолчанию BOT_POST_BATCH_MAX
+        """
+        self.bot_id = bot_id
+        self.bot_name = bot_name
+        self.window = window if window is not None else settings.BOT_POST_BATCH_WINDOW
+        self.max_batch = max_batch or settings.BOT_POST_BATCH_MAX
+        self._pending: Dict[int, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._fetches = set()
+
+    async def load(self, post_id: int):
+        """
+        Опубликованный или архивный пост по ID, None - поста нет.
+
+        Raises:
+            Exception: Ошибка запроса пакета передается всем его ожидающим
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(post_id, []).append(future)
+        if len(self._pending) >= self.max_batch or self.window <= 0:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._dispatch)
+        return await future
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            fetch = asyncio.ensure_future(self._fetch(pending))
+            # Ссылка на задачу нужна, иначе ее может собрать сборщик мусора
+            self._fetches.add(fetch)
+            fetch.add_done_callback(self._fetches.discard)
+
+    async def _fetch(self, pending: Dict[int, List[asyncio.Future]]) -> None:
+        BOT_POST_BATCH_SIZE.observe(len(pending), self.bot_name)
+        try:
+            posts = await sync_to_async(get_posts_by_ids)(list(pending), bot_id=self.bot_id)
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for post_id, futures in pending.items():
+            post = posts.get(post_id)
+            for future in futures:
+                # Ожидающий мог быть отменен (остановка бота)
+                if not future.done():
+                    future.set_result(post)
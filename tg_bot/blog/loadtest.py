@@ -0,0 +1,187 @@
+"""
+Генератор нагрузки для бота поверх FakeTelegramServer.
+
+Драйвер отправляет синтетические команды /posts и нажатия кнопок post_<id>
+от заданного числа чатов с заданной частотой и измеряет время от
+появления обновления в getUpdates до ответа бота.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+import itertools
+import random
+import threading
+import time
+
+CLIENT_USER_ID_BASE = 200000000
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(percent / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+@dataclass
+class LoadTestReport:
+    """Результаты прогона"""
+    sent: int = 0
+    completed: int = 0
+    rate_limited: int = 0
+    timed_out: int = 0
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    server_stats: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        return self.completed / self.duration if self.duration else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return (self.rate_limited + self.timed_out) / self.sent if self.sent else 0.0
+
+    def lines(self) -> List[str]:
+        ms = [latency * 1000 for latency in self.latencies]
+        return [
+            f'Отправлено обновлений: {self.sent}',
+            f'Обработано: {self.completed} ({self.throughput:.1f} в секунду)',
+            f'Ошибки 429: {self.rate_limited}, без ответа: {self.timed_out} (доля ошибок {self.error_rate:.2%})',
+            f'Латентность p50/p95/p99: {percentile(ms, 50):.1f} / {percentile(ms, 95):.1f} / {percentile(ms, 99):.1f} мс',
+            'Вызовы API: ' + ', '.join(f'{key}={value}' for key, value in sorted(self.server_stats.items())),
+        ]
+
+
+class LoadDriver:
+    """
+    Источник синтетического трафика.
+
+    Ответ на /posts сопоставляется по чату (бот обрабатывает обновления
+    чата по порядку), ответ на нажатие кнопки - по идентификатору
+    редактируемого сообщения.
+    """
+
+    def __init__(self, server, post_ids, chats=10, rate=50.0, duration=10.0, callback_ratio=0.7,
+                 response_timeout=10.0, seed=None):
+        if not post_ids:
+            raise ValueError('Нет постов для нажатий post_<id>')
+        self.server = server
+        self.post_ids = list(post_ids)
+        self.chats = [CLIENT_USER_ID_BASE + index for index in range(chats)]
+        self.rate = rate
+        self.duration = duration
+        self.callback_ratio = callback_ratio
+        self.response_timeout = response_timeout
+        self.report = LoadTestReport()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._pending_commands: Dict[int, List[float]] = {}
+        self._pending_callbacks: Dict[str, float] = {}
+        self._callbacks_by_message: Dict[int, str] = {}
+        self._callback_ids = itertools.count(1)
+
+    def _user(self, chat_id):
+        return {'id': chat_id, 'is_bot': False, 'first_name': f'User {chat_id}'}
+
+    def _command_update(self, chat_id):
+        return {
+            'message': {
+                'message_id': self.server.next_message_id(),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': self._user(chat_id),
+                'text': '/posts',
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            }
+        }
+
+    def _callback_update(self, chat_id, callback_id, message_id):
+        return {
+            'callback_query': {
+                'id': callback_id,
+                'from': self._user(chat_id),
+                'chat_instance': str(chat_id),
+                'data': f'post_{self._random.choice(self.post_ids)}',
+                'message': {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'Bot'},
+                    'text': '📚 Выберите пост для просмотра:',
+                },
+            }
+        }
+
+    def _send(self, chat_id):
+        now = time.perf_counter()
+        with self._lock:
+            self.report.sent += 1
+            if self._random.random() < self.callback_ratio:
+                callback_id = str(next(self._callback_ids))
+                message_id = self.server.next_message_id()
+                self._pending_callbacks[callback_id] = now
+                self._callbacks_by_message[message_id] = callback_id
+                update = self._callback_update(chat_id, callback_id, message_id)
+            else:
+                self._pending_commands.setdefault(chat_id, []).append(now)
+                update = self._command_update(chat_id)
+        self.server.push_update(update)
+
+    def _complete(self, started, ok):
+        if ok:
+            self.report.completed += 1
+            self.report.latencies.append(time.perf_counter() - started)
+        else:
+            self.report.rate_limited += 1
+        self._done.notify_all()
+
+    def on_api_call(self, method, params, ok):
+        """Слушатель вызовов FakeTelegramServer"""
+        with self._lock:
+            if method == 'sendMessage':
+                pending = self._pending_commands.get(int(params['chat_id']))
+                if pending:
+                    self._complete(pending.pop(0), ok)
+            elif method == 'editMessageText':
+                callback_id = self._callbacks_by_message.pop(int(params.get('message_id', 0)), None)
+                started = self._pending_callbacks.pop(callback_id, None)
+                if started is not None:
+                    self._complete(started, ok)
+            elif method == 'answerCallbackQuery' and not ok:
+                # Обработчик падает на query.answer(), редактирования не будет
+                started = self._pending_callbacks.pop(params.get('callback_query_id'), None)
+                if started is not None:
+                    self._complete(started, ok)
+
+    def _pending_count(self):
+        return sum(len(pending) for pending in self._pending_commands.values()) + len(self._pending_callbacks)
+
+    def run(self) -> LoadTestReport:
+        """Отправка нагрузки и ожидание ответов, блокирует поток"""
+        self.server.listeners.append(self.on_api_call)
+        try:
+            total = int(self.rate * self.duration)
+            started = time.perf_counter()
+            for index in range(total):
+                # Равномерный темп: ждем до запланированного момента отправки
+                delay = started + index / self.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self._send(self.chats[index % len(self.chats)])
+
+            deadline = time.perf_counter() + self.response_timeout
+            with self._done:
+                while self._pending_count():
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._done.wait(remaining)
+                self.report.timed_out = self._pending_count()
+            self.report.duration = time.perf_counter() - started
+            self.report.server_stats = dict(self.server.stats)
+            return self.report
+        finally:
+            self.server.listeners.remove(self.on_api_call)
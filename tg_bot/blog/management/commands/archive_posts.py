@@ -0,0 +1,29 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from blog.archive import archive_candidates, archive_posts
+
+
+class Command(BaseCommand):
+    help = 'Перенос постов старше заданного возраста в архивную таблицу пакетными транзакциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, metavar='DAYS',
+                            help='Переносить посты, созданные больше DAYS дней назад')
+        parser.add_argument('--batch-size', type=int, default=500, help='Постов в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать посты для переноса')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0:
+            raise CommandError('--older-than не может быть отрицательным')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+
+        if options['dry_run']:
+            count = archive_candidates(cutoff).count()
+            self.stdout.write(f'Постов для переноса в архив (созданы до {cutoff:%d.%m.%Y %H:%M}): {count}')
+            return
+
+        moved = archive_posts(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив постов: {moved}'))
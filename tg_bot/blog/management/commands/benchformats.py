@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from ninja.renderers import JSONRenderer
+from tg_bot.renderers import MessagePackRenderer
+from tg_bot.middleware import COMPRESSORS
+from datetime import datetime, timedelta
+import random
+import time
+
+WORDS = (
+    "блог пост бот телеграм сервер запрос ответ данные пользователь автор текст "
+    "заголовок список кнопка сообщение обновление производительность база индекс "
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor"
+)
+
+
+def build_posts_payload(count, content_length):
+    """Синтетический ответ list_posts заданного размера"""
+    created_at = datetime(2025, 1, 1)
+    words = WORDS.split()
+    rng = random.Random(count)
+
+    def make_content():
+        text = []
+        size = 0
+        while size < content_length:
+            word = rng.choice(words)
+            text.append(word)
+            size += len(word) + 1
+        return ' '.join(text)[:content_length]
+
+    return [
+        {
+            "id": index,
+            "title": f"Пост номер {index}",
+            "content": make_content(),
+            "author": f"author{index % 10}",
+            "created_at": (created_at + timedelta(minutes=index)).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        for index in range(1, count + 1)
+    ]
+
+
+def measure(func, repeat):
+    """Среднее процессорное время вызова в миллисекундах и результат"""
+    result = None
+    started = time.process_time()
+    for _ in range(repeat):
+        result = func()
+    return (time.process_time() - started) * 1000 / repeat, result
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер ответа и затраты CPU для форматов и кодировок API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, nargs='+', default=[10, 100, 1000],
+                            help='Количество постов в ответе')
+        parser.add_argument('--content-length', type=int, default=2000,
+                            help='Длина текста поста в символах')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Количество повторов каждого замера')
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/api/blog/posts')
+        renderers = {'json': JSONRenderer()}
+        if MessagePackRenderer.is_available():
+            renderers['msgpack'] = MessagePackRenderer()
+        else:
+            self.stdout.write(self.style.WARNING('msgpack не установлен, формат пропущен'))
+
+        self.stdout.write(
+            f"{'posts':>6} {'format':>8} {'encoding':>9} {'bytes':>10} {'ratio':>6} "
+            f"{'render ms':>10} {'compress ms':>12}"
+        )
+        for count in options['posts']:
+            payload = build_posts_payload(count, options['content_length'])
+            baseline = None
+            for format_name, renderer in renderers.items():
+                render_ms, body = measure(
+                    lambda: renderer.render(request, payload, response_status=200),
+                    options['repeat'],
+                )
+                if isinstance(body, str):
+                    body = body.encode(renderer.charset)
+                baseline = baseline or len(body)
+
+                rows = [('identity', len(body), 0.0)]
+                for encoding, compress in COMPRESSORS.items():
+                    compress_ms, compressed = measure(lambda: compress(body), options['repeat'])
+                    rows.append((encoding, len(compressed), compress_ms))
+
+                for encoding, size, compress_ms in rows:
+                    self.stdout.write(
+                        f"{count:>6} {format_name:>8} {encoding:>9} {size:>10} "
+                        f"{size / baseline:>6.2f} {render_ms:>10.3f} {compress_ms:>12.3f}"
+                    )
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from tg_bot.benchmarks import compare, load_baseline, run_benchmarks, save_baseline
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарки API и сервисов бота с бюджетами SQL-запросов и сравнением с базовой линией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, nargs='+', default=[1000],
+                            help='Объемы данных (количество постов), например 1000 100000')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Количество повторов каждого сценария')
+        parser.add_argument('--content-length', type=int, default=500,
+                            help='Длина текста поста в символах')
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmarks_baseline.json'),
+                            help='Путь к JSON-файлу базовой линии')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Допустимый рост медианы относительно базовой линии (доля)')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Минимальный абсолютный рост медианы, считающийся регрессией')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Записать результаты как новую базовую линию')
+
+    def handle(self, *args, **options):
+        baseline = load_baseline(options['baseline'])
+        failures = []
+
+        # Бенчмарки работают на отдельной тестовой базе, рабочие данные не затрагиваются
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for posts in options['posts']:
+                call_command('flush', interactive=False, verbosity=0)
+                results = run_benchmarks(posts, options['repeat'], options['content_length'])
+                volume = str(posts)
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f'Постов: {posts}'))
+                self.stdout.write(f"{'case':<22} {'median ms':>10} {'p95 ms':>10} {'queries':>8} {'budget':>7}")
+                for result in results:
+                    line = (
+                        f'{result.name:<22} {result.median_ms:>10.3f} {result.p95_ms:>10.3f} '
+                        f'{result.queries:>8} {result.query_budget:>7}'
+                    )
+                    self.stdout.write(self.style.ERROR(line) if result.errors else line)
+                    failures.extend(f'[{posts}] {result.name}: {error}' for error in result.errors)
+
+                regressions = compare(
+                    results, baseline.get(volume, {}), options['threshold'], options['min_delta_ms']
+                )
+                failures.extend(f'[{posts}] {regression}' for regression in regressions)
+
+                if options['update_baseline']:
+                    baseline[volume] = {result.name: result.as_dict() for result in results}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['update_baseline']:
+            save_baseline(options['baseline'], baseline)
+            self.stdout.write(self.style.SUCCESS(f"Базовая линия записана в {options['baseline']}"))
+            return
+
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(failure))
+            raise CommandError(f'Обнаружено регрессий: {len(failures)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from tg_bot.startup import TOTAL_LABEL
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROFILES = {
+    'full': (['manage.py', 'runbot', '--dry-run'], 'tg_bot.settings'),
+    'slim': (['runbot.py', '--dry-run'], 'tg_bot.settings_bot'),
+}
+
+
+def measure_startup(args, settings_module):
+    """Время от запуска интерпретатора до готовности бота, секунды"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    env.setdefault('TELEGRAM_BOT_TOKEN', '123456:STARTUP')
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable] + args, cwd=settings.BASE_DIR, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    ready = None
+    for line in process.stdout:
+        if line.startswith(TOTAL_LABEL):
+            # Завершение процесса (сборка мусора, закрытие клиентов) в замер не входит
+            ready = time.perf_counter() - started
+            break
+    process.stdout.close()
+    process.wait()
+    if ready is None:
+        raise CommandError(f"Бот не запустился: {' '.join(args)}")
+    return ready
+
+
+class Command(BaseCommand):
+    help = 'Измеряет время запуска процесса бота для полного и облегченного профиля настроек'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Количество запусков каждого профиля')
+        parser.add_argument('--check', action='store_true',
+                            help='Ошибка, если медиана облегченного профиля превышает BOT_STARTUP_TARGET_SECONDS')
+
+    def handle(self, *args, **options):
+        results = {}
+        self.stdout.write(f"{'profile':<8} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+        for name, (command, settings_module) in PROFILES.items():
+            timings = [measure_startup(command, settings_module) * 1000 for _ in range(options['repeat'])]
+            results[name] = statistics.median(timings)
+            self.stdout.write(
+                f'{name:<8} {results[name]:>10.1f} {min(timings):>8.1f} {max(timings):>8.1f}'
+            )
+
+        target = settings.BOT_STARTUP_TARGET_SECONDS * 1000
+        if options['check'] and target and results['slim'] > target:
+            raise CommandError(f"Запуск бота {results['slim']:.0f} мс при целевом времени {target:.0f} мс")
@@ -0,0 +1,69 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from blog.bot import TelegramBot
+from blog.fake_telegram import FakeTelegramServer
+from blog.loadtest import LoadDriver
+from blog.models import Post
+from tg_bot.benchmarks import seed
+import asyncio
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест бота в одном процессе с локальной заменой Telegram Bot API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100, help='Количество постов в тестовой базе')
+        parser.add_argument('--chats', type=int, default=10, help='Количество чатов')
+        parser.add_argument('--rate', type=float, default=50.0, help='Обновлений в секунду')
+        parser.add_argument('--duration', type=float, default=10.0, help='Длительность нагрузки, с')
+        parser.add_argument('--callback-ratio', type=float, default=0.7,
+                            help='Доля нажатий post_<id> среди обновлений')
+        parser.add_argument('--latency-ms', type=float, default=0.0,
+                            help='Задержка ответа на исходящие вызовы бота')
+        parser.add_argument('--jitter-ms', type=float, default=0.0,
+                            help='Случайная добавка к задержке')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Доля исходящих вызовов, получающих 429')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        server = FakeTelegramServer(
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+        ).start()
+        try:
+            call_command('flush', interactive=False, verbosity=0)
+            seed(options['posts'])
+            driver = LoadDriver(
+                server,
+                Post.objects.values_list('id', flat=True),
+                chats=options['chats'],
+                rate=options['rate'],
+                duration=options['duration'],
+                callback_ratio=options['callback_ratio'],
+            )
+            bot = TelegramBot(token='123456:LOADTEST', base_url=server.base_url)
+            report = asyncio.run(self._run(bot, driver))
+        finally:
+            server.stop()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for line in report.lines():
+            self.stdout.write(line)
+
+    async def _run(self, bot, driver):
+        application = bot.application
+        await application.initialize()
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=1)
+        try:
+            return await asyncio.to_thread(driver.run)
+        finally:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
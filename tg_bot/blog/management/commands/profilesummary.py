@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tg_bot.profiling import load_profiles, top_queries
+import io
+import pstats
+
+
+class Command(BaseCommand):
+    help = 'Сводка горячих функций и SQL-запросов по сохраненным профилям запросов API и обработчиков бота'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILE_DIR, help='Каталог профилей')
+        parser.add_argument('--kind', choices=['api', 'bot'], default='', help='Только профили API или бота')
+        parser.add_argument('--target', default='', help='Подстрока маршрута или имени обработчика')
+        parser.add_argument('--sort', choices=['cumulative', 'tottime'], default='cumulative',
+                            help='Сортировка функций: с вызываемыми (cumulative) или собственное время')
+        parser.add_argument('--limit', type=int, default=20, help='Количество строк в каждом разделе')
+
+    def handle(self, *args, **options):
+        profiles = load_profiles(options['dir'], options['kind'], options['target'])
+        if not profiles:
+            self.stdout.write(self.style.WARNING(f"Профили не найдены в {options['dir']}"))
+            return
+        limit = options['limit']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Профилей: {len(profiles)}'))
+        targets = {}
+        for _, meta in profiles:
+            targets.setdefault((meta['kind'], meta['target']), []).append(meta['duration_ms'])
+        self.stdout.write(f"{'kind':<5} {'target':<50} {'count':>6} {'avg ms':>10} {'max ms':>10}")
+        for (kind, target), durations in sorted(targets.items(), key=lambda item: -sum(item[1])):
+            self.stdout.write(
+                f'{kind:<5} {target[:50]:<50} {len(durations):>6} '
+                f'{sum(durations) / len(durations):>10.3f} {max(durations):>10.3f}'
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Горячие функции'))
+        stream = io.StringIO()
+        stats = pstats.Stats(*[str(path) for path, _ in profiles], stream=stream)
+        # Без списка файлов в заголовке: профилей может быть несколько сотен
+        stats.files = []
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(limit)
+        self.stdout.write(stream.getvalue())
+
+        self.stdout.write(self.style.MIGRATE_HEADING('SQL-запросы по суммарному времени'))
+        self.stdout.write(f"{'count':>6} {'total ms':>10}  sql")
+        for query in top_queries([meta for _, meta in profiles], limit):
+            self.stdout.write(f"{query['count']:>6} {query['total_ms']:>10.3f}  {query['sql'][:200]}")
@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from blog.revisions import prune_candidates, prune_revisions
+
+
+class Command(BaseCommand):
+    help = 'Удаление старых редакций из истории правок постов пакетными транзакциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, metavar='N', help='Оставить N последних редакций каждого поста')
+        parser.add_argument('--older-than', type=int, metavar='DAYS',
+                            help='Удалить редакции, замененные больше DAYS дней назад')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Редакций в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать редакции для удаления')
+
+    def handle(self, *args, **options):
+        keep, older_than = options['keep'], options['older_than']
+        if keep is None and older_than is None:
+            raise CommandError('Укажите --keep и/или --older-than')
+        if (keep is not None and keep < 0) or (older_than is not None and older_than < 0):
+            raise CommandError('--keep и --older-than не могут быть отрицательными')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        cutoff = timezone.now() - timedelta(days=older_than) if older_than is not None else None
+
+        if options['dry_run']:
+            count = prune_candidates(keep, cutoff).count()
+            self.stdout.write(f'Редакций для удаления: {count}')
+            return
+
+        deleted = prune_revisions(keep, cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено редакций: {deleted}'))
@@ -1,15 +1,41 @@
 from django.core.management.base import BaseCommand
-from blog.bot import run_bot
-import asyncio
+from tg_bot.startup import StartupProfile
 
 class Command(BaseCommand):
     help = 'Запускает Telegram бота'
+    # Системные проверки импортируют URLConf со всеми роутерами ninja,
+    # которые боту не нужны
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только инициализировать бота и вывести время запуска')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Количество процессов-воркеров, обрабатывающих очередь обновлений '
+                                 '(0 - обработка в текущем процессе)')
+        parser.add_argument('--receiver', choices=['polling', 'webhook'], default='polling',
+                            help='Источник обновлений для очереди при --workers')
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Запуск Telegram бота...'))
+        profile = StartupProfile()
         try:
-            run_bot()
+            if options['workers'] > 0:
+                from blog.bot import bot_configs
+                from blog.workers import run_scaled
+                if len(bot_configs()) > 1:
+                    # В очереди BotUpdate нет признака бота
+                    self.stdout.write(self.style.ERROR(
+                        'Очередь обновлений (--workers) обслуживает одного бота, в TELEGRAM_BOTS их несколько'
+                    ))
+                    return
+                self.stdout.write(f"Воркеров: {options['workers']}, приемник: {options['receiver']}")
+                run_scaled(options['workers'], options['receiver'])
+                return
+            with profile.phase('import blog.bot'):
+                from blog.bot import run_bot
+            run_bot(profile=profile, dry_run=options['dry_run'])
         except KeyboardInterrupt:
             self.stdout.write(self.style.WARNING('Бот остановлен'))
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Ошибка при запуске бота: {str(e)}')) 
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'Ошибка при запуске бота: {str(e)}'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from blog.fake_telegram import FakeTelegramServer
+from blog.loadtest import LoadDriver
+from blog.models import Post
+import time
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальную замену Telegram Bot API (и, при --rate, генератор нагрузки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--latency-ms', type=float, default=0.0,
+                            help='Задержка ответа на исходящие вызовы бота')
+        parser.add_argument('--jitter-ms', type=float, default=0.0,
+                            help='Случайная добавка к задержке')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Доля исходящих вызовов, получающих 429')
+        parser.add_argument('--chats', type=int, default=10, help='Количество чатов')
+        parser.add_argument('--rate', type=float, default=0.0,
+                            help='Обновлений в секунду (0 - только сервер, без нагрузки)')
+        parser.add_argument('--duration', type=float, default=30.0, help='Длительность нагрузки, с')
+        parser.add_argument('--warmup', type=float, default=5.0,
+                            help='Пауза перед нагрузкой, чтобы бот успел подключиться, с')
+
+    def handle(self, *args, **options):
+        server = FakeTelegramServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+        ).start()
+        self.stdout.write(self.style.SUCCESS(
+            f'Bot API доступен по адресу {server.base_url}, '
+            f'запустите бота с TELEGRAM_API_BASE_URL={server.base_url}'
+        ))
+        try:
+            if options['rate']:
+                time.sleep(options['warmup'])
+                driver = LoadDriver(
+                    server,
+                    Post.objects.values_list('id', flat=True)[:1000],
+                    chats=options['chats'],
+                    rate=options['rate'],
+                    duration=options['duration'],
+                )
+                for line in driver.run().lines():
+                    self.stdout.write(line)
+            else:
+                while True:
+                    time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tg_bot.slowlog import rank_shapes, read_entries
+
+
+class Command(BaseCommand):
+    help = 'Формы медленных SQL-запросов из журнала SLOW_QUERY_LOG_FILE по суммарному времени'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.SLOW_QUERY_LOG_FILE, help='Путь к журналу')
+        parser.add_argument('--source', default='', help='Подстрока маршрута, обработчика или задачи')
+        parser.add_argument('--limit', type=int, default=10, help='Количество форм запросов')
+        parser.add_argument('--explain', action='store_true', help='Вывести сохраненные планы выполнения')
+
+    def handle(self, *args, **options):
+        entries = read_entries(options['file'])
+        if options['source']:
+            entries = (entry for entry in entries if options['source'] in entry['source'])
+        shapes = rank_shapes(entries)
+        if not shapes:
+            self.stdout.write(self.style.WARNING(f"Медленных запросов нет в {options['file']}"))
+            return
+
+        self.stdout.write(f"{'shape':<16} {'count':>6} {'total ms':>11} {'avg ms':>9} {'max ms':>9}  sql")
+        for shape in shapes[:options['limit']]:
+            self.stdout.write(
+                f"{shape['shape']:<16} {shape['count']:>6} {shape['total_ms']:>11.3f} "
+                f"{shape['total_ms'] / shape['count']:>9.3f} {shape['max_ms']:>9.3f}  {shape['sql'][:200]}"
+            )
+            sources = sorted(shape['sources'].items(), key=lambda item: -item[1])
+            self.stdout.write('    источники: ' + ', '.join(f'{source or "-"} ({count})' for source, count in sources[:5]))
+            if options['explain'] and shape['explain']:
+                for line in shape['explain'].splitlines():
+                    self.stdout.write(f'    | {line}')
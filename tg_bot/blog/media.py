@@ -0,0 +1,120 @@
+"""
+Отправка вложений постов в Telegram.
+
+Файл загружается в Telegram только при первой отправке каждым ботом: из
+ответа берется file_id и сохраняется в TelegramFile с ID бота, повторные
+отправки этим ботом передают только его. Подряд идущие вложения одного типа объединяются в
+альбомы (sendMediaGroup); изображения и документы Telegram в одном альбоме
+не смешивает.
+"""
+
+from asgiref.sync import sync_to_async
+from telegram import InputMediaDocument, InputMediaPhoto
+from telegram.error import BadRequest
+from typing import List, Sequence, Tuple
+from .models import Attachment
+from .services import save_telegram_file_ids
+import os
+
+# Максимальный размер альбома в Telegram
+MEDIA_GROUP_LIMIT = 10
+
+INPUT_MEDIA = {
+    Attachment.PHOTO: InputMediaPhoto,
+    Attachment.DOCUMENT: InputMediaDocument,
+}
+
+
+def group_attachments(attachments: Sequence[Attachment]) -> List[List[Attachment]]:
+    """Разбиение вложений на альбомы с сохранением порядка"""
+    groups = []
+    for attachment in attachments:
+        if groups and groups[-1][0].kind == attachment.kind and len(groups[-1]) < MEDIA_GROUP_LIMIT:
+            groups[-1].append(attachment)
+        else:
+            groups.append([attachment])
+    return groups
+
+
+def read_file(attachment: Attachment) -> bytes:
+    with attachment.file.open('rb') as file:
+        return file.read()
+
+
+def telegram_bot_id(token: str) -> int:
+    """ID бота - числовая часть токена"""
+    return int(token.split(':', 1)[0])
+
+
+def cached_file_id(attachment: Attachment) -> str:
+    """file_id из services.attachments_for_bot; вложение без аннотации считается незагруженным"""
+    return getattr(attachment, 'telegram_file_id', '')
+
+
+def get_file_id(message, kind: str) -> str:
+    """file_id файла из сообщения, которое вернул Telegram"""
+    if kind == Attachment.PHOTO:
+        # Telegram возвращает несколько размеров, последний - исходный
+        return message.photo[-1].file_id
+    return message.document.file_id
+
+
+async def _send_group(bot, chat_id, group: List[Attachment], upload: bool) -> List[Tuple[Attachment, str]]:
+    """Отправка одного альбома, возвращает file_id загруженных файлов"""
+    sources = []
+    for attachment in group:
+        if cached_file_id(attachment) and not upload:
+            sources.append(cached_file_id(attachment))
+        else:
+            sources.append(await sync_to_async(read_file)(attachment))
+
+    if len(group) == 1:
+        attachment, source = group[0], sources[0]
+        send = bot.send_photo if attachment.kind == Attachment.PHOTO else bot.send_document
+        messages = [await send(
+            chat_id,
+            source,
+            caption=attachment.caption or None,
+            filename=os.path.basename(attachment.file.name),
+        )]
+    else:
+        messages = await bot.send_media_group(chat_id, [
+            INPUT_MEDIA[attachment.kind](
+                source,
+                caption=attachment.caption or None,
+                filename=os.path.basename(attachment.file.name),
+            )
+            for attachment, source in zip(group, sources)
+        ])
+
+    return [
+        (attachment, get_file_id(message, attachment.kind))
+        for attachment, source, message in zip(group, sources, messages)
+        if not isinstance(source, str)
+    ]
+
+
+async def send_attachments(bot, chat_id, attachments: Sequence[Attachment]) -> int:
+    """
+    Отправка вложений поста в чат.
+
+    Вложения должны быть загружены с file_id этого бота
+    (services.attachments_for_bot, get_post_by_id или get_posts_by_ids с bot_id).
+
+    Returns:
+        int: Количество загруженных файлов (0, если все взяты из кеша file_id)
+    """
+    uploaded = []
+    for group in group_attachments(attachments):
+        try:
+            uploaded += await _send_group(bot, chat_id, group, upload=False)
+        except BadRequest:
+            # Сохраненный file_id мог стать недействительным - загружаем файлы заново
+            if not any(cached_file_id(attachment) for attachment in group):
+                raise
+            uploaded += await _send_group(bot, chat_id, group, upload=True)
+    # file_id вложений архивного поста (ArchivedAttachment) не кешируются
+    cacheable = [(attachment, file_id) for attachment, file_id in uploaded if isinstance(attachment, Attachment)]
+    if cacheable:
+        await sync_to_async(save_telegram_file_ids)(cacheable, telegram_bot_id(bot.token))
+    return len(uploaded)
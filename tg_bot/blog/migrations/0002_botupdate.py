@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(unique=True, verbose_name='ID обновления')),
+                ('chat_id', models.BigIntegerField(null=True, verbose_name='ID чата')),
+                ('partition', models.PositiveSmallIntegerField(verbose_name='Партиция')),
+                ('payload', models.JSONField(verbose_name='Данные обновления')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')),
+            ],
+            options={
+                'verbose_name': 'Обновление бота',
+                'verbose_name_plural': 'Обновления бота',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['partition', 'id'], name='blog_botupdate_partition_idx')],
+            },
+        ),
+    ]
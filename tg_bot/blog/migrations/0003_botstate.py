@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_botupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32, verbose_name='Тип')),
+                ('key', models.CharField(max_length=255, verbose_name='Ключ')),
+                ('data', models.JSONField(verbose_name='Данные')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Состояние бота',
+                'verbose_name_plural': 'Состояния бота',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='blog_botstate_kind_key_uniq')],
+            },
+        ),
+    ]
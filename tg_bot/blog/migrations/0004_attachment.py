@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_botstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('photo', 'Изображение'), ('document', 'Документ')], default='photo', max_length=16, verbose_name='Тип')),
+                ('file', models.FileField(upload_to='attachments/%Y/%m/', verbose_name='Файл')),
+                ('caption', models.CharField(blank=True, max_length=1024, verbose_name='Подпись')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('checksum', models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256')),
+                ('telegram_file_id', models.CharField(blank=True, editable=False, max_length=255, verbose_name='Telegram file_id')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='blog.post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Вложение',
+                'verbose_name_plural': 'Вложения',
+                'ordering': ['position', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+import blog.fields
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def copy_content(apps, source, target):
+    Post = apps.get_model('blog', 'Post')
+    batch = []
+    for post in Post.objects.only('id', source).iterator(chunk_size=BATCH_SIZE):
+        setattr(post, target, str(getattr(post, source)))
+        batch.append(post)
+        if len(batch) == BATCH_SIZE:
+            Post.objects.bulk_update(batch, [target])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, [target])
+
+
+def compress(apps, schema_editor):
+    copy_content(apps, 'content', 'compressed_content')
+
+
+def decompress(apps, schema_editor):
+    copy_content(apps, 'compressed_content', 'content')
+
+
+class Migration(migrations.Migration):
+    """
+    Перенос текста постов в сжимаемое поле.
+
+    Текст копируется в новую двоичную колонку пачками через ORM (поле само
+    сжимает длинные значения), затем старая колонка удаляется, а новая
+    получает ее имя. Прямое изменение типа колонки не используется: приведение
+    text к bytea в PostgreSQL искажает обратные слеши.
+    """
+
+    dependencies = [
+        ('blog', '0005_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='compressed_content',
+            field=blog.fields.CompressedTextField(null=True, verbose_name='Текст поста'),
+        ),
+        # Допускаем NULL в старой колонке, чтобы откат миграции мог создать ее
+        # заново до копирования текста обратно
+        migrations.AlterField(
+            model_name='post',
+            name='content',
+            field=models.TextField(null=True, verbose_name='Текст поста'),
+        ),
+        migrations.RunPython(compress, decompress),
+        migrations.RemoveField(
+            model_name='post',
+            name='content',
+        ),
+        migrations.RenameField(
+            model_name='post',
+            old_name='compressed_content',
+            new_name='content',
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='content',
+            field=blog.fields.CompressedTextField(verbose_name='Текст поста'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_compress_post_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='views',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Просмотры'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-views', '-id'], name='blog_post_views_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def default_bot_id():
+    """ID бота, которым были получены сохраненные file_id (первый из настроенных)"""
+    token = settings.TELEGRAM_BOTS[0][-1] if settings.TELEGRAM_BOTS else settings.TELEGRAM_BOT_TOKEN
+    prefix = (token or '').split(':', 1)[0]
+    return int(prefix) if prefix.isdigit() else None
+
+
+def copy_file_ids(apps, schema_editor):
+    bot_id = default_bot_id()
+    if bot_id is None:
+        # Бот неизвестен: файлы будут загружены заново при первой отправке
+        return
+    Attachment = apps.get_model('blog', 'Attachment')
+    TelegramFile = apps.get_model('blog', 'TelegramFile')
+    rows = Attachment.objects.exclude(telegram_file_id='').values_list('id', 'telegram_file_id')
+    batch = []
+    for attachment_id, file_id in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(TelegramFile(attachment_id=attachment_id, bot_id=bot_id, file_id=file_id))
+        if len(batch) == BATCH_SIZE:
+            TelegramFile.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        TelegramFile.objects.bulk_create(batch)
+
+
+def restore_file_ids(apps, schema_editor):
+    bot_id = default_bot_id()
+    if bot_id is None:
+        return
+    Attachment = apps.get_model('blog', 'Attachment')
+    TelegramFile = apps.get_model('blog', 'TelegramFile')
+    for attachment_id, file_id in TelegramFile.objects.filter(bot_id=bot_id).values_list('attachment_id', 'file_id'):
+        Attachment.objects.filter(id=attachment_id).update(telegram_file_id=file_id)
+
+
+class Migration(migrations.Migration):
+    """
+    Кеш file_id по ботам.
+
+    file_id действителен только для загрузившего файл бота. Сохраненные
+    идентификаторы переносятся на первого бота из TELEGRAM_BOTS (или
+    TELEGRAM_BOT_TOKEN), которым они и были получены.
+    """
+
+    dependencies = [
+        ('blog', '0008_post_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bot_id', models.BigIntegerField(verbose_name='ID бота')),
+                ('file_id', models.CharField(max_length=255, verbose_name='Telegram file_id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('attachment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='telegram_files', to='blog.attachment', verbose_name='Вложение')),
+            ],
+            options={
+                'verbose_name': 'Файл в Telegram',
+                'verbose_name_plural': 'Файлы в Telegram',
+                'constraints': [models.UniqueConstraint(fields=('attachment', 'bot_id'), name='blog_telegramfile_attachment_bot_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_file_ids, restore_file_ids),
+        migrations.RemoveField(
+            model_name='attachment',
+            name='telegram_file_id',
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:42
+
+import blog.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_telegram_file'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('content', blog.fields.CompressedTextField(verbose_name='Текст поста')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('views', models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Просмотры')),
+                ('version', models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_posts', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Архивный пост',
+                'verbose_name_plural': 'Архивные посты',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedAttachment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('photo', 'Изображение'), ('document', 'Документ')], max_length=16, verbose_name='Тип')),
+                ('file', models.FileField(upload_to='attachments/%Y/%m/', verbose_name='Файл')),
+                ('caption', models.CharField(blank=True, max_length=1024, verbose_name='Подпись')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('checksum', models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='blog.archivedpost', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Архивное вложение',
+                'verbose_name_plural': 'Архивные вложения',
+                'ordering': ['position', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='publish_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата публикации'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('publish_at__isnull', False)), fields=['publish_at'], name='blog_post_publish_at_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_publish_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(verbose_name='Версия')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('snapshot', models.BooleanField(default=False, verbose_name='Полный текст')),
+                ('data', models.BinaryField(verbose_name='Текст или разница')),
+                ('replaced_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата замены')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='blog.post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Редакция поста',
+                'verbose_name_plural': 'Редакции постов',
+                'ordering': ['-version'],
+                'constraints': [models.UniqueConstraint(fields=('post', 'version'), name='blog_postrevision_post_version_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def default_bot_id():
+    """ID бота, данные которого уже сохранены (первый из настроенных)"""
+    token = settings.TELEGRAM_BOTS[0][-1] if settings.TELEGRAM_BOTS else settings.TELEGRAM_BOT_TOKEN
+    prefix = (token or '').split(':', 1)[0]
+    return int(prefix) if prefix.isdigit() else None
+
+
+def assign_bot(apps, schema_editor):
+    bot_id = default_bot_id()
+    if bot_id is None:
+        # Бот неизвестен: сохраненные данные не будут загружены ни одним ботом
+        return
+    BotState = apps.get_model('blog', 'BotState')
+    BotState.objects.filter(bot_id=0).update(bot_id=bot_id)
+
+
+class Migration(migrations.Migration):
+    """
+    Данные persistence по ботам.
+
+    Боты группы (TELEGRAM_BOTS) хранят user_data, chat_data и bot_data
+    отдельно. Сохраненные записи переносятся на первого бота из
+    TELEGRAM_BOTS (или TELEGRAM_BOT_TOKEN), которым они и были записаны.
+    """
+
+    dependencies = [
+        ('blog', '0012_post_revisions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botstate',
+            name='bot_id',
+            field=models.BigIntegerField(default=0, verbose_name='ID бота'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(assign_bot, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='botstate',
+            name='blog_botstate_kind_key_uniq',
+        ),
+        migrations.AddConstraint(
+            model_name='botstate',
+            constraint=models.UniqueConstraint(fields=('bot_id', 'kind', 'key'), name='blog_botstate_bot_kind_key_uniq'),
+        ),
+    ]
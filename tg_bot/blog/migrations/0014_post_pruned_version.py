@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_botstate_bot_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='pruned_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Удаленные редакции'),
+        ),
+    ]
@@ -1,18 +1,256 @@
-from django.db import models
+from django.db import models, transaction
 from users.models import User
+from .fields import CompressedTextField
+import hashlib
 
 # Create your models here.
 
 class Post(models.Model):
-    title = models.CharField(max_length=200, verbose_name='Заголовок')
-    content = models.TextField(verbose_name='Текст поста')
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    title = models.CharField(max_length=200, db_index=True, verbose_name='Заголовок')
+    content = CompressedTextField(verbose_name='Текст поста')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Автор', null=True)
+    # Обновляется пакетами из буфера просмотров (blog.counters)
+    views = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Просмотры')
+    # Номер редакции поста, отдается API как ETag (просмотры его не меняют)
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия')
+    # Отложенная публикация: до этого времени пост скрыт (services.published_posts),
+    # пустое значение - опубликован сразу
+    publish_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата публикации')
+    # Редакции до этой версии включительно удалены из истории (revisions.prune_revisions)
+    pruned_version = models.PositiveIntegerField(default=0, editable=False, verbose_name='Удаленные редакции')
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-views', '-id'], name='blog_post_views_idx'),
+            # Только отложенные посты: индекс мал, по нему планировщик
+            # (blog.scheduler) находит ближайшие публикации
+            models.Index(fields=['publish_at'], name='blog_post_publish_at_idx',
+                         condition=models.Q(publish_at__isnull=False)),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, **kwargs):
+        # Изменение через save() (админка) тоже начинает новую редакцию,
+        # иначе ETag, выданный API до изменения, остался бы действительным
+        if not self._state.adding:
+            self.version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+
+
+def file_checksum(file) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Attachment(models.Model):
+    """
+    Вложение поста (изображение или документ).
+
+    Идентификаторы файла, полученные от Telegram при первой отправке каждым
+    ботом, хранятся в TelegramFile: повторные отправки передают их вместо
+    загрузки файла. При замене файла идентификаторы удаляются.
+    """
+    PHOTO = 'photo'
+    DOCUMENT = 'document'
+    KIND_CHOICES = [
+        (PHOTO, 'Изображение'),
+        (DOCUMENT, 'Документ'),
+    ]
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='attachments', verbose_name='Пост')
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default=PHOTO, verbose_name='Тип')
+    file = models.FileField(upload_to='attachments/%Y/%m/', verbose_name='Файл')
+    caption = models.CharField(max_length=1024, blank=True, verbose_name='Подпись')
+    position = models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')
+    checksum = models.CharField(max_length=64, blank=True, editable=False, verbose_name='SHA-256')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Вложение'
+        verbose_name_plural = 'Вложения'
+        ordering = ['position', 'id']
+
+    def __str__(self):
+        return self.file.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_kind = instance.__dict__.get('kind')
+        return instance
+
+    def save(self, *args, **kwargs):
+        reset_file_ids = False
+        # Новый файл еще не записан в хранилище: пересчитываем хеш и при
+        # изменении содержимого сбрасываем кеш file_id
+        if self.file and not self.file._committed:
+            checksum = file_checksum(self.file)
+            if checksum != self.checksum:
+                self.checksum = checksum
+                reset_file_ids = True
+        # file_id изображения нельзя отправить как документ и наоборот
+        if getattr(self, '_loaded_kind', self.kind) != self.kind:
+            reset_file_ids = True
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if reset_file_ids:
+                self.telegram_files.all().delete()
+        self._loaded_kind = self.kind
+
+
+class TelegramFile(models.Model):
+    """
+    file_id вложения, полученный ботом при загрузке файла.
+
+    file_id действителен только для бота, который загрузил файл, поэтому кеш
+    ведется по ID бота - числовой части токена, которая не меняется при
+    перевыпуске токена.
+    """
+    attachment = models.ForeignKey(Attachment, on_delete=models.CASCADE, related_name='telegram_files',
+                                   verbose_name='Вложение')
+    bot_id = models.BigIntegerField(verbose_name='ID бота')
+    file_id = models.CharField(max_length=255, verbose_name='Telegram file_id')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')
+
+    class Meta:
+        verbose_name = 'Файл в Telegram'
+        verbose_name_plural = 'Файлы в Telegram'
+        constraints = [
+            models.UniqueConstraint(fields=['attachment', 'bot_id'], name='blog_telegramfile_attachment_bot_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.bot_id}:{self.file_id}'
+
+
+class ArchivedPost(models.Model):
+    """
+    Пост, перенесенный в архив командой archive_posts.
+
+    Колонки те же, что у Post, id сохраняется. Из индексов только первичный
+    ключ и автор: индексы рабочей таблицы и ее страницы в кеше базы содержат
+    только свежие посты. Читается через services.get_post_by_id, когда поста
+    нет в Post; в списки постов архив не попадает.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+    title = models.CharField(max_length=200, verbose_name='Заголовок')
+    content = CompressedTextField(verbose_name='Текст поста')
+    created_at = models.DateTimeField(verbose_name='Дата создания')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_posts', verbose_name='Автор',
+                               null=True)
+    views = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Просмотры')
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+
+    class Meta:
+        verbose_name = 'Архивный пост'
+        verbose_name_plural = 'Архивные посты'
+        ordering = ['-created_at']
 
     def __str__(self):
         return self.title
+
+
+class ArchivedAttachment(models.Model):
+    """
+    Вложение архивного поста.
+
+    Файл в хранилище остается на месте. Кеш file_id (TelegramFile) при
+    архивации удаляется: при отправке архивного поста файлы загружаются
+    заново.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE, related_name='attachments', verbose_name='Пост')
+    kind = models.CharField(max_length=16, choices=Attachment.KIND_CHOICES, verbose_name='Тип')
+    file = models.FileField(upload_to='attachments/%Y/%m/', verbose_name='Файл')
+    caption = models.CharField(max_length=1024, blank=True, verbose_name='Подпись')
+    position = models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')
+    checksum = models.CharField(max_length=64, blank=True, editable=False, verbose_name='SHA-256')
+    updated_at = models.DateTimeField(verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Архивное вложение'
+        verbose_name_plural = 'Архивные вложения'
+        ordering = ['position', 'id']
+
+    def __str__(self):
+        return self.file.name
+
+
+class PostRevision(models.Model):
+    """
+    Предыдущая редакция поста (blog.revisions).
+
+    Строка версии N хранит заголовок и текст поста до изменения, сделавшего
+    его версией N+1. Текст хранится как сжатая разница с более новой
+    редакцией (следующей строкой или текущим постом), а раз в
+    POST_REVISION_SNAPSHOT_INTERVAL версий - целиком, сжатым zlib.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='revisions', verbose_name='Пост')
+    version = models.PositiveIntegerField(verbose_name='Версия')
+    title = models.CharField(max_length=200, verbose_name='Заголовок')
+    snapshot = models.BooleanField(default=False, verbose_name='Полный текст')
+    data = models.BinaryField(verbose_name='Текст или разница')
+    replaced_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата замены')
+
+    class Meta:
+        verbose_name = 'Редакция поста'
+        verbose_name_plural = 'Редакции постов'
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'version'], name='blog_postrevision_post_version_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} v{self.version}'
+
+
+class BotUpdate(models.Model):
+    """Входящее обновление Telegram в очереди на обработку воркерами"""
+    update_id = models.BigIntegerField(unique=True, verbose_name='ID обновления')
+    chat_id = models.BigIntegerField(null=True, verbose_name='ID чата')
+    partition = models.PositiveSmallIntegerField(verbose_name='Партиция')
+    payload = models.JSONField(verbose_name='Данные обновления')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')
+
+    class Meta:
+        verbose_name = 'Обновление бота'
+        verbose_name_plural = 'Обновления бота'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['partition', 'id'], name='blog_botupdate_partition_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.update_id} ({self.chat_id})'
+
+
+class BotState(models.Model):
+    """Данные бота (user_data, chat_data, bot_data, состояния диалогов) для DjangoPersistence"""
+    bot_id = models.BigIntegerField(verbose_name='ID бота')
+    kind = models.CharField(max_length=32, verbose_name='Тип')
+    key = models.CharField(max_length=255, verbose_name='Ключ')
+    data = models.JSONField(verbose_name='Данные')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Состояние бота'
+        verbose_name_plural = 'Состояния бота'
+        constraints = [
+            models.UniqueConstraint(fields=['bot_id', 'kind', 'key'], name='blog_botstate_bot_kind_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.bot_id}:{self.kind}:{self.key}'
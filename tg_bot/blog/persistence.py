@@ -0,0 +1,209 @@
+"""
+Хранение данных бота в базе данных Django.
+
+В отличие от PicklePersistence, которая переписывает файл целиком,
+DjangoPersistence пишет только измененные записи: Application
+периодически передает изменившиеся user_data / chat_data, они копятся в
+памяти и записываются одной транзакцией с upsert. user_data и chat_data
+загружаются лениво, при первом обновлении от пользователя или чата, так что
+запуск бота не зависит от количества сохраненных записей. Записи хранятся
+по ID бота, поэтому боты группы (TELEGRAM_BOTS) не перетирают данные друг
+друга.
+
+Данные хранятся в JSONField, поэтому должны сериализоваться в JSON.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from telegram.ext import BasePersistence
+from typing import Dict, Optional, Tuple
+from .models import BotState
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+USER = 'user'
+CHAT = 'chat'
+BOT = 'bot'
+CALLBACK = 'callback'
+CONVERSATION = 'conversation'
+
+
+def load_state(bot_id: int, kind: str, key: str) -> Optional[dict]:
+    return BotState.objects.filter(bot_id=bot_id, kind=kind, key=key).values_list('data', flat=True).first()
+
+
+def load_states(bot_id: int, kind: str, key_prefix: str = '') -> Dict[str, object]:
+    return dict(
+        BotState.objects.filter(bot_id=bot_id, kind=kind, key__startswith=key_prefix).values_list('key', 'data')
+    )
+
+
+def write_states(bot_id: int, dirty: Dict[Tuple[str, str], object], deleted: set) -> None:
+    """Запись пачки изменений бота одной транзакцией"""
+    with transaction.atomic():
+        for kind in {kind for kind, _ in deleted}:
+            BotState.objects.filter(
+                bot_id=bot_id, kind=kind, key__in=[key for k, key in deleted if k == kind]
+            ).delete()
+        if dirty:
+            BotState.objects.bulk_create(
+                [BotState(bot_id=bot_id, kind=kind, key=key, data=data) for (kind, key), data in dirty.items()],
+                update_conflicts=True,
+                unique_fields=['bot_id', 'kind', 'key'],
+                update_fields=['data', 'updated_at'],
+            )
+
+
+class DjangoPersistence(BasePersistence):
+    """Persistence для python-telegram-bot на моделях Django с отложенной пакетной записью"""
+
+    def __init__(self, bot_id: int, store_data=None, update_interval: float = None, write_delay: float = 0.1):
+        """
+        Args:
+            bot_id (int): ID бота, данные которого хранятся
+            store_data (PersistenceInput, optional): Какие данные сохранять
+            update_interval (float, optional): Период передачи изменений из Application,
+                по умолчанию BOT_PERSISTENCE_INTERVAL
+            write_delay (float): Пауза перед записью, за которую изменения одного
+                прохода Application собираются в одну транзакцию
+        """
+        if update_interval is None:
+            update_interval = settings.BOT_PERSISTENCE_INTERVAL
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.bot_id = bot_id
+        self.write_delay = write_delay
+        self._dirty: Dict[Tuple[str, str], object] = {}
+        self._deleted: set = set()
+        # Последние загруженные или записанные данные по ключу: Application
+        # передает данные каждого пользователя и чата, от которых были
+        # обновления, даже если обработчики их не меняли
+        self._stored: Dict[Tuple[str, str], object] = {}
+        self._write_task: Optional[asyncio.Task] = None
+
+    # Загрузка
+
+    async def get_user_data(self) -> dict:
+        # Загружается лениво в refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        # Загружается лениво в refresh_chat_data
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        data = self._stored[(BOT, '')] = await sync_to_async(load_state)(self.bot_id, BOT, '') or {}
+        return dict(data)
+
+    async def get_callback_data(self):
+        data = await sync_to_async(load_state)(self.bot_id, CALLBACK, '')
+        self._stored[(CALLBACK, '')] = data
+        if data is None:
+            return None
+        # JSON превращает кортежи в списки
+        return [tuple(item) for item in data[0]], data[1]
+
+    async def get_conversations(self, name: str) -> dict:
+        states = await sync_to_async(load_states)(self.bot_id, CONVERSATION, f'{name}:')
+        return {
+            tuple(json.loads(key[len(name) + 1:])): state
+            for key, state in states.items()
+        }
+
+    async def _refresh(self, kind: str, key: int, data: dict) -> None:
+        marker = (kind, str(key))
+        if marker in self._stored:
+            return
+        stored = self._stored[marker] = await sync_to_async(load_state)(self.bot_id, kind, str(key)) or {}
+        if stored:
+            # Значения, уже записанные обработчиками, не перетираем
+            for name, value in stored.items():
+                data.setdefault(name, value)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh(USER, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh(CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # Запись
+
+    def _mark(self, kind: str, key, data) -> None:
+        marker = (kind, str(key))
+        if marker in self._stored and self._stored[marker] == data:
+            return
+        self._stored[marker] = data
+        self._deleted.discard(marker)
+        self._dirty[marker] = data
+        self._schedule_write()
+
+    def _schedule_write(self) -> None:
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._delayed_write())
+
+    async def _delayed_write(self) -> None:
+        await asyncio.sleep(self.write_delay)
+        try:
+            await self._write()
+        except Exception:
+            logger.exception('Не удалось сохранить данные бота, изменения будут записаны следующим проходом')
+
+    async def _write(self) -> None:
+        if not self._dirty and not self._deleted:
+            return
+        dirty, deleted = self._dirty, self._deleted
+        self._dirty, self._deleted = {}, set()
+        try:
+            await sync_to_async(write_states)(self.bot_id, dirty, deleted)
+        except Exception:
+            # Вернем изменения в буфер, более новые значения имеют приоритет
+            dirty.update(self._dirty)
+            self._dirty = dirty
+            self._deleted |= deleted - set(self._dirty)
+            raise
+
+    # Записываются только данные, отличающиеся от загруженных или записанных ранее
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._mark(USER, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._mark(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._mark(BOT, '', data)
+
+    async def update_callback_data(self, data) -> None:
+        self._mark(CALLBACK, '', [list(data[0]), data[1]])
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        conversation_key = f'{name}:{json.dumps(list(key))}'
+        if new_state is None:
+            await self._drop(CONVERSATION, conversation_key)
+        else:
+            self._mark(CONVERSATION, conversation_key, new_state)
+
+    async def _drop(self, kind: str, key) -> None:
+        marker = (kind, str(key))
+        self._dirty.pop(marker, None)
+        self._stored[marker] = {}
+        self._deleted.add(marker)
+        self._schedule_write()
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._drop(CHAT, chat_id)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._drop(USER, user_id)
+
+    async def flush(self) -> None:
+        """Запись всех накопленных изменений при остановке бота"""
+        if self._write_task is not None and not self._write_task.done():
+            await self._write_task
+        await self._write()
@@ -0,0 +1,165 @@
+"""
+История правок постов с хранением разниц (PostRevision).
+
+При изменении заголовка или текста (services.update_post, админка)
+предыдущая редакция записывается строкой PostRevision. Текст хранится
+обратной разницей: набором команд, которые из более новой редакции
+(следующей строки истории или текущего поста) получают эту. Разница
+строится по строкам difflib и сжимается zlib, поэтому мелкая правка
+длинного поста занимает десятки байт, а не копию текста.
+
+Чтобы восстановление не проходило всю историю, каждая
+POST_REVISION_SNAPSHOT_INTERVAL-я редакция хранится целиком. Редакция
+восстанавливается одним запросом: строки от нее до ближайшего полного
+текста выше применяются к нему (или к текущему посту) от новых к старым.
+Свежие редакции, которые смотрят чаще всего, восстанавливаются от
+текущего поста.
+
+Обратные разницы ссылаются только на более новые редакции, поэтому
+старую историю можно удалять без пересчета (manage.py prune_revisions).
+Последняя удаленная версия запоминается в Post.pruned_version: версии
+без строки истории (изменилось только publish_at) выше нее
+восстанавливаются, а ниже - считаются удаленными.
+"""
+
+from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from typing import List, Optional
+from .models import Post, PostRevision
+import difflib
+import json
+import zlib
+
+
+def make_delta(base: str, target: str) -> bytes:
+    """
+    Разница, получающая target из base.
+
+    Команды: [начало, конец] - скопировать строки base, строка - вставить
+    текст.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(target_lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    """Применение разницы make_delta к base"""
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(delta)):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+
+def last_snapshot_version():
+    """Версия последней полной редакции поста - подзапрос для annotate() по Post"""
+    return Subquery(
+        PostRevision.objects.filter(post=OuterRef('pk'), snapshot=True)
+        .order_by('-version').values('version')[:1]
+    )
+
+
+def record_revision(post_id: int, version: int, title: str, content: str, next_content: str,
+                    last_snapshot: Optional[int]) -> PostRevision:
+    """
+    Запись редакции version, замененной текстом next_content.
+
+    Args:
+        post_id (int): ID поста
+        version (int): Версия заменяемой редакции
+        title (str): Ее заголовок
+        content (str): Ее текст
+        next_content (str): Текст, которым она заменена
+        last_snapshot (int, optional): Версия последней полной редакции поста (last_snapshot_version)
+    """
+    snapshot = version - (last_snapshot or 0) >= settings.POST_REVISION_SNAPSHOT_INTERVAL
+    if snapshot:
+        data = zlib.compress(content.encode('utf-8'), settings.COMPRESSED_TEXT_LEVEL)
+    else:
+        data = make_delta(next_content, content)
+    return PostRevision.objects.create(post_id=post_id, version=version, title=title, snapshot=snapshot, data=data)
+
+
+def restore(rows: List[PostRevision], current_content: str) -> str:
+    """
+    Текст самой старой из строк rows.
+
+    rows - строки подряд от новых к старым, первая - полная редакция или
+    редакция, замененная текущим текстом поста current_content.
+    """
+    if rows[0].snapshot:
+        content = zlib.decompress(rows[0].data).decode('utf-8')
+        rows = rows[1:]
+    else:
+        content = current_content
+    for row in rows:
+        content = apply_delta(content, bytes(row.data))
+    return content
+
+
+def revision_chain(post_id: int, version: int, current_version: int) -> List[PostRevision]:
+    """Строки от редакции version до ближайшей полной выше нее, от новых к старым"""
+    snapshot = (
+        PostRevision.objects.filter(post_id=post_id, snapshot=True, version__gte=version)
+        .order_by('version').values('version')[:1]
+    )
+    # Без полной редакции выше цепочка доходит до текущего поста
+    rows = PostRevision.objects.filter(
+        post_id=post_id, version__gte=version, version__lt=current_version,
+        version__lte=Coalesce(Subquery(snapshot), Value(current_version)),
+    )
+    return list(rows.order_by('-version'))
+
+
+def prune_candidates(keep: Optional[int] = None, cutoff: Optional[datetime] = None):
+    """
+    Редакции для удаления: кроме keep последних у каждого поста и/или замененные раньше cutoff.
+
+    Оба условия выбирают самые старые редакции поста, на которые более
+    новые не ссылаются.
+    """
+    revisions = PostRevision.objects.all()
+    if cutoff is not None:
+        revisions = revisions.filter(replaced_at__lt=cutoff)
+    if keep:
+        kept = PostRevision.objects.filter(post=OuterRef('post')).order_by('-version').values('version')[keep - 1:keep]
+        revisions = revisions.filter(version__lt=Subquery(kept))
+    return revisions
+
+
+def prune_revisions(keep: Optional[int] = None, cutoff: Optional[datetime] = None, batch_size: int = 1000) -> int:
+    """
+    Удаление старых редакций пакетами по batch_size в отдельных транзакциях.
+
+    Returns:
+        int: Количество удаленных редакций
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(prune_candidates(keep, cutoff).order_by('id').values_list('id', flat=True)[:batch_size])
+            if ids:
+                rows = PostRevision.objects.filter(id__in=ids)
+                pruned = {}
+                for post_id, version in rows.values_list('post_id').annotate(version=Max('version')).order_by():
+                    pruned.setdefault(version, []).append(post_id)
+                rows.delete()
+                for version, post_ids in pruned.items():
+                    Post.objects.filter(id__in=post_ids, pruned_version__lt=version).update(pruned_version=version)
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
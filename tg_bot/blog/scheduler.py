@@ -0,0 +1,203 @@
+"""
+Планировщик отложенных публикаций.
+
+Пост с publish_at в будущем скрыт условием запроса
+(services.published_posts), поэтому видимость от планировщика не зависит.
+Планировщик нужен, чтобы в момент публикации выполнить побочные эффекты
+процесса - например, сбросить кеши - через сигнал post_published:
+
+    @receiver(post_published)
+    def invalidate_posts_cache(sender, post_id, publish_at, **kwargs):
+        ...
+
+Процесс держит кучу ближайших публикаций (publish_at, id), загруженную
+одним запросом по частичному индексу blog_post_publish_at_idx, и поток,
+который спит до ближайшего publish_at. Куча пополняется сигналом post_save
+поста и вызовом schedule() из services.update_post. Публикации, назначенные
+другими процессами, подхватываются перезагрузкой кучи раз в
+PUBLISH_SCHEDULER_RELOAD_INTERVAL секунд (тот же запрос по индексу, без
+просмотра таблицы). Перед срабатыванием время публикации сверяется с
+базой: если его изменили, устаревшая запись пропускается.
+
+Сигнал отправляется в каждом процессе с планировщиком. Уведомления, которые
+должны уйти один раз, подключаются к post_saved: для отложенного поста
+задача ставится в очередь с запуском в publish_at (tasks.schedule_post_saved).
+"""
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.utils import timezone
+from typing import Dict, Optional
+from .models import Post
+import atexit
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Аргументы: post_id, publish_at
+post_published = Signal()
+
+# Публикаций, загружаемых одним запросом; более поздние загружаются, когда
+# ближайшие сработают
+LOAD_LIMIT = 1000
+
+
+class PublishScheduler:
+    """Куча ближайших публикаций процесса и поток, срабатывающий в их время"""
+
+    def __init__(self, load_limit: int = LOAD_LIMIT):
+        self.load_limit = load_limit
+        self._condition = threading.Condition()
+        self._heap = []
+        # Актуальное время публикации по ID; записи кучи с другим временем устарели
+        self._scheduled: Dict[int, object] = {}
+        # publish_at последней загруженной публикации, если загружены не все
+        self._horizon = None
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self) -> int:
+        """Загрузка ближайших публикаций из базы, возвращает их количество"""
+        rows = list(
+            Post.objects.filter(publish_at__gt=timezone.now())
+            .order_by('publish_at', 'id').values_list('publish_at', 'id')[:self.load_limit]
+        )
+        with self._condition:
+            # Отсортированный список - уже куча
+            self._heap = rows
+            self._scheduled = {post_id: publish_at for publish_at, post_id in rows}
+            self._horizon = rows[-1][0] if len(rows) == self.load_limit else None
+            self._condition.notify()
+        return len(rows)
+
+    def schedule(self, post_id: int, publish_at) -> None:
+        """Учет нового или измененного времени публикации поста"""
+        with self._condition:
+            if publish_at is None or publish_at <= timezone.now():
+                # Пост опубликован сразу или ему вернули немедленную публикацию
+                self._scheduled.pop(post_id, None)
+                return
+            if self._scheduled.get(post_id) == publish_at:
+                return
+            if self._horizon is not None and publish_at > self._horizon:
+                # Загрузится вместе с остальными поздними публикациями
+                self._scheduled.pop(post_id, None)
+                return
+            self._scheduled[post_id] = publish_at
+            heapq.heappush(self._heap, (publish_at, post_id))
+            self._condition.notify()
+
+    def pending(self) -> int:
+        """Количество ожидающих публикаций в куче"""
+        with self._condition:
+            return len(self._scheduled)
+
+    def next_publish_at(self):
+        """Время ближайшей публикации или None"""
+        with self._condition:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _discard_stale(self) -> None:
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def fire(self, post_id: int, publish_at) -> bool:
+        """Отправка post_published, если время публикации поста не изменилось"""
+        if not Post.objects.filter(id=post_id, publish_at=publish_at).exists():
+            return False
+        # Ошибка одного получателя не должна мешать остальным и останавливать планировщик
+        for receiver, result in post_published.send_robust(sender=Post, post_id=post_id, publish_at=publish_at):
+            if isinstance(result, Exception):
+                logger.error('Ошибка получателя post_published %r для поста %s', receiver, post_id,
+                             exc_info=result)
+        return True
+
+    def run_pending(self) -> int:
+        """Срабатывание наступивших публикаций, возвращает количество отправленных сигналов"""
+        due = []
+        with self._condition:
+            now = timezone.now()
+            self._discard_stale()
+            while self._heap and self._heap[0][0] <= now:
+                publish_at, post_id = heapq.heappop(self._heap)
+                del self._scheduled[post_id]
+                due.append((post_id, publish_at))
+                self._discard_stale()
+            reload = not self._heap and self._horizon is not None
+        fired = sum(self.fire(post_id, publish_at) for post_id, publish_at in due)
+        if reload:
+            self.load()
+        return fired
+
+    def _on_post_save(self, sender, instance, **kwargs) -> None:
+        if 'publish_at' not in instance.get_deferred_fields():
+            self.schedule(instance.id, instance.publish_at)
+
+    def _seconds_until_next(self) -> Optional[float]:
+        self._discard_stale()
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - timezone.now()).total_seconds(), 0.0)
+
+    def _loop(self, reload_interval: float) -> None:
+        try:
+            # Первая загрузка - на первой итерации, ошибка базы при ней повторяется
+            wait_reload = 0.0
+            while True:
+                with self._condition:
+                    if self._stopping:
+                        return
+                    until_next = self._seconds_until_next()
+                    timeout = wait_reload if until_next is None else min(until_next, wait_reload)
+                    started = time.monotonic()
+                    if timeout > 0:
+                        self._condition.wait(timeout)
+                    if self._stopping:
+                        return
+                    wait_reload -= time.monotonic() - started
+                close_old_connections()
+                try:
+                    if wait_reload <= 0:
+                        self.load()
+                        wait_reload = reload_interval
+                    self.run_pending()
+                except DatabaseError:
+                    logger.exception('Не удалось обработать отложенные публикации')
+                    wait_reload = min(wait_reload, 1.0)
+        finally:
+            connection.close()
+
+    def start(self, reload_interval: Optional[float] = None) -> None:
+        """Запуск потока планировщика; куча пополняется сигналом post_save поста"""
+        # Поток, унаследованный при fork, в дочернем процессе не работает
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if reload_interval is None:
+            reload_interval = settings.PUBLISH_SCHEDULER_RELOAD_INTERVAL
+        self._stopping = False
+        post_save.connect(self._on_post_save, sender=Post, dispatch_uid=f'publish-scheduler-{id(self)}')
+        self._thread = threading.Thread(target=self._loop, args=(reload_interval,), name='publish-scheduler',
+                                        daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Остановка потока планировщика"""
+        if self._thread is None:
+            return
+        post_save.disconnect(sender=Post, dispatch_uid=f'publish-scheduler-{id(self)}')
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.stop)
+
+
+PUBLICATIONS = PublishScheduler()
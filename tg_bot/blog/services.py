@@ -1,73 +1,358 @@
-from .models import Post
+from .models import ArchivedPost, Attachment, Post, PostRevision, TelegramFile
+from .revisions import last_snapshot_version, record_revision, restore, revision_chain
+from .scheduler import PUBLICATIONS
+from .tasks import schedule_post_saved
 from users.models import User
-from django.shortcuts import get_object_or_404
-from typing import List, Dict, Any
+from django.db import transaction
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+def published_posts():
+    """Посты, видимые читателям: без отложенной публикации или с наступившим publish_at"""
+    return Post.objects.filter(Q(publish_at__isnull=True) | Q(publish_at__lte=timezone.now()))
 
 def get_all_posts():
-    """Получение всех постов с предзагрузкой автора"""
-    return list(Post.objects.select_related('author').all())
+    """Получение всех опубликованных постов с предзагрузкой автора"""
+    return list(published_posts().select_related('author'))
+
+def get_post_titles():
+    """Получение ID и заголовков опубликованных постов без загрузки текста (клавиатура бота)"""
+    return list(published_posts().only('id', 'title'))
+
+def get_most_viewed_posts(limit: int = 10):
+    """
+    Самые просматриваемые посты без загрузки текста.
+
+    Учитываются только просмотры, уже записанные из буфера (blog.counters).
+    """
+    return list(
+        published_posts().select_related('author').only('id', 'title', 'views', 'author__username')
+        .order_by('-views', '-id')[:limit]
+    )
+
+def attachments_for_bot(bot_id: int):
+    """Вложения с file_id, полученным этим ботом, в атрибуте telegram_file_id ('' - файл не загружен)"""
+    file_id = TelegramFile.objects.filter(attachment=OuterRef('pk'), bot_id=bot_id).values('file_id')[:1]
+    return Attachment.objects.annotate(telegram_file_id=Coalesce(Subquery(file_id), Value('')))
+
+def get_post_by_id(post_id, bot_id: Optional[int] = None):
+    """
+    Получение опубликованного поста по ID с предзагрузкой автора и вложений.
+
+    Пост с отложенной публикацией до ее наступления не находится. С bot_id вложения загружаются вместе с file_id этого бота тем же запросом.
+    Пост, которого нет в рабочей таблице, ищется в архиве (blog.archive) и
+    возвращается как ArchivedPost с теми же атрибутами; file_id для его
+    вложений не кешируются.
+
+    Raises:
+        Post.DoesNotExist: Если поста нет ни в рабочей таблице, ни в архиве или он еще не опубликован
+    """
+    attachments = 'attachments'
+    if bot_id is not None:
+        attachments = Prefetch('attachments', queryset=attachments_for_bot(bot_id))
+    try:
+        return published_posts().select_related('author').prefetch_related(attachments).get(id=post_id)
+    except Post.DoesNotExist:
+        archived = ArchivedPost.objects.select_related('author').prefetch_related('attachments').filter(id=post_id).first()
+        if archived is None:
+            raise
+        return archived
+
+def get_posts_by_ids(post_ids: List[int], bot_id: Optional[int] = None) -> Dict[int, Any]:
+    """
+    Опубликованные посты по списку ID одним запросом (и запросом вложений).
+
+    Как get_post_by_id, но для нескольких ID: отсутствующие в рабочей
+    таблице ищутся в архиве одним запросом, не найденных ID нет в
+    результате.
+
+    Returns:
+        Dict[int, Any]: Post или ArchivedPost по ID
+    """
+    attachments = 'attachments'
+    if bot_id is not None:
+        attachments = Prefetch('attachments', queryset=attachments_for_bot(bot_id))
+    posts = {
+        post.id: post
+        for post in published_posts().select_related('author').prefetch_related(attachments).filter(id__in=post_ids)
+    }
+    missing = [post_id for post_id in post_ids if post_id not in posts]
+    if missing:
+        for post in ArchivedPost.objects.select_related('author').prefetch_related('attachments').filter(id__in=missing):
+            posts[post.id] = post
+    return posts
 
-def get_post_by_id(post_id):
-    """Получение поста по ID с предзагрузкой автора"""
-    return Post.objects.select_related('author').get(id=post_id)
+def aware(value: Optional[datetime]) -> Optional[datetime]:
+    """Время без часового пояса считается временем TIME_ZONE"""
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
 
-def create_post(author_id, title, content):
-    """Создание нового поста"""
-    return Post.objects.create(
+def create_post(author_id, title, content, publish_at: Optional[datetime] = None):
+    """
+    Создание нового поста.
+
+    С publish_at в будущем пост скрыт до этого времени, а post_saved
+    выполняется в момент публикации.
+    """
+    post = Post.objects.create(
         author_id=author_id,
         title=title,
-        content=content
+        content=content,
+        publish_at=aware(publish_at),
     )
+    schedule_post_saved(post.id, created=True, publish_at=post.publish_at)
+    return post
+
+class PostVersionConflict(Exception):
+    """Пост изменен после получения клиентом версии (ETag)"""
+
+    def __init__(self, current_version: int):
+        super().__init__("Пост был изменен, получите актуальную версию")
+        self.current_version = current_version
+
+def _write_conditions(post_id: int, user_id: int, version: Optional[int]) -> Dict[str, Any]:
+    conditions = {'id': post_id, 'author_id': user_id}
+    if version is not None:
+        conditions['version'] = version
+    return conditions
+
+def _raise_write_failure(post_id: int, user_id: int, message: str) -> None:
+    """
+    Причина, по которой условная запись не затронула ни одной строки.
+
+    Выполняется только при отказе, успешная запись обходится одним запросом.
+    """
+    row = Post.objects.filter(id=post_id).values_list('author_id', 'version').first()
+    if row is None:
+        raise Post.DoesNotExist("Пост не найден")
+    author_id, current_version = row
+    if author_id != user_id:
+        raise PermissionError(message)
+    raise PostVersionConflict(current_version)
 
-def update_post(post_id: int, user_id: int, title: str = None, content: str = None) -> Dict[str, Any]:
+def update_post(post_id: int, user_id: int, title: str = None, content: str = None,
+                version: Optional[int] = None, publish_at: Optional[datetime] = None) -> Dict[str, Any]:
     """
     Обновление существующего поста.
-    
+
+    Проверка автора и версии выполняется в самом UPDATE, изменяются только
+    переданные поля, поэтому одновременные изменения не затирают друг
+    друга. Прежние заголовок и текст сохраняются в истории правок
+    (blog.revisions). Пустое изменение (без title, content и publish_at)
+    ничего не записывает и не меняет версию: возвращается текущий пост.
+
     Args:
         post_id (int): ID поста
         user_id (int): ID пользователя
         title (str, optional): Новый заголовок
         content (str, optional): Новое содержание
-        
+        version (int, optional): Ожидаемая версия поста (If-Match), None - любая
+        publish_at (datetime, optional): Новое время публикации
+
     Returns:
         Dict[str, Any]: Обновленный пост
-        
+
     Raises:
         Post.DoesNotExist: Если пост не найден
         PermissionError: Если пользователь не является автором поста
+        PostVersionConflict: Если версия поста не совпадает с ожидаемой
     """
-    post = get_object_or_404(Post, id=post_id)
-    if post.author.id != user_id:
-        raise PermissionError("Вы не можете редактировать этот пост")
-    
+    fields = ('id', 'title', 'content', 'created_at', 'version', 'publish_at', 'author__username')
+    if title is None and content is None and publish_at is None:
+        post = Post.objects.select_related('author').only(*fields).filter(
+            **_write_conditions(post_id, user_id, version)
+        ).first()
+        if post is None:
+            _raise_write_failure(post_id, user_id, "Вы не можете редактировать этот пост")
+        return _post_payload(post)
+
+    values = {'version': F('version') + 1}
+    if publish_at is not None:
+        values['publish_at'] = aware(publish_at)
+    edits = {}
     if title is not None:
-        post.title = title
+        edits['title'] = title
     if content is not None:
-        post.content = content
-    
-    post.save()
+        edits['content'] = content
+
+    with transaction.atomic():
+        # Первым выполняется условный UPDATE версии: он блокирует строку до
+        # конца транзакции, поэтому прочитанная следом прежняя редакция и
+        # записанная история соответствуют именно этому изменению
+        if not Post.objects.filter(**_write_conditions(post_id, user_id, version)).update(**values):
+            _raise_write_failure(post_id, user_id, "Вы не можете редактировать этот пост")
+        post = Post.objects.select_related('author').only(*fields).annotate(
+            last_snapshot=last_snapshot_version(),
+        ).get(id=post_id)
+        edits = {field: value for field, value in edits.items() if getattr(post, field) != value}
+        if edits:
+            record_revision(post.id, post.version - 1, post.title, post.content,
+                            next_content=edits.get('content', post.content), last_snapshot=post.last_snapshot)
+            # Записываются только переданные поля: остальные могли изменить другие клиенты
+            Post.objects.filter(id=post_id).update(**edits)
+            for field, value in edits.items():
+                setattr(post, field, value)
+    if publish_at is not None:
+        # UPDATE не отправляет post_save, планировщик процесса обновляется явно
+        PUBLICATIONS.schedule(post.id, post.publish_at)
+    schedule_post_saved(post.id, created=False, publish_at=post.publish_at)
+    return _post_payload(post)
+
+def _post_payload(post: Post) -> Dict[str, Any]:
     return {
         'id': post.id,
         'title': post.title,
         'content': post.content,
         'author': post.author.username,
-        'created_at': post.created_at.isoformat()
+        'created_at': post.created_at.isoformat(),
+        'publish_at': post.publish_at.isoformat() if post.publish_at else None,
+        'version': post.version,
     }
 
-def delete_post(post_id: int, user_id: int) -> None:
+def delete_post(post_id: int, user_id: int, version: Optional[int] = None) -> None:
     """
     Удаление поста.
-    
+
+    Автор и версия проверяются условием выборки удаляемого поста.
+    Файлы вложений удаляются из хранилища только после фиксации транзакции.
+
     Args:
         post_id (int): ID поста
         user_id (int): ID пользователя
-        
+        version (int, optional): Ожидаемая версия поста (If-Match), None - любая
+
     Raises:
         Post.DoesNotExist: Если пост не найден
         PermissionError: Если пользователь не является автором поста
+        PostVersionConflict: Если версия поста не совпадает с ожидаемой
+    """
+    posts = Post.objects.filter(**_write_conditions(post_id, user_id, version))
+    with transaction.atomic():
+        # Имена файлов читаются до DELETE: после него строк вложений уже нет
+        files = [
+            name for name in Attachment.objects.filter(post__in=posts.values('id')).values_list('file', flat=True)
+            if name
+        ]
+        # Каскад Django выбирает пост только по ID (текст не загружается) и
+        # удаляет вложения, их file_id и историю правок по ID поста
+        _, deleted = posts.only('id').delete()
+        if not deleted.get(Post._meta.label):
+            _raise_write_failure(post_id, user_id, "Вы не можете удалить этот пост")
+        if files:
+            # При откате транзакции файлы остаются вместе со строками вложений
+            transaction.on_commit(lambda: _delete_files(files))
+
+def _delete_files(names: List[str]) -> None:
+    storage = Attachment._meta.get_field('file').storage
+    for name in names:
+        storage.delete(name)
+
+
+def get_post_revisions(post_id: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    История правок опубликованного поста без восстановления текста.
+
+    Returns:
+        Tuple[int, List[Dict[str, Any]]]: Текущая версия и редакции от новых к старым
+
+    Raises:
+        Post.DoesNotExist: Если пост не найден или еще не опубликован
+    """
+    current_version = published_posts().values_list('version', flat=True).get(id=post_id)
+    revisions = PostRevision.objects.filter(post_id=post_id).values('version', 'title', 'replaced_at')
+    return current_version, list(revisions)
+
+def get_post_revision(post_id: int, version: int) -> Dict[str, Any]:
+    """
+    Редакция поста с восстановленным текстом.
+
+    Выполняет два запроса: текущий пост и строки истории от редакции до
+    ближайшей полной (blog.revisions).
+
+    Args:
+        post_id (int): ID поста
+        version (int): Версия поста
+
+    Raises:
+        Post.DoesNotExist: Если пост не найден или еще не опубликован
+        PostRevision.DoesNotExist: Если такой редакции нет в истории
+    """
+    post = published_posts().only('id', 'title', 'content', 'version', 'pruned_version').get(id=post_id)
+    if version == post.version:
+        return {'version': post.version, 'title': post.title, 'content': post.content}
+    if not post.pruned_version < version < post.version:
+        raise PostRevision.DoesNotExist("Редакция не найдена")
+    # Строки версии нет, если изменение этой версии не затронуло заголовок и
+    # текст (например, только publish_at): редакция совпадает с ближайшей
+    # более новой
+    rows = revision_chain(post_id, version, post.version)
+    if not rows:
+        return {'version': version, 'title': post.title, 'content': post.content}
+    return {'version': version, 'title': rows[-1].title, 'content': restore(rows, post.content)}
+
+
+def add_attachment(post_id: int, user_id: int, file, kind: str = Attachment.PHOTO, caption: str = '') -> Attachment:
+    """
+    Добавление вложения к посту.
+
+    Args:
+        post_id (int): ID поста
+        user_id (int): ID пользователя
+        file (File): Загруженный файл
+        kind (str): Тип вложения (photo или document)
+        caption (str): Подпись
+
+    Raises:
+        Post.DoesNotExist: Если пост не найден
+        PermissionError: Если пользователь не является автором поста
+        ValueError: Если тип вложения неизвестен
+    """
+    post = Post.objects.get(id=post_id)
+    if post.author_id != user_id:
+        raise PermissionError("Вы не можете изменять вложения этого поста")
+    if kind not in dict(Attachment.KIND_CHOICES):
+        raise ValueError(f"Неизвестный тип вложения: {kind}")
+    position = post.attachments.count()
+    return Attachment.objects.create(post=post, file=file, kind=kind, caption=caption, position=position)
+
+def delete_attachment(post_id: int, attachment_id: int, user_id: int) -> None:
+    """
+    Удаление вложения поста вместе с файлом.
+
+    Raises:
+        Attachment.DoesNotExist: Если вложение не найдено
+        PermissionError: Если пользователь не является автором поста
+    """
+    attachment = Attachment.objects.select_related('post').get(id=attachment_id, post_id=post_id)
+    if attachment.post.author_id != user_id:
+        raise PermissionError("Вы не можете изменять вложения этого поста")
+    attachment.file.delete(save=False)
+    attachment.delete()
+
+def save_telegram_file_ids(uploaded: List[Tuple[Attachment, str]], bot_id: int) -> None:
+    """
+    Сохранение file_id, полученных ботом от Telegram после загрузки вложений.
+
+    Запись выполняется только если файл и тип вложения не менялись с момента
+    отправки, иначе в кеш попал бы file_id старого файла.
     """
-    post = get_object_or_404(Post, id=post_id)
-    if post.author.id != user_id:
-        raise PermissionError("Вы не можете удалить этот пост")
-    
-    post.delete() 
\ No newline at end of file
+    with transaction.atomic():
+        current = set(
+            Attachment.objects.select_for_update()
+            .filter(id__in=[attachment.id for attachment, _ in uploaded])
+            .values_list('id', 'checksum', 'kind')
+        )
+        TelegramFile.objects.bulk_create(
+            [
+                TelegramFile(attachment_id=attachment.id, bot_id=bot_id, file_id=file_id)
+                for attachment, file_id in uploaded
+                if (attachment.id, attachment.checksum, attachment.kind) in current
+            ],
+            update_conflicts=True,
+            unique_fields=['attachment', 'bot_id'],
+            update_fields=['file_id'],
+        )
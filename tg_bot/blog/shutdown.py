@@ -0,0 +1,135 @@
+"""
+Плавная остановка процессов бота.
+
+По SIGTERM (остановка при деплое) и SIGINT бот перестает получать новые
+обновления, дожидается обработки уже полученных - вместе с отправкой
+ответов и вложений, задачами create_task и сохранением persistence - и
+только после этого завершается. На обработку отводится
+BOT_SHUTDOWN_TIMEOUT секунд: оставшиеся в очереди обновления после этого
+отбрасываются, а обработчик, не успевший завершиться, отменяется.
+
+Воркеры очереди обновлений (runbot --workers) по сигналу дообрабатывают
+текущее обновление и подтверждают обработанную часть пачки; остальное
+остается в таблице и будет обработано после перезапуска.
+"""
+
+from telegram import Update
+from typing import List
+import asyncio
+import logging
+import signal
+
+logger = logging.getLogger(__name__)
+
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+# Закрытые атрибуты Application, которые используются при остановке по таймауту
+APPLICATION_PRIVATE_ATTRIBUTES = (
+    '_Application__create_task_tasks',
+    '_Application__update_fetcher_task',
+    '_Application__update_persistence_task',
+    '_Application__update_persistence_event',
+)
+
+
+def install_stop_signals(stopping: asyncio.Event) -> None:
+    """Установка stopping по SIGINT / SIGTERM в текущем цикле событий"""
+    loop = asyncio.get_running_loop()
+    for sig in STOP_SIGNALS:
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows или цикл событий не в главном потоке
+            logger.warning('Не удалось установить обработчик сигнала %s', sig.name)
+
+
+def discard_updates(queue: asyncio.Queue) -> int:
+    """
+    Удаление необработанных обновлений из очереди Application.
+
+    Вызывается только после остановки задачи, читающей очередь
+    (application_tasks): вместе с обновлениями удаляется и сигнал остановки
+    Application.stop(), которого эта задача ждет.
+    """
+    dropped = 0
+    while True:
+        try:
+            item = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return dropped
+        queue.task_done()
+        if isinstance(item, Update):
+            dropped += 1
+
+
+def application_tasks(application) -> List[asyncio.Task]:
+    """
+    Задачи запущенного Application: чтение очереди обновлений и обработчики.
+
+    В PTB 20 нет публичного способа прервать их, поэтому задачи берутся из
+    закрытых атрибутов Application (APPLICATION_PRIVATE_ATTRIBUTES). Они
+    читаются без значений по умолчанию: после их переименования в PTB
+    остановка завершится AttributeError, а не пропустит задачи.
+    """
+    tasks = list(application._Application__create_task_tasks)
+    fetcher = application._Application__update_fetcher_task
+    if fetcher is not None:
+        tasks.append(fetcher)
+    return [task for task in tasks if not task.done()]
+
+
+async def cancel_tasks(tasks: List[asyncio.Task]) -> None:
+    """Отмена задач с ожиданием их завершения"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def stop_persistence_loop(application) -> None:
+    """Остановка периодического сохранения persistence - последний шаг Application.stop()"""
+    task = application._Application__update_persistence_task
+    if task is not None and not task.done():
+        application._Application__update_persistence_event.set()
+        await asyncio.gather(task, return_exceptions=True)
+        application._Application__update_persistence_event.clear()
+
+
+async def stop_application(application, timeout: float) -> bool:
+    """
+    Остановка запущенного Application с обработкой полученных обновлений.
+
+    Если обработка не уложилась в timeout, задачи приложения отменяются и
+    дожидаются завершения, оставшиеся обновления отбрасываются, а данные
+    persistence сохраняются - после этого Application можно закрыть
+    shutdown().
+
+    Args:
+        application (Application): Запущенное приложение бота
+        timeout (float): Время на обработку полученных обновлений, секунды
+
+    Returns:
+        bool: True, если все обновления обработаны до истечения времени
+    """
+    if application.updater is not None and application.updater.running:
+        # Новые обновления больше не запрашиваются
+        await application.updater.stop()
+    logger.info('Остановка бота, обновлений в очереди: %s', application.update_queue.qsize())
+
+    stopping = asyncio.ensure_future(application.stop())
+    done, _ = await asyncio.wait({stopping}, timeout=timeout)
+    if done:
+        stopping.result()
+        return True
+
+    await cancel_tasks([stopping])
+    # Сначала останавливается чтение очереди, иначе оно запустит
+    # обработчики отброшенных обновлений
+    await cancel_tasks(application_tasks(application))
+    dropped = discard_updates(application.update_queue)
+    logger.warning('Обработка не завершилась за %.0f с, отброшено обновлений: %s', timeout, dropped)
+    await stop_persistence_loop(application)
+    if application.persistence is not None:
+        # Application.stop() не дошел до сохранения данных
+        await application.update_persistence()
+        await application.persistence.flush()
+    return False
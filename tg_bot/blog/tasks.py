@@ -0,0 +1,40 @@
+"""
+Фоновые задачи блога.
+
+После создания или изменения поста воркер отправляет сигнал post_saved.
+Медленные побочные эффекты (уведомления, индексация, прогрев кешей)
+подключаются к нему обычными получателями и выполняются вне HTTP-запроса:
+
+    @receiver(post_saved)
+    def notify_subscribers(sender, post_id, created, **kwargs):
+        ...
+"""
+
+from django.dispatch import Signal
+from django.utils import timezone
+from jobs.queue import enqueue_on_commit, task
+from .models import Post
+
+# Аргументы: post_id, created
+post_saved = Signal()
+
+
+@task('blog.post_saved')
+def send_post_saved(post_id: int, created: bool) -> None:
+    # Публикацию перенесли на более позднее время: сигнал отправит задача,
+    # поставленная на новое время
+    if Post.objects.filter(id=post_id, publish_at__gt=timezone.now()).exists():
+        return
+    post_saved.send(sender=Post, post_id=post_id, created=created)
+
+
+def schedule_post_saved(post_id: int, created: bool, publish_at=None) -> None:
+    """
+    Постановка post_saved в очередь после фиксации транзакции, если у сигнала есть получатели.
+
+    Для поста с отложенной публикацией задача запускается в publish_at:
+    получатели не узнают о посте, пока он скрыт.
+    """
+    if post_saved.has_listeners(Post):
+        delay = max((publish_at - timezone.now()).total_seconds(), 0) if publish_at else 0
+        enqueue_on_commit('blog.post_saved', {'post_id': post_id, 'created': created}, delay=delay)
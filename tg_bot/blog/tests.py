@@ -2,11 +2,75 @@ from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.conf import settings
 import jwt
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.utils import timezone
+from django.db import DatabaseError, connection
+from django.db.models import Max
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync, sync_to_async
 from datetime import datetime, timedelta
-from .models import Post
+from contextlib import redirect_stdout, suppress
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+import asyncio
+import gzip
+import httpx
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from telegram import Bot, Update
+from telegram.ext import Application
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+from tg_bot import metrics
+from tg_bot.benchmarks import BenchmarkResult, compare, run_benchmarks
+from tg_bot.startup import TOTAL_LABEL, StartupProfile
+from tg_bot import health
+from tg_bot.lifespan import Lifespan
+from tg_bot import background
+from tg_bot.admin_tools import estimated_count
+from tg_bot.profiling import load_profiles
+from tg_bot import slowlog
+from tg_bot.throttling import LOCAL_BUCKETS, CacheBucketStore, LocalBucketStore, parse_rate
+from users.services import issue_tokens
+from tg_bot.middleware import select_encoding
+from tg_bot.renderers import MessagePackRenderer, msgpack
+from .counters import POST_VIEWS, ViewCounter
+from .fake_telegram import FakeTelegramServer
+from .fields import PLAIN, ZLIB, CompressedText
+from .loaders import PostLoader
+from .loadtest import LoadDriver
+from .media import send_attachments
+from .models import ArchivedAttachment, ArchivedPost, Attachment, BotState, BotUpdate, Post, PostRevision, TelegramFile
+from .persistence import DjangoPersistence
+from .revisions import apply_delta, make_delta
+from .services import (
+    PostVersionConflict, attachments_for_bot, delete_post, get_post_by_id, get_post_revision, get_post_titles,
+    update_post,
+)
+from .scheduler import PublishScheduler, post_published
+from .shutdown import APPLICATION_PRIVATE_ATTRIBUTES, application_tasks, discard_updates
+from .transport import (
+    PTB_UPLOAD_WRITE_TIMEOUT, UPLOAD_WRITE_TIMEOUT, InstrumentedHTTPXRequest, UploadTimeoutBot, build_requests,
+)
+from .update_queue import claim_batch, enqueue_updates, get_chat_id, partitions_for_worker, process_batch
+from .bot import BotConfig, BotGroup, TelegramBot, bot_configs
 
 User = get_user_model()
 
+# Лимиты частоты отключены: корзины в памяти общие для всех тестов процесса
+@override_settings(API_THROTTLE_RATES={})
 class BlogAPITests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -146,4 +210,1742 @@ class BlogAPITests(TestCase):
         response = self.client.delete(f'/api/blog/posts/{self.post.id}', **headers)
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json()['message'], 'Вы не можете удалить этот пост')
-        self.assertTrue(Post.objects.filter(id=self.post.id).exists()) 
\ No newline at end of file
+        self.assertTrue(Post.objects.filter(id=self.post.id).exists()) 
+
+class APIResponseFormatTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        for index in range(20):
+            Post.objects.create(title=f'Post {index}', content='Content ' * 100, author=self.user)
+
+    def test_default_json(self):
+        """Тест ответа в JSON без заголовка Accept"""
+        response = self.client.get('/api/blog/posts')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+        self.assertNotIn('Content-Encoding', response)
+
+    @skipUnless(MessagePackRenderer.is_available(), 'msgpack не установлен')
+    def test_msgpack(self):
+        """Тест ответа в MessagePack по заголовку Accept"""
+        response = self.client.get('/api/blog/posts', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(len(msgpack.unpackb(response.content)), 20)
+
+    def test_unsupported_accept_falls_back_to_json(self):
+        """Тест выбора JSON для неподдерживаемого формата"""
+        response = self.client.get('/api/blog/posts', HTTP_ACCEPT='text/html')
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+
+    def test_gzip(self):
+        """Тест сжатия большого ответа gzip"""
+        response = self.client.get('/api/blog/posts', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 20)
+
+    @override_settings(API_COMPRESSION_MIN_SIZE=10 ** 9)
+    def test_small_response_not_compressed(self):
+        """Тест отсутствия сжатия для ответа меньше порога"""
+        response = self.client.get('/api/blog/posts', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_select_encoding(self):
+        """Тест выбора кодировки по Accept-Encoding"""
+        self.assertEqual(select_encoding('gzip, zstd;q=0.5', ['zstd', 'gzip']), 'gzip')
+        self.assertEqual(select_encoding('*', ['zstd', 'gzip']), 'zstd')
+        self.assertEqual(select_encoding('gzip;q=0', ['gzip']), '')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        Post.objects.create(title='Test Post', content='Test Content', author=self.user)
+
+    def test_request_metrics(self):
+        """Тест записи латентности и числа SQL-запросов по маршруту"""
+        route = 'api/blog/posts'
+        before = metrics.HTTP_REQUEST_DURATION.count(route, 'GET', '200')
+        self.client.get('/api/blog/posts')
+        self.assertEqual(metrics.HTTP_REQUEST_DURATION.count(route, 'GET', '200'), before + 1)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{route="api/blog/posts",method="GET",status="200"', body)
+        self.assertIn('http_request_db_queries_count{route="api/blog/posts"}', body)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'], METRICS_TOKEN='secret')
+    def test_metrics_access(self):
+        """Тест доступа к /metrics только с разрешенного адреса или с токеном"""
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='10.0.0.5').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_histogram_threads(self):
+        """Тест сложения значений гистограммы из нескольких потоков"""
+        histogram = metrics.Histogram('test_seconds', 'test', ('name',), buckets=(1.0,))
+
+        def worker():
+            for _ in range(100):
+                histogram.observe(0.5, 'a')
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        histogram.observe(2.0, 'a')
+        self.assertEqual(histogram.count('a'), 401)
+        self.assertIn('test_seconds_bucket{name="a",le="1"} 400', histogram.collect())
+        self.assertIn('test_seconds_bucket{name="a",le="+Inf"} 401', histogram.collect())
+
+    def test_track_handler(self):
+        """Тест записи латентности обработчика бота"""
+        class Bot:
+            @metrics.track_handler
+            async def _handle_test(self, update, context):
+                return 'done'
+
+        before = metrics.BOT_HANDLER_DURATION.count('', 'test', 'ok')
+        result = asyncio.run(Bot()._handle_test(SimpleNamespace(message=None), None))
+        self.assertEqual(result, 'done')
+        self.assertEqual(metrics.BOT_HANDLER_DURATION.count('', 'test', 'ok'), before + 1)
+
+
+class QueryBudgetTests(TestCase):
+    def test_query_budgets(self):
+        """Тест соблюдения бюджетов SQL-запросов для эндпоинтов и сервисов бота"""
+        for result in run_benchmarks(posts=50, repeat=1):
+            self.assertEqual(result.errors, [], result.name)
+
+    def test_compare_with_baseline(self):
+        """Тест обнаружения регрессий относительно базовой линии"""
+        baseline = {'case': {'median_ms': 10.0, 'p95_ms': 12.0, 'queries': 1}}
+        fast = BenchmarkResult('case', median_ms=11.0, p95_ms=12.0, queries=1, query_budget=1)
+        slow = BenchmarkResult('case', median_ms=20.0, p95_ms=25.0, queries=2, query_budget=2)
+        self.assertEqual(compare([fast], baseline, threshold=0.25), [])
+        self.assertEqual(len(compare([slow], baseline, threshold=0.25)), 2)
+
+
+class FakeTelegramServerTests(TestCase):
+    def setUp(self):
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+
+    def call(self, method, **params):
+        request = urllib.request.Request(
+            f'{self.server.base_url}TOKEN/{method}',
+            data=urllib.parse.urlencode(params).encode(),
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_get_updates_and_send_message(self):
+        """Тест выдачи обновлений и ответа на sendMessage"""
+        update_id = self.server.push_update({'message': {'text': '/posts'}})
+        status, body = self.call('getUpdates', offset=0, timeout=1)
+        self.assertEqual(body['result'][0]['update_id'], update_id)
+        status, body = self.call('getUpdates', offset=update_id + 1, timeout=0)
+        self.assertEqual(body['result'], [])
+
+        status, body = self.call('sendMessage', chat_id=42, text='hi')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['result']['chat']['id'], 42)
+
+    def test_rate_limit(self):
+        """Тест ответа 429 с retry_after"""
+        self.server.error_rate = 1.0
+        status, body = self.call('answerCallbackQuery', callback_query_id='1')
+        self.assertEqual(status, 429)
+        self.assertEqual(body['parameters']['retry_after'], 1)
+        self.assertEqual(self.server.stats['answerCallbackQuery:429'], 1)
+
+    def test_driver_matches_responses(self):
+        """Тест сопоставления ответов бота с отправленными обновлениями"""
+        driver = LoadDriver(self.server, [1], chats=1, rate=1000, duration=0.002, callback_ratio=1.0,
+                            response_timeout=0)
+        driver._send(driver.chats[0])
+        update = self.server._updates[-1]['callback_query']
+        driver.on_api_call('editMessageText', {'message_id': str(update['message']['message_id'])}, True)
+        self.assertEqual(driver.report.completed, 1)
+        self.assertEqual(driver._pending_count(), 0)
+
+
+class StartupProfileTests(TestCase):
+    def test_phase_records_imported_modules(self):
+        """Тест учета времени и импортированных модулей этапа запуска"""
+        profile = StartupProfile()
+        sys.modules.pop('this', None)
+        with redirect_stdout(io.StringIO()), profile.phase('import this'):
+            import this  # noqa: F401
+        name, duration, packages = profile.phases[0]
+        self.assertEqual(name, 'import this')
+        self.assertEqual(packages, {'this': 1})
+        self.assertTrue(profile.lines()[-1].startswith(TOTAL_LABEL))
+
+
+@override_settings(BOT_QUEUE_PARTITIONS=4, TELEGRAM_WEBHOOK_SECRET='secret')
+class UpdateQueueTests(TestCase):
+    def message(self, update_id, chat_id, text='/posts'):
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': 1700000000,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'},
+                'text': text,
+            },
+        }
+
+    def test_partitions(self):
+        """Тест распределения партиций между воркерами"""
+        self.assertEqual(partitions_for_worker(0, 2), [0, 2])
+        self.assertEqual(partitions_for_worker(1, 2), [1, 3])
+
+    def test_get_chat_id(self):
+        """Тест ID чата обновления и ошибки на некорректном объекте обновления"""
+        self.assertEqual(get_chat_id(self.message(1, 7)), 7)
+        self.assertEqual(get_chat_id({'callback_query': {'from': {'id': 5}, 'message': {'chat': {'id': 8}}}}), 8)
+        self.assertEqual(get_chat_id({'callback_query': {'from': {'id': 5}}}), 5)
+        self.assertEqual(get_chat_id({'inline_query': {'from': {'id': 6}}}), 6)
+        self.assertIsNone(get_chat_id({'update_id': 1}))
+        for payload in ({'message': {}}, {'message': 5}, {'message': {'chat': []}},
+                        {'callback_query': []}, {'callback_query': {'from': None}}):
+            with self.assertRaises(ValueError):
+                get_chat_id(payload)
+
+    def test_enqueue_and_claim_in_order(self):
+        """Тест записи в очередь и выдачи обновлений партиции по порядку"""
+        enqueue_updates([self.message(1, 6), self.message(2, 5), self.message(3, 2)])
+        enqueue_updates([self.message(1, 6)])  # повтор не дублируется
+        self.assertEqual(BotUpdate.objects.count(), 3)
+        batch = claim_batch(partitions_for_worker(0, 2), 10)
+        self.assertEqual([row.update_id for row in batch], [1, 3])
+
+    def test_process_batch(self):
+        """Тест обработки пачки и подтверждения обновлений"""
+        enqueue_updates([self.message(1, 2, '/start'), self.message(2, 2, '/help')])
+        processed = []
+
+        class Application:
+            bot = None
+
+            async def process_update(self, update):
+                processed.append(update.message.text)
+
+        count = async_to_sync(process_batch)(Application(), [2], 10)
+        self.assertEqual(count, 2)
+        self.assertEqual(processed, ['/start', '/help'])
+        self.assertFalse(BotUpdate.objects.exists())
+
+    def test_process_batch_stopping(self):
+        """Тест подтверждения только обработанных обновлений после сигнала остановки"""
+        enqueue_updates([self.message(1, 2), self.message(2, 2), self.message(3, 2)])
+        stopping = asyncio.Event()
+
+        class Application:
+            bot = None
+
+            async def process_update(self, update):
+                stopping.set()
+
+        count = async_to_sync(process_batch)(Application(), [2], 10, stopping)
+        self.assertEqual(count, 1)
+        self.assertEqual(list(BotUpdate.objects.values_list('update_id', flat=True)), [2, 3])
+
+    def test_webhook(self):
+        """Тест приема обновления через webhook с проверкой секрета"""
+        data = json.dumps(self.message(10, 7))
+        response = self.client.post('/api/blog/telegram/webhook', data, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/api/blog/telegram/webhook', data, content_type='application/json',
+                                    HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BotUpdate.objects.get().chat_id, 7)
+
+        # Заголовок с не-ASCII символами - неверный секрет, а не ошибка сервера
+        response = self.client.post('/api/blog/telegram/webhook', data, content_type='application/json',
+                                    HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='секрет')
+        self.assertEqual(response.status_code, 403)
+
+        for body in ('{"update_id": ', '[1]', '{"message": {}}', '{"update_id": 11, "message": {}}',
+                     '{"update_id": 12, "message": 5}', '{"update_id": 13, "message": {"chat": {"id": "7"}}}',
+                     '{"update_id": 14, "callback_query": []}', '{"update_id": 15, "callback_query": {}}'):
+            response = self.client.post('/api/blog/telegram/webhook', body, content_type='application/json',
+                                        HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='secret')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(BotUpdate.objects.count(), 1)
+
+
+class DjangoPersistenceTests(TestCase):
+    def test_write_behind_and_lazy_load(self):
+        """Тест пакетной записи изменений и ленивой загрузки user_data"""
+        async def scenario():
+            persistence = DjangoPersistence(1, update_interval=60, write_delay=0)
+            await persistence.update_user_data(1, {'lang': 'ru'})
+            await persistence.update_chat_data(10, {'page': 2})
+            await persistence.update_bot_data({'version': 1})
+            await persistence.flush()
+
+            restarted = DjangoPersistence(1, update_interval=60)
+            self.assertEqual(await restarted.get_user_data(), {})
+            user_data = {}
+            await restarted.refresh_user_data(1, user_data)
+            self.assertEqual(await restarted.get_bot_data(), {'version': 1})
+            return user_data
+
+        self.assertEqual(async_to_sync(scenario)(), {'lang': 'ru'})
+        self.assertEqual(BotState.objects.count(), 3)
+
+    def test_upsert_and_drop(self):
+        """Тест обновления существующей записи и удаления данных чата"""
+        async def scenario():
+            persistence = DjangoPersistence(1, update_interval=60)
+            await persistence.update_chat_data(10, {'page': 1})
+            await persistence.flush()
+            await persistence.update_chat_data(10, {'page': 3})
+            await persistence.update_chat_data(11, {'page': 1})
+            await persistence.flush()
+            await persistence.drop_chat_data(11)
+            await persistence.flush()
+
+        async_to_sync(scenario)()
+        self.assertEqual(list(BotState.objects.values_list('key', 'data')), [('10', {'page': 3})])
+
+    def test_data_scoped_by_bot(self):
+        """Тест раздельного хранения данных ботов группы с одинаковыми ключами"""
+        async def scenario():
+            first = DjangoPersistence(1, update_interval=60, write_delay=0)
+            second = DjangoPersistence(2, update_interval=60, write_delay=0)
+            await first.update_user_data(7, {'lang': 'ru'})
+            await second.update_user_data(7, {'lang': 'en'})
+            await first.update_bot_data({'bot': 'first'})
+            await second.update_bot_data({'bot': 'second'})
+            await first.flush()
+            await second.flush()
+
+            restarted = DjangoPersistence(1, update_interval=60)
+            user_data = {}
+            await restarted.refresh_user_data(7, user_data)
+            return user_data, await restarted.get_bot_data()
+
+        self.assertEqual(async_to_sync(scenario)(), ({'lang': 'ru'}, {'bot': 'first'}))
+        self.assertEqual(BotState.objects.count(), 4)
+
+    def test_unchanged_data_not_written(self):
+        """Тест пропуска записи данных, не изменившихся с загрузки или прошлой записи"""
+        BotState.objects.create(bot_id=1, kind='user', key='1', data={'lang': 'ru'})
+
+        async def scenario():
+            persistence = DjangoPersistence(1, update_interval=60, write_delay=0)
+            user_data = {}
+            await persistence.refresh_user_data(1, user_data)
+            await persistence.refresh_chat_data(10, {})
+            await persistence.get_bot_data()
+            # Проход Application по пользователю и чату, данные которых обработчики не меняли
+            await persistence.update_user_data(1, dict(user_data))
+            await persistence.update_chat_data(10, {})
+            await persistence.update_bot_data({})
+            self.assertEqual(persistence._dirty, {})
+            await persistence.update_user_data(1, {'lang': 'en'})
+            await persistence.flush()
+            await persistence.update_user_data(1, {'lang': 'en'})
+            self.assertEqual(persistence._dirty, {})
+
+        # Три загрузки и одна запись (upsert в SAVEPOINT)
+        with self.assertNumQueries(6):
+            async_to_sync(scenario)()
+        self.assertEqual(list(BotState.objects.values_list('key', 'data')), [('1', {'lang': 'en'})])
+
+    def test_failed_delayed_write_logged(self):
+        """Тест записи в лог ошибки отложенной записи и сохранения изменений в буфере"""
+        async def scenario():
+            persistence = DjangoPersistence(1, update_interval=60, write_delay=0)
+            with mock.patch('blog.persistence.write_states', side_effect=DatabaseError('database is locked')):
+                await persistence.update_chat_data(10, {'page': 1})
+                await persistence._write_task
+            return persistence
+
+        with self.assertLogs('blog.persistence', 'ERROR') as logs:
+            persistence = async_to_sync(scenario)()
+        self.assertIn('Не удалось сохранить данные бота', logs.output[0])
+        self.assertEqual(persistence._dirty, {('chat', '10'): {'page': 1}})
+
+
+class AttachmentTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.other_user = User.objects.create_user(username='other', password='testpass123')
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+
+    def token(self, user):
+        return jwt.encode(
+            {'user_id': user.id, 'exp': datetime.utcnow() + timedelta(minutes=60)},
+            settings.SIMPLE_JWT['SIGNING_KEY'],
+            algorithm=settings.SIMPLE_JWT['ALGORITHM']
+        )
+
+    def attach(self, name='image.jpg', content=b'image', kind=Attachment.PHOTO):
+        return Attachment.objects.create(post=self.post, file=ContentFile(content, name=name), kind=kind)
+
+    def test_upload_and_get(self):
+        """Тест загрузки вложения через API и выдачи его в посте"""
+        url = f'/api/blog/posts/{self.post.id}/attachments'
+        upload = SimpleUploadedFile('doc.pdf', b'%PDF', content_type='application/pdf')
+        response = self.client.post(url, {'file': upload, 'kind': 'document', 'caption': 'Файл'},
+                                    HTTP_AUTHORIZATION=f'Bearer {self.token(self.other_user)}')
+        self.assertEqual(response.status_code, 400)
+
+        upload.seek(0)
+        response = self.client.post(url, {'file': upload, 'kind': 'document', 'caption': 'Файл'},
+                                    HTTP_AUTHORIZATION=f'Bearer {self.token(self.user)}')
+        self.assertEqual(response.status_code, 201)
+
+        attachments = self.client.get(f'/api/blog/posts/{self.post.id}').json()['attachments']
+        self.assertEqual(len(attachments), 1)
+        self.assertEqual(attachments[0]['kind'], 'document')
+        self.assertIn('/media/attachments/', attachments[0]['url'])
+
+    def test_file_id_invalidated_on_change(self):
+        """Тест сброса кеша file_id при замене файла или типа вложения"""
+        attachment = self.attach()
+        TelegramFile.objects.create(attachment=attachment, bot_id=1, file_id='cached')
+
+        attachment = Attachment.objects.get(id=attachment.id)
+        attachment.file = ContentFile(b'image', name='same.jpg')
+        attachment.save()
+        self.assertTrue(attachment.telegram_files.exists())
+
+        attachment.file = ContentFile(b'other image', name='other.jpg')
+        attachment.save()
+        self.assertFalse(attachment.telegram_files.exists())
+
+        TelegramFile.objects.create(attachment=attachment, bot_id=1, file_id='cached')
+        attachment = Attachment.objects.get(id=attachment.id)
+        attachment.kind = Attachment.DOCUMENT
+        attachment.save()
+        self.assertFalse(attachment.telegram_files.exists())
+
+    def test_send_reuses_file_id(self):
+        """Тест загрузки файлов один раз и повторной отправки по file_id"""
+        self.attach('1.jpg', b'one')
+        self.attach('2.jpg', b'two')
+        self.attach('3.pdf', b'three', kind=Attachment.DOCUMENT)
+        calls = []
+
+        class Bot:
+            token = '123:TEST'
+
+            async def send_media_group(self, chat_id, media):
+                calls.append(('album', [item.media for item in media]))
+                return [
+                    SimpleNamespace(photo=[SimpleNamespace(file_id=f'photo-{index}')])
+                    for index, _ in enumerate(media)
+                ]
+
+            async def send_document(self, chat_id, document, **kwargs):
+                calls.append(('document', document))
+                return SimpleNamespace(document=SimpleNamespace(file_id='doc'))
+
+        def send():
+            return async_to_sync(send_attachments)(Bot(), 1, list(attachments_for_bot(123).filter(post=self.post)))
+
+        self.assertEqual(send(), 3)
+        self.assertEqual(
+            list(attachments_for_bot(123).filter(post=self.post).values_list('telegram_file_id', flat=True)),
+            ['photo-0', 'photo-1', 'doc'],
+        )
+        self.assertEqual(len(calls), 2)
+        self.assertNotIsInstance(calls[0][1][0], str)
+
+        calls.clear()
+        self.assertEqual(send(), 0)
+        self.assertEqual(calls, [('album', ['photo-0', 'photo-1']), ('document', 'doc')])
+
+
+class PostAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass123', email='a@example.com')
+        self.author = User.objects.create_user(username='writer', password='testpass123')
+        Post.objects.bulk_create([
+            Post(title=f'Post {index}', content='needle' if index == 0 else 'text', author=self.author)
+            for index in range(30)
+        ])
+        self.client.force_login(self.admin)
+
+    def changelist(self, **params):
+        return self.client.get('/admin/blog/post/', params)
+
+    def test_query_count_independent_of_size(self):
+        """Тест постоянного числа запросов страницы списка постов"""
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.changelist().status_code, 200)
+        Post.objects.bulk_create([Post(title='More', content='', author=self.author) for _ in range(100)])
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.changelist().status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+    @override_settings(ADMIN_EXACT_COUNT_THRESHOLD=10)
+    def test_estimated_count(self):
+        """Тест оценки количества по первичному ключу и ограниченного подсчета с фильтром"""
+        Post.objects.filter(title='Post 29').delete()
+        self.assertEqual(estimated_count(Post.objects.all()), Post.objects.aggregate(Max('pk'))['pk__max'])
+        with override_settings(ADMIN_COUNT_LIMIT=5):
+            self.assertEqual(estimated_count(Post.objects.filter(author=self.author)), 5)
+
+    def test_search_and_author_filter(self):
+        """Тест поиска по началу заголовка без поиска по тексту и фильтра по автору"""
+        response = self.changelist(q='Post 1')
+        self.assertEqual(response.context['cl'].result_count, 11)
+        response = self.changelist(q='needle')
+        self.assertEqual(response.context['cl'].result_count, 0)
+        response = self.changelist(author=self.author.id)
+        self.assertEqual(response.context['cl'].result_count, 30)
+        self.assertContains(response, 'writer')
+
+
+class CompressedContentTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='writer', password='testpass123')
+        self.long_text = 'Длинный пост. ' * 500
+        self.post = Post.objects.create(title='Long', content=self.long_text, author=self.author)
+
+    def raw_content(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM blog_post WHERE id = %s', [post_id])
+            return bytes(cursor.fetchone()[0])
+
+    def test_long_content_compressed(self):
+        """Тест сжатого хранения длинного текста и хранения короткого как есть"""
+        raw = self.raw_content(self.post.id)
+        self.assertEqual(raw[:1], ZLIB)
+        self.assertLess(len(raw), len(self.long_text.encode()) / 10)
+        short = Post.objects.create(title='Short', content='Коротко', author=self.author)
+        self.assertEqual(self.raw_content(short.id), PLAIN + 'Коротко'.encode())
+        self.assertEqual(Post.objects.get(id=self.post.id).content, self.long_text)
+
+    def test_lazy_decompression(self):
+        """Тест распаковки только при обращении и сохранения без повторного сжатия"""
+        post = Post.objects.get(id=self.post.id)
+        self.assertIsInstance(post.__dict__['content'], CompressedText)
+        raw = self.raw_content(post.id)
+        with mock.patch('blog.fields.zlib.compress') as compress:
+            post.title = 'Renamed'
+            post.save()
+        compress.assert_not_called()
+        self.assertEqual(self.raw_content(post.id), raw)
+        self.assertEqual(post.content, self.long_text)
+
+    def test_titles_without_content(self):
+        """Тест загрузки списка для бота без текста постов"""
+        with self.assertNumQueries(1):
+            posts = get_post_titles()
+            self.assertEqual([post.title for post in posts], ['Long'])
+        self.assertIn('content', posts[0].get_deferred_fields())
+
+
+class PostViewsTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username='writer', password='testpass123')
+        self.first = Post.objects.create(title='First', content='Text', author=self.author)
+        self.second = Post.objects.create(title='Second', content='Text', author=self.author)
+        POST_VIEWS.reset()
+        self.addCleanup(POST_VIEWS.reset)
+
+    def test_views_buffered_until_flush(self):
+        """Тест учета просмотров в памяти без записи в базу на каждый просмотр"""
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/blog/posts/{self.first.id}')
+        self.assertEqual(response.status_code, 200)
+        self.client.get(f'/api/blog/posts/{self.first.id}')
+        self.client.get('/api/blog/posts/999999')
+        self.assertEqual(POST_VIEWS.pending(), 2)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.views, 0)
+
+    def test_flush_single_update(self):
+        """Тест записи приращений по нескольким постам одним UPDATE"""
+        counter = ViewCounter()
+        for _ in range(3):
+            counter.add(self.first.id)
+        counter.add(self.second.id)
+        counter.add(999999)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(counter.flush(), 2)
+        self.assertEqual(len(captured), 1)
+        self.assertIn('CASE', captured[0]['sql'])
+        self.assertEqual(counter.pending(), 0)
+        counter.add(self.first.id)
+        counter.flush()
+        self.assertEqual(
+            dict(Post.objects.values_list('id', 'views')), {self.first.id: 4, self.second.id: 1}
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(counter.flush(), 0)
+
+    def test_failed_flush_keeps_counts(self):
+        """Тест возврата приращений в буфер при ошибке записи"""
+        counter = ViewCounter()
+        counter.add(self.first.id, 5)
+        with mock.patch('blog.counters.apply_view_counts', side_effect=DatabaseError), \
+                self.assertLogs('blog.counters', 'ERROR'):
+            self.assertEqual(counter.flush(), 0)
+        self.assertEqual(counter.pending(), 5)
+
+    def test_stop_flushes_buffer(self):
+        """Тест записи остатка буфера при остановке фоновой записи"""
+        counter = ViewCounter()
+        # Фоновый поток не успевает сработать, запись делает stop()
+        with mock.patch.object(counter, '_loop'):
+            counter.start(interval=3600)
+            counter.add(self.second.id, 2)
+            counter.stop()
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.views, 2)
+
+    def test_restart_after_fork(self):
+        """Тест запуска фоновой записи, если объект потока унаследован при fork"""
+        counter = ViewCounter()
+        # В дочернем процессе поток родителя остается объектом, который не работает
+        inherited = threading.Thread(target=lambda: None)
+        inherited.start()
+        inherited.join()
+        counter._thread = inherited
+        counter.start(interval=3600)
+        try:
+            self.assertIsNot(counter._thread, inherited)
+            self.assertTrue(counter._thread.is_alive())
+        finally:
+            counter.stop()
+
+    def test_most_viewed(self):
+        """Тест списка самых просматриваемых постов по записанным просмотрам"""
+        for _ in range(3):
+            self.client.get(f'/api/blog/posts/{self.second.id}')
+        self.client.get(f'/api/blog/posts/{self.first.id}')
+        self.assertEqual(self.client.get('/api/blog/posts/popular').json()[0]['views'], 0)
+        POST_VIEWS.flush()
+        response = self.client.get('/api/blog/posts/popular?limit=1')
+        self.assertEqual(response.json(), [
+            {'id': self.second.id, 'title': 'Second', 'author': 'writer', 'views': 3},
+        ])
+        detail = self.client.get(f'/api/blog/posts/{self.first.id}').json()
+        self.assertEqual(detail['views'], 1)
+
+
+class HealthCheckTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(health, '_warmed', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_healthz_without_database(self):
+        """Тест liveness-проверки без запросов к базе"""
+        with self.assertNumQueries(0):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_readyz_warms_caches_once(self):
+        """Тест проверки базы и однократного прогрева кешей"""
+        with mock.patch('tg_bot.health.REVOCATIONS.refresh') as refresh:
+            first = self.client.get('/readyz')
+            second = self.client.get('/readyz')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json()['checks'], {'database': 'ok', 'caches': 'ok'})
+        refresh.assert_called_once_with(force=True)
+
+    def test_readyz_database_unavailable(self):
+        """Тест ответа 503 при недоступной базе"""
+        with mock.patch('tg_bot.health.check_database', side_effect=DatabaseError('down')), \
+                self.assertLogs('tg_bot.health', 'WARNING'):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['database'], 'error')
+
+
+@override_settings(BOT_PERSISTENCE=False)
+class GracefulShutdownTests(TestCase):
+    def setUp(self):
+        self.server = FakeTelegramServer(latency=0.2).start()
+        self.addCleanup(self.server.stop)
+
+    @staticmethod
+    def message(text):
+        return {'message': {
+            'message_id': 1,
+            'date': int(datetime.now().timestamp()),
+            'chat': {'id': 7, 'type': 'private'},
+            'from': {'id': 7, 'is_bot': False, 'first_name': 'User'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+        }}
+
+    def serve_until_first_reply(self, updates):
+        """Запуск бота и сигнал остановки после первого ответа"""
+        for _ in range(updates):
+            self.server.push_update(self.message('/start'))
+        bot = TelegramBot(token='123:TEST', base_url=self.server.base_url)
+
+        async def main():
+            stopping = asyncio.Event()
+            loop = asyncio.get_running_loop()
+
+            def on_api_call(method, params, ok):
+                if method == 'sendMessage':
+                    with suppress(RuntimeError):
+                        # Ответ отмененного обработчика может прийти после закрытия цикла
+                        loop.call_soon_threadsafe(stopping.set)
+
+            self.server.listeners.append(on_api_call)
+            await asyncio.wait_for(bot.serve(stopping), 10)
+            # После остановки в цикле не остается задач бота
+            return asyncio.all_tasks() - {asyncio.current_task()}
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(asyncio.run(main()), set())
+
+    def test_drains_received_updates(self):
+        """Тест обработки полученных обновлений после сигнала остановки"""
+        self.serve_until_first_reply(3)
+        self.assertEqual(self.server.stats['sendMessage'], 3)
+
+    @override_settings(BOT_SHUTDOWN_TIMEOUT=0.1)
+    def test_drain_deadline(self):
+        """Тест отбрасывания необработанных обновлений по истечении времени остановки"""
+        with self.assertLogs(level='WARNING') as logs:
+            self.serve_until_first_reply(5)
+        self.assertLess(self.server.stats['sendMessage'], 5)
+        self.assertTrue(any('отброшено обновлений' in line for line in logs.output))
+        # Отмененные обработчики не пишут ошибок после закрытия приложения
+        self.assertEqual([record.getMessage() for record in logs.records if record.levelno >= logging.ERROR], [])
+
+    def test_discard_updates(self):
+        """Тест очистки очереди приложения без учета служебных объектов"""
+        queue = asyncio.Queue()
+        queue.put_nowait(Update(1))
+        queue.put_nowait(object())
+        self.assertEqual(discard_updates(queue), 1)
+        self.assertTrue(queue.empty())
+
+    def test_application_private_attributes(self):
+        """Тест наличия закрытых атрибутов Application, от которых зависит остановка"""
+        application = Application.builder().token('1:TOKEN').build()
+        for name in APPLICATION_PRIVATE_ATTRIBUTES:
+            self.assertTrue(hasattr(application, name), name)
+        self.assertEqual(application_tasks(application), [])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        self.profile_dir = profile_dir.name
+        self.enterContext(override_settings(PROFILE_DIR=self.profile_dir))
+        self.user = User.objects.create_user(username='writer', password='testpass123')
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+
+    def token(self, user):
+        return jwt.encode(
+            {'user_id': user.id, 'exp': datetime.utcnow() + timedelta(minutes=60)},
+            settings.SIMPLE_JWT['SIGNING_KEY'],
+            algorithm=settings.SIMPLE_JWT['ALGORITHM']
+        )
+
+    def test_profile_by_path_setting(self):
+        """Тест профилирования маршрута из настройки с записью SQL-запросов"""
+        self.client.get('/api/blog/posts')
+        self.assertEqual(load_profiles(self.profile_dir), [])
+        with override_settings(PROFILE_API_PATHS=['/api/blog/posts/']):
+            response = self.client.get(f'/api/blog/posts/{self.post.id}')
+        self.assertEqual(response.status_code, 200)
+        [(path, meta)] = load_profiles(self.profile_dir)
+        self.assertEqual(path.stem, response['X-Profile-Id'])
+        self.assertEqual(meta['target'], 'GET api/blog/posts/<post_id>')
+        self.assertEqual(len(meta['queries']), 2)
+        self.assertIn('blog_post', meta['queries'][0]['sql'])
+
+    def test_header_requires_staff(self):
+        """Тест профилирования по заголовку X-Profile только для сотрудников"""
+        for user in (self.user, self.staff):
+            response = self.client.get('/api/blog/posts', HTTP_X_PROFILE='1',
+                                       HTTP_AUTHORIZATION=f'Bearer {self.token(user)}')
+            self.assertEqual(response.has_header('X-Profile-Id'), user.is_staff)
+        self.assertEqual([meta['target'] for _, meta in load_profiles(self.profile_dir)], ['GET api/blog/posts'])
+
+    @override_settings(PROFILE_API_PATHS=['/api/'], PROFILE_MAX_FILES=2)
+    def test_rotation(self):
+        """Тест хранения только последних PROFILE_MAX_FILES профилей"""
+        names = [self.client.get('/api/blog/posts')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(sorted(path.stem for path, _ in load_profiles(self.profile_dir)), sorted(names[1:]))
+
+    @override_settings(PROFILE_BOT_SAMPLE_RATE=1.0)
+    def test_bot_handler_sampling(self):
+        """Тест профилирования обработчика бота с запросами из sync_to_async"""
+        class Handlers:
+            @metrics.track_handler
+            async def _handle_titles(self, update, context):
+                return await sync_to_async(get_post_titles)()
+
+        posts = async_to_sync(Handlers()._handle_titles)(None, None)
+        self.assertEqual([post.title for post in posts], ['Post'])
+        [(_, meta)] = load_profiles(self.profile_dir, kind='bot')
+        self.assertEqual(meta['target'], 'titles')
+        self.assertEqual(len(meta['queries']), 1)
+
+    @override_settings(PROFILE_API_PATHS=['/api/'])
+    def test_summary_command(self):
+        """Тест сводки горячих функций и запросов по профилям"""
+        self.client.get('/api/blog/posts')
+        self.client.get(f'/api/blog/posts/{self.post.id}')
+        out = io.StringIO()
+        call_command('profilesummary', dir=self.profile_dir, stdout=out)
+        output = out.getvalue()
+        self.assertIn('Профилей: 2', output)
+        self.assertIn('GET api/blog/posts/<post_id>', output)
+        self.assertIn('function calls', output)
+        self.assertIn('SELECT "blog_attachment"', output)
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        self.log_file = f'{log_dir.name}/slow.log'
+        self.user = User.objects.create_user(username='writer', password='testpass123')
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+        self.enterContext(override_settings(SLOW_QUERY_LOG_FILE=self.log_file, SLOW_QUERY_THRESHOLD_MS=0.001))
+        self.enterContext(mock.patch.object(slowlog, '_explained', set()))
+
+    def entries(self):
+        return list(slowlog.read_entries(self.log_file))
+
+    def test_normalize_sql(self):
+        """Тест нормализации SQL в форму запроса"""
+        self.assertEqual(
+            slowlog.normalize_sql('SELECT * FROM t1  WHERE id IN (%s, %s, %s) AND title = \'a\'\'b\' LIMIT 21'),
+            'SELECT * FROM t1 WHERE id IN (...) AND title = ? LIMIT ?',
+        )
+        self.assertEqual(
+            slowlog.normalize_sql('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO t (a, b) VALUES (...)',
+        )
+
+    def test_threshold(self):
+        """Тест записи только запросов дольше порога"""
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=10000):
+            Post.objects.count()
+        self.assertEqual(self.entries(), [])
+        Post.objects.count()
+        [entry] = self.entries()
+        self.assertEqual(entry['sql'], 'SELECT COUNT(*) AS "__count" FROM "blog_post"')
+        self.assertEqual(entry['source'], '')
+
+    def test_route_source_and_explain_once(self):
+        """Тест источника-маршрута и однократного сохранения плана для формы запроса"""
+        self.client.get(f'/api/blog/posts/{self.post.id}')
+        self.client.get(f'/api/blog/posts/{self.post.id}')
+        entries = [entry for entry in self.entries() if 'blog_attachment' in entry['sql']]
+        self.assertEqual(len(entries), 2)
+        self.assertEqual({entry['source'] for entry in entries}, {'GET api/blog/posts/<post_id>'})
+        self.assertEqual(entries[0]['shape'], entries[1]['shape'])
+        self.assertIn('blog_attachment', entries[0]['explain'])
+        self.assertNotIn('explain', entries[1])
+
+    def test_bot_handler_source(self):
+        """Тест источника-обработчика бота для запросов из sync_to_async"""
+        class Handlers:
+            @metrics.track_handler
+            async def _handle_titles(self, update, context):
+                return await sync_to_async(get_post_titles)()
+
+        async_to_sync(Handlers()._handle_titles)(None, None)
+        self.assertEqual([entry['source'] for entry in self.entries()], ['bot:titles'])
+
+    def test_command_ranks_shapes(self):
+        """Тест ранжирования форм запросов командой slowqueries"""
+        for _ in range(3):
+            Post.objects.filter(id=self.post.id).exists()
+        Post.objects.count()
+        out = io.StringIO()
+        call_command('slowqueries', file=self.log_file, explain=True, stdout=out)
+        # Место формы в выводе зависит от длительности запросов, поэтому строка
+        # формы ищется во всем выводе, а не на первой позиции
+        self.assertRegex(out.getvalue(), r'(?m)^\w{16} +3 .* FROM "blog_post" WHERE')
+        self.assertRegex(out.getvalue(), r'(?m)^    \| ')
+
+    def test_file_per_process(self):
+        """Тест отдельного файла журнала на процесс и чтения файлов всех процессов"""
+        for pid in (101, 202):
+            with mock.patch('os.getpid', return_value=pid):
+                Post.objects.count()
+        log_dir = Path(self.log_file).parent
+        self.assertEqual(sorted(path.name for path in log_dir.iterdir()), ['slow.101.log', 'slow.202.log'])
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_explain_insert_returning(self):
+        """Тест плана для INSERT ... RETURNING без ошибки и без влияния на запрос"""
+        post = Post.objects.create(title='New', content='Content', author=self.user)
+        [entry] = self.entries()
+        self.assertTrue(entry['sql'].startswith('INSERT INTO "blog_post"'))
+        self.assertNotIn('EXPLAIN не выполнен', entry['explain'])
+        self.assertTrue(Post.objects.filter(id=post.id).exists())
+
+
+class PostConcurrencyTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.other_user = User.objects.create_user(username='other', password='testpass123')
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+        token = jwt.encode(
+            {'user_id': self.user.id, 'exp': datetime.utcnow() + timedelta(minutes=60)},
+            settings.SIMPLE_JWT['SIGNING_KEY'],
+            algorithm=settings.SIMPLE_JWT['ALGORITHM']
+        )
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def put(self, data, **headers):
+        return self.client.put(
+            f'/api/blog/posts/{self.post.id}', data, content_type='application/json', **self.auth, **headers,
+        )
+
+    def test_etag_and_if_match(self):
+        """Тест ETag в ответах и отказа 412 при изменении по устаревшему ETag"""
+        etag = self.client.get(f'/api/blog/posts/{self.post.id}')['ETag']
+        self.assertEqual(etag, '"1"')
+
+        response = self.put({'title': 'First'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+
+        response = self.put({'title': 'Second'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(Post.objects.get(id=self.post.id).title, 'First')
+
+        self.assertEqual(self.put({'title': 'Third'}, HTTP_IF_MATCH='W/"2"').status_code, 200)
+        self.assertEqual(self.put({'title': 'Fourth'}, HTTP_IF_MATCH='"3", "4"').status_code, 412)
+        self.assertEqual(self.put({'title': 'Any'}, HTTP_IF_MATCH='*').status_code, 200)
+
+    def test_update_starts_with_conditional_statement(self):
+        """Тест изменения условным UPDATE с проверкой автора и версии и записью только переданных полей"""
+        with CaptureQueriesContext(connection) as queries:
+            result = update_post(self.post.id, self.user.id, title='New', version=1)
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertTrue(statements[0].startswith('UPDATE "blog_post" SET "version"'))
+        self.assertIn('"author_id" = ', statements[0])
+        self.assertIn('"version" = ', statements[0])
+        self.assertTrue(statements[2].startswith('INSERT INTO "blog_postrevision"'))
+        self.assertIn('"title" = ', statements[3])
+        self.assertNotIn('"content"', statements[3])
+        self.assertEqual(len(statements), 4)
+        self.assertEqual((result['title'], result['content'], result['version']), ('New', 'Content', 2))
+
+    def test_concurrent_updates_keep_other_fields(self):
+        """Тест сохранения поля, измененного другим клиентом, при изменении без If-Match"""
+        Post.objects.filter(id=self.post.id).update(content='Edited elsewhere')
+        self.assertEqual(self.put({'title': 'New'}).status_code, 200)
+        post = Post.objects.get(id=self.post.id)
+        self.assertEqual((post.title, post.content), ('New', 'Edited elsewhere'))
+
+    def test_write_failures(self):
+        """Тест 404, отказа чужому пользователю и конфликта версии"""
+        with self.assertRaises(Post.DoesNotExist):
+            update_post(self.post.id + 100, self.user.id, title='New')
+        with self.assertRaises(PermissionError):
+            update_post(self.post.id, self.other_user.id, title='New', version=1)
+        with self.assertRaises(PermissionError):
+            delete_post(self.post.id, self.other_user.id)
+        self.assertEqual(self.put({'title': 'New'}, HTTP_IF_MATCH='"1"').status_code, 200)
+        response = self.client.delete(f'/api/blog/posts/{self.post.id + 100}', **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_if_match(self):
+        """Тест удаления поста, вложений и их файлов после фиксации с проверкой версии и выборкой поста только по ID"""
+        attachment = Attachment.objects.create(post=self.post, file=ContentFile(b'image', name='image.jpg'))
+        storage, name = attachment.file.storage, attachment.file.name
+        url = f'/api/blog/posts/{self.post.id}'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(url, HTTP_IF_MATCH='"5"', **self.auth)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response['ETag'], '"1"')
+        self.assertEqual(Attachment.objects.filter(post=self.post).count(), 1)
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url, HTTP_IF_MATCH='"1"', **self.auth)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Post.objects.filter(id=self.post.id).exists())
+        self.assertFalse(Attachment.objects.filter(post_id=self.post.id).exists())
+        # Каскад выбирает пост только по ID, без текста
+        post_selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT "blog_post"')]
+        self.assertEqual(len(post_selects), 1)
+        self.assertTrue(post_selects[0].startswith('SELECT "blog_post"."id" FROM'))
+        # Файл удаляется только после фиксации транзакции
+        self.assertTrue(storage.exists(name))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(storage.exists(name))
+
+    def test_empty_update_writes_nothing(self):
+        """Тест изменения без полей: текущий пост без записи и новой версии"""
+        with CaptureQueriesContext(connection) as queries:
+            result = update_post(self.post.id, self.user.id, version=1)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('SELECT'))
+        self.assertEqual((result['title'], result['version']), ('Post', 1))
+        self.assertEqual(self.put({})['ETag'], '"1"')
+        self.assertEqual(Post.objects.get(id=self.post.id).version, 1)
+        with self.assertRaises(PermissionError):
+            update_post(self.post.id, self.other_user.id)
+        with self.assertRaises(PostVersionConflict):
+            update_post(self.post.id, self.user.id, version=2)
+
+    def test_save_starts_new_version(self):
+        """Тест новой версии при изменении поста через save() (админка)"""
+        self.post.title = 'Admin edit'
+        self.post.save()
+        self.post.save(update_fields=['title'])
+        self.assertEqual(Post.objects.get(id=self.post.id).version, 3)
+
+
+class ASGILifespanTests(TestCase):
+    def setUp(self):
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        # Persistence пишет в базу из потока sync_to_async, вне транзакции теста
+        self.enterContext(override_settings(
+            TELEGRAM_BOT_TOKEN='123:TEST', TELEGRAM_API_BASE_URL=self.server.base_url, BOT_PERSISTENCE=False,
+        ))
+
+    async def lifespan(self, application, *events):
+        """Отправка событий lifespan и сбор ответов приложения"""
+        received = asyncio.Queue()
+        sent = []
+        for event in events:
+            received.put_nowait({'type': event})
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await asyncio.wait_for(application({'type': 'lifespan'}, received.get, send), 10)
+        return sent
+
+    def test_bot_runs_with_api(self):
+        """Тест запуска бота по lifespan в цикле событий сервера вместе с API"""
+        from django.core.asgi import get_asgi_application
+
+        application = Lifespan(get_asgi_application(), run_bot=True)
+        self.server.push_update(GracefulShutdownTests.message('/start'))
+
+        async def main():
+            received = asyncio.Queue()
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            task = asyncio.create_task(application({'type': 'lifespan'}, received.get, send))
+            await received.put({'type': 'lifespan.startup'})
+            while not self.server.stats.get('sendMessage'):
+                await asyncio.sleep(0.01)
+            self.assertTrue(application.bots.running[0].application.running)
+
+            http_scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'path': '/healthz', 'raw_path': b'/healthz', 'root_path': '', 'scheme': 'http',
+                'query_string': b'', 'headers': [(b'host', b'localhost')], 'server': ('localhost', 80),
+            }
+            request = asyncio.Queue()
+            request.put_nowait({'type': 'http.request', 'body': b''})
+            await application(http_scope, request.get, send)
+
+            await received.put({'type': 'lifespan.shutdown'})
+            await asyncio.wait_for(task, 10)
+            return sent
+
+        sent = asyncio.run(main())
+        types = [message['type'] for message in sent]
+        self.assertEqual(types[0], 'lifespan.startup.complete')
+        self.assertIn(b'{"status": "ok"}', [message.get('body') for message in sent])
+        self.assertEqual(types[-1], 'lifespan.shutdown.complete')
+        self.assertIsNone(application.bots)
+
+    def test_without_bot(self):
+        """Тест lifespan без запуска бота"""
+        application = Lifespan(None)
+        sent = asyncio.run(self.lifespan(application, 'lifespan.startup', 'lifespan.shutdown'))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIsNone(application.bots)
+
+    @override_settings(TELEGRAM_BOT_TOKEN='')
+    def test_startup_failure(self):
+        """Тест отказа запуска сервера, если бот не запустился"""
+        with self.assertLogs('tg_bot.lifespan', 'ERROR'):
+            sent = asyncio.run(self.lifespan(Lifespan(None, run_bot=True), 'lifespan.startup'))
+        self.assertEqual(sent, ['lifespan.startup.failed'])
+
+
+class BackgroundThreadsTests(TestCase):
+    def test_started_once_per_process(self):
+        """Тест запуска фоновых потоков при первом запросе в каждом процессе, а не при импорте"""
+        calls = []
+
+        def app(environ, start_response):
+            return [b'ok']
+
+        self.enterContext(mock.patch.object(background, '_started_pid', None))
+        self.enterContext(mock.patch('blog.counters.POST_VIEWS.start', lambda: calls.append('views')))
+        self.enterContext(mock.patch('blog.scheduler.PUBLICATIONS.start', lambda: calls.append('publications')))
+        application = background.BackgroundThreadsWSGI(app)
+        self.assertEqual(calls, [])
+        application({}, None)
+        application({}, None)
+        self.assertEqual(calls, ['views', 'publications'])
+        # Воркер, созданный fork после импорта приложения (gunicorn --preload)
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            application({}, None)
+        self.assertEqual(calls, ['views', 'publications'] * 2)
+
+
+class MultiBotTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name, BOT_PERSISTENCE=False))
+
+    @override_settings(TELEGRAM_BOT_TOKEN='1:MAIN', TELEGRAM_BOTS=[])
+    def test_bot_configs(self):
+        """Тест списка ботов из TELEGRAM_BOTS и TELEGRAM_BOT_TOKEN"""
+        self.assertEqual(bot_configs(), [BotConfig('main', '1:MAIN')])
+        with override_settings(TELEGRAM_BOTS=[['ru', '2:RU'], ['en', '3:EN']]):
+            self.assertEqual(bot_configs(), [BotConfig('ru', '2:RU'), BotConfig('en', '3:EN')])
+            bot = TelegramBot()
+            self.assertEqual((bot.name, bot.bot_id), ('ru', 2))
+        with override_settings(TELEGRAM_BOTS=[['ru', '2:RU'], ['ru', '3:EN']]):
+            with self.assertRaises(ValueError):
+                bot_configs()
+        with override_settings(TELEGRAM_BOTS=[['2:RU']]):
+            with self.assertRaises(ValueError):
+                bot_configs()
+
+    def test_bots_do_not_stall_each_other(self):
+        """Тест независимой обработки обновлений ботами одного процесса"""
+        slow = FakeTelegramServer(latency=1.5).start()
+        fast = FakeTelegramServer().start()
+        self.addCleanup(slow.stop)
+        self.addCleanup(fast.stop)
+        group = BotGroup([
+            TelegramBot(token='1:SLOW', base_url=slow.base_url, name='slow'),
+            TelegramBot(token='2:FAST', base_url=fast.base_url, name='fast'),
+        ])
+        before = metrics.BOT_HANDLER_DURATION.count('fast', 'start', 'ok')
+        answered = {}
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            stopping = asyncio.Event()
+            for name, server in (('slow', slow), ('fast', fast)):
+                def on_api_call(method, params, ok, name=name):
+                    if method == 'sendMessage':
+                        with suppress(RuntimeError):
+                            loop.call_soon_threadsafe(answered.setdefault, name, loop.time() - started)
+                            if name == 'slow':
+                                loop.call_soon_threadsafe(stopping.set)
+
+                server.listeners.append(on_api_call)
+                server.push_update(GracefulShutdownTests.message('/start'))
+            await asyncio.wait_for(group.serve(stopping), 10)
+
+        with redirect_stdout(io.StringIO()):
+            asyncio.run(main())
+        self.assertLess(answered['fast'], 1.0)
+        self.assertGreaterEqual(answered['slow'], 1.5)
+        self.assertEqual(metrics.BOT_HANDLER_DURATION.count('fast', 'start', 'ok'), before + 1)
+        self.assertEqual(group.running, [])
+
+    def test_failed_bot_skipped(self):
+        """Тест запуска остальных ботов, если один не запустился"""
+        server = FakeTelegramServer().start()
+        self.addCleanup(server.stop)
+        good = TelegramBot(token='1:GOOD', base_url=server.base_url, name='good')
+        bad = TelegramBot(token='2:BAD', base_url='http://127.0.0.1:1/bot', name='bad')
+
+        async def main():
+            group = BotGroup([good, bad])
+            await group.start()
+            running = list(group.running)
+            await group.stop()
+            return running
+
+        with self.assertLogs('blog.bot', 'ERROR') as logs:
+            self.assertEqual(asyncio.run(main()), [good])
+        self.assertIn('Бот bad не запущен', logs.output[0])
+
+    def test_file_ids_per_bot(self):
+        """Тест отдельного кеша file_id для каждого бота"""
+        user = User.objects.create_user(username='author', password='testpass123')
+        post = Post.objects.create(title='Post', content='Content', author=user)
+        Attachment.objects.create(post=post, file=ContentFile(b'image', name='1.jpg'))
+        sent = []
+
+        class Bot:
+            def __init__(self, token):
+                self.token = token
+
+            async def send_photo(self, chat_id, photo, **kwargs):
+                sent.append((self.token, photo))
+                return SimpleNamespace(photo=[SimpleNamespace(file_id=f'photo-{self.token}')])
+
+        for token in ('1:RU', '2:EN', '1:RU'):
+            bot_id = int(token.split(':')[0])
+            with self.assertNumQueries(2):
+                attachments = list(get_post_by_id(post.id, bot_id=bot_id).attachments.all())
+            async_to_sync(send_attachments)(Bot(token), 1, attachments)
+
+        self.assertEqual([isinstance(photo, str) for _, photo in sent], [False, False, True])
+        self.assertEqual(sent[2], ('1:RU', 'photo-1:RU'))
+        self.assertEqual(
+            sorted(TelegramFile.objects.values_list('bot_id', 'file_id')),
+            [(1, 'photo-1:RU'), (2, 'photo-2:EN')],
+        )
+
+
+
+class PostArchiveTests(TestCase):
+    def setUp(self):
+        self.addCleanup(POST_VIEWS.reset)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.old = Post.objects.create(title='Old', content='текст ' * 500, author=self.user)
+        self.older = Post.objects.create(title='Older', content='Content', author=self.user)
+        self.recent = Post.objects.create(title='Recent', content='Content', author=self.user)
+        self.attachment = Attachment.objects.create(post=self.old, file=ContentFile(b'image', name='1.jpg'),
+                                                    caption='Caption')
+        TelegramFile.objects.create(attachment=self.attachment, bot_id=1, file_id='photo-1')
+        self.created_at = timezone.now() - timedelta(days=365)
+        Post.objects.filter(id__in=[self.old.id, self.older.id]).update(created_at=self.created_at)
+
+    def archive(self, *args):
+        out = io.StringIO()
+        call_command('archive_posts', '--older-than', '30', *args, stdout=out)
+        return out.getvalue()
+
+    def test_archive_posts_command(self):
+        """Тест переноса старых постов и их вложений в архив пакетами"""
+        self.assertIn('Постов для переноса в архив', self.archive('--dry-run'))
+        self.assertFalse(ArchivedPost.objects.exists())
+
+        self.assertIn('Перенесено в архив постов: 2', self.archive('--batch-size', '1'))
+        self.assertEqual(list(Post.objects.values_list('id', flat=True)), [self.recent.id])
+        archived = ArchivedPost.objects.get(id=self.old.id)
+        self.assertEqual((archived.title, archived.content, archived.author_id), ('Old', 'текст ' * 500, self.user.id))
+        self.assertEqual(archived.created_at, self.created_at)
+        attachment = ArchivedAttachment.objects.get(id=self.attachment.id)
+        self.assertEqual((attachment.post_id, attachment.file.name), (self.old.id, self.attachment.file.name))
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(TelegramFile.objects.exists())
+        self.assertIn('Перенесено в архив постов: 0', self.archive())
+
+    def test_reads_fall_through_to_archive(self):
+        """Тест чтения архивного поста по ID и его отсутствия в списках"""
+        self.archive()
+        response = self.client.get(f'/api/blog/posts/{self.old.id}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['title'], data['author']), ('Old', 'author'))
+        self.assertEqual([item['caption'] for item in data['attachments']], ['Caption'])
+        self.assertEqual(response['ETag'], '"1"')
+
+        titles = [post['title'] for post in self.client.get('/api/blog/posts').json()]
+        self.assertEqual(titles, ['Recent'])
+        self.assertEqual([post.id for post in get_post_titles()], [self.recent.id])
+        with self.assertRaises(Post.DoesNotExist):
+            get_post_by_id(self.recent.id + 1)
+        with self.assertNumQueries(2):
+            get_post_by_id(self.recent.id)
+
+        # Просмотр архивного поста записывается в архив
+        counter = ViewCounter()
+        counter.add_post(get_post_by_id(self.old.id))
+        counter.add_post(get_post_by_id(self.recent.id))
+        self.assertEqual(counter.flush(), 2)
+        self.assertEqual(ArchivedPost.objects.get(id=self.old.id).views, 1)
+        self.assertEqual(Post.objects.get(id=self.recent.id).views, 1)
+
+    def test_archived_attachments_not_cached(self):
+        """Тест отправки вложений архивного поста без записи file_id"""
+        self.archive()
+        sent = []
+
+        class Bot:
+            token = '1:TOKEN'
+
+            async def send_photo(self, chat_id, photo, **kwargs):
+                sent.append(photo)
+                return SimpleNamespace(photo=[SimpleNamespace(file_id='photo-1')])
+
+        attachments = list(get_post_by_id(self.old.id, bot_id=1).attachments.all())
+        self.assertEqual(async_to_sync(send_attachments)(Bot(), 1, attachments), 1)
+        self.assertEqual(sent, [b'image'])
+        self.assertFalse(TelegramFile.objects.exists())
+
+
+class TelegramTransportTests(TestCase):
+    @override_settings(
+        TELEGRAM_API_POOL_SIZE=8, TELEGRAM_API_KEEPALIVE_CONNECTIONS=2, TELEGRAM_API_KEEPALIVE_EXPIRY=30,
+        TELEGRAM_API_READ_TIMEOUT=4, TELEGRAM_API_HTTP2=True,
+    )
+    def test_build_requests(self):
+        """Тест отдельных запросов для getUpdates и исходящих вызовов по настройкам"""
+        # Без пакета h2 транспорт остается на HTTP/1.1
+        with mock.patch('blog.transport.h2', None), self.assertLogs('blog.transport', 'WARNING'), \
+                mock.patch('blog.transport.httpx.AsyncClient', wraps=httpx.AsyncClient) as client:
+            request, updates = build_requests('main')
+        # Каждый запрос создает один клиент сразу с параметрами пула
+        self.assertEqual(client.call_count, 2)
+        self.assertFalse(client.call_args_list[0].kwargs['http2'])
+        limits = client.call_args_list[0].kwargs['limits']
+        self.assertEqual((limits.max_connections, limits.max_keepalive_connections, limits.keepalive_expiry),
+                         (8, 2, 30))
+        self.assertEqual(request._client.timeout.read, 4)
+        self.assertEqual((request.pool_name, updates.pool_name), ('api', 'updates'))
+        self.assertEqual(client.call_args_list[1].kwargs['limits'].max_connections, 1)
+
+    def test_method_timeouts(self):
+        """Тест таймаутов по методам без переопределения явно переданных"""
+        request = InstrumentedHTTPXRequest(2, method_timeouts={'sendDocument': 60})
+        calls = []
+
+        async def do_request(self, url, method, request_data, read_timeout, write_timeout, *args):
+            calls.append((url.rsplit('/', 1)[-1], read_timeout, write_timeout))
+            return 200, b'{}'
+
+        async def main():
+            await request.do_request('http://api/bot1:T/sendDocument', 'POST')
+            await request.do_request('http://api/bot1:T/sendDocument', 'POST', read_timeout=7)
+            await request.do_request('http://api/bot1:T/getMe', 'POST')
+
+        with mock.patch.object(HTTPXRequest, 'do_request', do_request):
+            asyncio.run(main())
+        self.assertEqual(calls[0], ('sendDocument', 60, 60))
+        self.assertEqual(calls[1], ('sendDocument', 7, 60))
+        self.assertEqual(calls[2][1:], (HTTPXRequest.DEFAULT_NONE, HTTPXRequest.DEFAULT_NONE))
+
+    def test_method_timeout_for_file_upload(self):
+        """Тест таймаута метода для загрузки файла вместо встроенного в PTB write_timeout"""
+        request = InstrumentedHTTPXRequest(2, method_timeouts={'sendDocument': 60})
+        bot = UploadTimeoutBot('1:TOKEN', request=request)
+        calls = []
+
+        async def do_request(self, url, method, request_data, read_timeout, write_timeout, *args):
+            calls.append((read_timeout, write_timeout))
+            message = {'message_id': 1, 'date': 0, 'chat': {'id': 7, 'type': 'private'}}
+            return 200, json.dumps({'ok': True, 'result': message}).encode()
+
+        async def main():
+            await bot.send_document(7, b'file')
+            await bot.send_document(7, b'file', write_timeout=5)
+            # Явно переданные 20 секунд совпадают со значением PTB, но не заменяются
+            await bot.send_document(7, b'file', write_timeout=20)
+            # Без таймаута метода действует значение PTB
+            await bot.send_photo(7, b'file')
+
+        with mock.patch.object(HTTPXRequest, 'do_request', do_request):
+            asyncio.run(main())
+        self.assertEqual(calls[:3], [(60, 60), (60, 5), (60, 20)])
+        self.assertNotIsInstance(calls[2][1], type(UPLOAD_WRITE_TIMEOUT))
+        self.assertEqual(calls[3][1], PTB_UPLOAD_WRITE_TIMEOUT)
+
+    def test_pool_wait(self):
+        """Тест учета ожидания соединения и отказа при исчерпании пула"""
+        server = FakeTelegramServer(latency=0.3).start()
+        self.addCleanup(server.stop)
+        url = f'{server.base_url}1:TOKEN/answerCallbackQuery'
+        waits = metrics.TELEGRAM_API_POOL_WAIT.count('pool-test', 'api')
+        timeouts = metrics.TELEGRAM_API_ERRORS.value('pool-test', 'answerCallbackQuery', 'PoolTimeout')
+
+        async def main(pool_timeout):
+            request = InstrumentedHTTPXRequest(1, bot_name='pool-test', pool_timeout=pool_timeout)
+            await request.initialize()
+            try:
+                return await asyncio.gather(
+                    request.do_request(url, 'POST'), request.do_request(url, 'POST'), return_exceptions=True,
+                )
+            finally:
+                await request.shutdown()
+
+        results = asyncio.run(main(5.0))
+        self.assertEqual([status for status, _ in results], [200, 200])
+        self.assertEqual(metrics.TELEGRAM_API_POOL_WAIT.count('pool-test', 'api'), waits + 2)
+
+        results = asyncio.run(main(0.1))
+        self.assertEqual(sum(isinstance(result, TimedOut) for result in results), 1)
+        self.assertEqual(
+            metrics.TELEGRAM_API_ERRORS.value('pool-test', 'answerCallbackQuery', 'PoolTimeout'), timeouts + 1,
+        )
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        LOCAL_BUCKETS.reset()
+        self.addCleanup(LOCAL_BUCKETS.reset)
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.other_user = User.objects.create_user(username='other', password='testpass123')
+
+    def login(self, **extra):
+        return self.client.post(
+            '/api/users/login', {'username': 'author', 'password': 'testpass123'},
+            content_type='application/json', **extra,
+        )
+
+    @override_settings(API_THROTTLE_RATES={'login': '2/min'})
+    def test_login_throttled_by_ip(self):
+        """Тест ответа 429 с Retry-After после исчерпания лимита IP"""
+        before = metrics.API_THROTTLED.value('login')
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.1').status_code, 200)
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.1').status_code, 200)
+        response = self.login(REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        # Один запрос пополняется за 30 секунд, часть из них уже прошла за время входа
+        self.assertIn(int(response['Retry-After']), range(25, 31))
+        self.assertIn('message', response.json())
+        self.assertEqual(metrics.API_THROTTLED.value('login'), before + 1)
+        # У другого клиента своя корзина
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2').status_code, 200)
+        # За прокси клиент определяется по X-Forwarded-For
+        with override_settings(API_THROTTLE_PROXIES=1):
+            self.assertEqual(self.login(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='10.0.0.3').status_code, 200)
+
+    @override_settings(API_THROTTLE_RATES={'post_create': '1/min'})
+    def test_post_create_throttled_by_user(self):
+        """Тест лимита создания постов на пользователя"""
+        def create(user):
+            token = issue_tokens(user.id)['access']
+            return self.client.post(
+                '/api/blog/posts', {'title': 'Post', 'content': 'Content'},
+                content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}',
+            )
+
+        self.assertEqual(create(self.user).status_code, 201)
+        self.assertEqual(create(self.user).status_code, 429)
+        self.assertEqual(create(self.other_user).status_code, 201)
+        self.assertEqual(Post.objects.count(), 2)
+        with override_settings(API_THROTTLE_RATES={}):
+            self.assertEqual(create(self.user).status_code, 201)
+
+    def test_token_bucket(self):
+        """Тест пополнения корзины в памяти процесса и в кеше"""
+        self.assertEqual(parse_rate('10/min'), (10, 60.0))
+        with self.assertRaises(ValueError):
+            parse_rate('10/week')
+        for store in (LocalBucketStore(), CacheBucketStore('default')):
+            key = f'test:{type(store).__name__}'
+            self.assertEqual(store.take(key, 2, 1.0, 100.0), 0)
+            self.assertEqual(store.take(key, 2, 1.0, 100.0), 0)
+            self.assertEqual(store.take(key, 2, 1.0, 100.0), 1.0)
+            self.assertEqual(store.take(key, 2, 1.0, 100.5), 0.5)
+            self.assertEqual(store.take(key, 2, 1.0, 101.0), 0)
+            # Долгий простой не накапливает запросы сверх емкости корзины
+            self.assertEqual(store.take(key, 2, 1.0, 1000.0), 0)
+            self.assertEqual(store.take(key, 2, 1.0, 1000.0), 0)
+            self.assertEqual(store.take(key, 2, 1.0, 1000.0), 1.0)
+
+
+# Лимиты частоты отключены: корзины в памяти общие для всех тестов процесса
+@override_settings(API_THROTTLE_RATES={})
+class ScheduledPublishingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.now = timezone.now()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens(self.user.id)["access"]}'}
+
+    def test_scheduled_post_hidden(self):
+        """Тест скрытия поста до времени публикации в списках, API и боте"""
+        Post.objects.create(title='Published', content='Content', author=self.user)
+        response = self.client.post(
+            '/api/blog/posts', {'title': 'Scheduled', 'content': 'Content',
+                                'publish_at': (self.now + timedelta(hours=1)).isoformat()},
+            content_type='application/json', **self.auth,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNotNone(response.json()['publish_at'])
+        post_id = response.json()['id']
+
+        self.assertEqual([post['title'] for post in self.client.get('/api/blog/posts').json()], ['Published'])
+        self.assertEqual(self.client.get(f'/api/blog/posts/{post_id}').status_code, 404)
+        self.assertEqual([post.title for post in get_post_titles()], ['Published'])
+        self.assertEqual([post['title'] for post in self.client.get('/api/blog/posts/popular').json()],
+                         ['Published'])
+
+        response = self.client.put(
+            f'/api/blog/posts/{post_id}', {'publish_at': (self.now - timedelta(minutes=1)).isoformat()},
+            content_type='application/json', **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(f'/api/blog/posts/{post_id}').status_code, 200)
+        self.assertEqual(len(get_post_titles()), 2)
+
+    def test_scheduler_heap(self):
+        """Тест кучи публикаций: загрузка по горизонту, срабатывание и перенос времени"""
+        first = Post.objects.create(title='First', content='', publish_at=self.now + timedelta(hours=1))
+        second = Post.objects.create(title='Second', content='', publish_at=self.now + timedelta(hours=2))
+        Post.objects.create(title='Published', content='')
+        published = []
+
+        def receiver(sender, post_id, publish_at, **kwargs):
+            published.append(post_id)
+
+        post_published.connect(receiver)
+        self.addCleanup(post_published.disconnect, receiver)
+        scheduler = PublishScheduler(load_limit=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(scheduler.load(), 1)
+        # Публикация за горизонтом загрузки будет загружена позже
+        scheduler.schedule(second.id, second.publish_at)
+        self.assertEqual(scheduler.pending(), 1)
+        self.assertEqual(scheduler.run_pending(), 0)
+
+        with mock.patch('django.utils.timezone.now', return_value=self.now + timedelta(minutes=90)):
+            self.assertEqual(scheduler.run_pending(), 1)
+        self.assertEqual(published, [first.id])
+        self.assertEqual(scheduler.next_publish_at(), second.publish_at)
+
+        # Время публикации изменили в другом процессе: устаревшая запись не срабатывает
+        Post.objects.filter(id=second.id).update(publish_at=self.now + timedelta(hours=3))
+        with mock.patch('django.utils.timezone.now', return_value=self.now + timedelta(minutes=150)):
+            self.assertEqual(scheduler.run_pending(), 0)
+        self.assertEqual(published, [first.id])
+        self.assertEqual(scheduler.next_publish_at(), self.now + timedelta(hours=3))
+
+    def test_scheduler_wakes_at_publish_time(self):
+        """Тест срабатывания потока планировщика в момент публикации без опроса"""
+        scheduler = PublishScheduler()
+        fired = threading.Event()
+        calls = []
+
+        def fire(post_id, publish_at):
+            calls.append((post_id, timezone.now()))
+            fired.set()
+            return True
+
+        with mock.patch.object(scheduler, 'load', return_value=0) as load, \
+                mock.patch.object(scheduler, 'fire', side_effect=fire):
+            scheduler.start(reload_interval=60)
+            try:
+                publish_at = timezone.now() + timedelta(seconds=0.3)
+                scheduler.schedule(1, publish_at)
+                self.assertTrue(fired.wait(3))
+            finally:
+                scheduler.stop()
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(calls[0][0], 1)
+        self.assertGreaterEqual(calls[0][1], publish_at)
+        self.assertLess((calls[0][1] - publish_at).total_seconds(), 0.1)
+
+
+class PostRevisionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens(self.user.id)["access"]}'}
+        self.lines = [f'Абзац {i}: длинный текст поста, который правят понемногу.\n' for i in range(200)]
+        self.post = Post.objects.create(title='Title', content=''.join(self.lines), author=self.user)
+
+    def edit(self, number):
+        """Правка одной строки поста, возвращает новый текст"""
+        self.lines[number % len(self.lines)] = f'Правка {number}\n'
+        content = ''.join(self.lines)
+        update_post(self.post.id, self.user.id, title=f'Title {number}', content=content)
+        return content
+
+    def test_revision_history_api(self):
+        """Тест списка редакций и восстановления любой редакции через API"""
+        versions = {1: ('Title', self.post.content)}
+        for number in range(1, 5):
+            versions[number + 1] = (f'Title {number}', self.edit(number))
+        # Изменение только времени публикации меняет версию без записи в историю
+        update_post(self.post.id, self.user.id, publish_at=timezone.now() - timedelta(minutes=1))
+
+        response = self.client.get(f'/api/blog/posts/{self.post.id}/revisions')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 6)
+        self.assertEqual([revision['version'] for revision in response.json()['revisions']], [4, 3, 2, 1])
+
+        for version, (title, content) in versions.items():
+            # Строки версии 5 нет: ее заменило изменение только publish_at
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/blog/posts/{self.post.id}/revisions/{version}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.json()['title'], response.json()['content']), (title, content))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id}/revisions/6').json()['content'],
+                             versions[5][1])
+        self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id}/revisions/7').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id + 100}/revisions').status_code, 404)
+
+        # Правка без изменений не записывается, удаление поста удаляет историю
+        update_post(self.post.id, self.user.id, title='Title 4')
+        self.assertEqual(PostRevision.objects.filter(post=self.post).count(), 4)
+        self.assertEqual(self.client.delete(f'/api/blog/posts/{self.post.id}', **self.auth).status_code, 204)
+        self.assertFalse(PostRevision.objects.exists())
+
+    def test_oldest_version_without_revision_row(self):
+        """Тест восстановления самой старой версии, замененной изменением только publish_at"""
+        original = self.post.content
+        update_post(self.post.id, self.user.id, publish_at=timezone.now() - timedelta(minutes=1))
+        edited = self.edit(1)
+        self.assertEqual(list(PostRevision.objects.values_list('version', flat=True)), [2])
+        self.assertEqual(get_post_revision(self.post.id, 1), {'version': 1, 'title': 'Title', 'content': original})
+        self.assertEqual(get_post_revision(self.post.id, 3)['content'], edited)
+
+    @override_settings(POST_REVISION_SNAPSHOT_INTERVAL=10)
+    def test_delta_storage(self):
+        """Тест компактности истории разниц, полных редакций по интервалу и восстановления"""
+        self.assertEqual(apply_delta('a\nb\nc', make_delta('a\nb\nc', 'a\nB\nc\nd')), 'a\nB\nc\nd')
+        contents = {1: self.post.content}
+        for number in range(1, 31):
+            contents[number + 1] = self.edit(number)
+
+        revisions = list(PostRevision.objects.filter(post=self.post).order_by('version'))
+        self.assertEqual([revision.version for revision in revisions if revision.snapshot], [10, 20, 30])
+        stored = sum(len(revision.data) for revision in revisions)
+        naive = sum(len(contents[revision.version].encode('utf-8')) for revision in revisions)
+        self.assertLess(stored, naive / 10)
+
+        for version in range(1, 31):
+            with self.assertNumQueries(2):
+                self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id}/revisions/{version}')
+                                 .json()['content'], contents[version])
+
+    def test_prune_revisions(self):
+        """Тест удаления старых редакций командой с сохранением восстановления оставшихся"""
+        contents = {1: self.post.content}
+        for number in range(1, 7):
+            contents[number + 1] = self.edit(number)
+        PostRevision.objects.filter(version__lte=2).update(replaced_at=timezone.now() - timedelta(days=30))
+
+        out = io.StringIO()
+        call_command('prune_revisions', older_than=7, dry_run=True, stdout=out)
+        self.assertIn('Редакций для удаления: 2', out.getvalue())
+        call_command('prune_revisions', keep=3, batch_size=1, stdout=io.StringIO())
+        self.assertEqual(list(PostRevision.objects.values_list('version', flat=True)), [6, 5, 4])
+        self.assertEqual(Post.objects.get(id=self.post.id).pruned_version, 3)
+        for version in (4, 5, 6):
+            self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id}/revisions/{version}')
+                             .json()['content'], contents[version])
+        self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id}/revisions/3').status_code, 404)
+
+    def test_admin_edit_recorded(self):
+        """Тест записи в историю правки поста в админке"""
+        self.edit(1)
+        admin_user = User.objects.create_superuser(username='admin', password='adminpass123')
+        self.client.force_login(admin_user)
+        response = self.client.post(f'/admin/blog/post/{self.post.id}/change/', {
+            'title': 'Admin title', 'content': 'Admin content', 'author': self.user.id,
+            'attachments-TOTAL_FORMS': 0, 'attachments-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        edited = ''.join(self.lines)
+        self.assertEqual(PostRevision.objects.get(post=self.post, version=2).title, 'Title 1')
+        self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id}/revisions/2').json()['content'], edited)
+        self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.id}/revisions/1').json()['content'],
+                         self.post.content)
+
+
+class PostLoaderTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.posts = [Post.objects.create(title=f'Post {i}', content='Content', author=self.user) for i in range(3)]
+        Attachment.objects.create(post=self.posts[0], file=ContentFile(b'image', name='1.jpg'))
+
+    def test_concurrent_loads_batched(self):
+        """Тест объединения одновременных загрузок в один запрос и None для отсутствующих постов"""
+        loader = PostLoader(bot_id=1, bot_name='loader', window=0.05)
+        first, second, third = (post.id for post in self.posts)
+        missing = third + 100
+
+        async def main():
+            return await asyncio.gather(*(loader.load(post_id) for post_id in (first, second, first, missing)))
+
+        before = metrics.BOT_POST_BATCH_SIZE.count('loader')
+        # Посты, вложения и поиск отсутствующего в архиве
+        with self.assertNumQueries(3):
+            posts = async_to_sync(main)()
+        self.assertEqual([post and post.id for post in posts], [first, second, first, None])
+        self.assertIs(posts[0], posts[2])
+        self.assertEqual(posts[0].author.username, 'author')
+        self.assertEqual([attachment.telegram_file_id for attachment in posts[0].attachments.all()], [''])
+        self.assertEqual(metrics.BOT_POST_BATCH_SIZE.count('loader'), before + 1)
+
+        # Следующие загрузки - новый пакет с актуальными данными
+        Post.objects.filter(id=second).update(title='Renamed')
+        post = async_to_sync(loader.load)(second)
+        self.assertEqual(post.title, 'Renamed')
+
+    def test_max_batch_and_errors(self):
+        """Тест отправки полного пакета без ожидания окна и передачи ошибки всем ожидающим"""
+        loader = PostLoader(window=10, max_batch=2)
+        ids = [post.id for post in self.posts[:2]]
+
+        async def main():
+            return await asyncio.wait_for(asyncio.gather(*(loader.load(post_id) for post_id in ids)), 2)
+
+        self.assertEqual([post.id for post in async_to_sync(main)()], ids)
+
+        with mock.patch('blog.loaders.get_posts_by_ids', side_effect=DatabaseError('database is locked')):
+            async def failing():
+                return await asyncio.gather(*(loader.load(post_id) for post_id in ids), return_exceptions=True)
+
+            results = async_to_sync(failing)()
+        self.assertTrue(all(isinstance(result, DatabaseError) for result in results))
+
+    @override_settings(BOT_CONCURRENT_UPDATES=8, BOT_PERSISTENCE=False)
+    def test_callback_uses_loader(self):
+        """Тест открытия постов ботом через загрузчик и ответа на отсутствующий пост"""
+        bot = TelegramBot(token='1:TEST', base_url='http://127.0.0.1:1/bot', name='loader-bot')
+        self.assertGreater(bot.posts.window, 0)
+        texts = {}
+
+        def callback(data):
+            async def edit_message_text(text, **kwargs):
+                texts[data] = text
+
+            query = SimpleNamespace(data=data, answer=mock.AsyncMock(), edit_message_text=edit_message_text,
+                                    message=SimpleNamespace(chat_id=1))
+            return SimpleNamespace(callback_query=query, message=None, effective_user=None)
+
+        missing = self.posts[-1].id + 100
+        updates = [callback(f'post_{self.posts[1].id}'), callback(f'post_{self.posts[2].id}'),
+                   callback(f'post_{missing}')]
+
+        async def main():
+            await asyncio.gather(*(bot._handle_callback(update, SimpleNamespace(bot=None)) for update in updates))
+
+        with self.assertNumQueries(3):
+            async_to_sync(main)()
+        self.assertIn('Post 1', texts[f'post_{self.posts[1].id}'])
+        self.assertIn('Post 2', texts[f'post_{self.posts[2].id}'])
+        self.assertIn('Пост не найден', texts[f'post_{missing}'])
+        with override_settings(BOT_CONCURRENT_UPDATES=1):
+            self.assertEqual(TelegramBot(token='1:TEST', base_url='http://127.0.0.1:1/bot').posts.window, 0)
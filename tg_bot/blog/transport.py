@@ -0,0 +1,201 @@
+"""
+HTTP-транспорт запросов бота к Telegram Bot API.
+
+У каждого бота два запроса (пула соединений): getUpdates идет через
+отдельное соединение, поэтому долгий опрос не занимает пул исходящих
+вызовов, а всплеск исходящих вызовов не задерживает получение обновлений.
+Размер пула исходящих вызовов, число соединений, которые держатся открытыми,
+их время жизни, HTTP/2 и таймауты задаются настройками TELEGRAM_API_*.
+Таймауты чтения и записи можно задать отдельно для методов
+(TELEGRAM_API_METHOD_TIMEOUTS): answerCallbackQuery должен быстро
+завершаться ошибкой, а загрузке файла нужны десятки секунд.
+
+Метрики: длительность запроса по методам (без ожидания соединения), время
+ожидания свободного соединения по пулам и ошибки. По ожиданию видно, что
+пул мал для трафика: запросы стоят в очереди, а при превышении
+pool_timeout завершаются TimedOut, не дойдя до Telegram.
+"""
+
+from django.conf import settings
+from telegram.error import TimedOut
+from telegram.ext import ExtBot
+from telegram.request import BaseRequest, HTTPXRequest
+from tg_bot.metrics import TELEGRAM_API_DURATION, TELEGRAM_API_ERRORS, TELEGRAM_API_POOL_WAIT
+from typing import Dict, Optional, Tuple
+import asyncio
+import functools
+import httpx
+import inspect
+import logging
+import time
+
+try:
+    import h2
+except ImportError:  # pragma: no cover - зависит от окружения
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+# PTB 20 объявляет в методах загрузки файлов (send_photo, send_document,
+# send_media_group и другие) write_timeout=20, и в запросе он неотличим от
+# явно переданного. UploadTimeoutBot подставляет вместо него маркер
+# UPLOAD_WRITE_TIMEOUT, который узнается по идентичности: таймаут метода
+# заменяет только маркер, а без таймаута метода маркер работает как 20 секунд
+PTB_UPLOAD_WRITE_TIMEOUT = 20
+
+
+class _UploadWriteTimeout(float):
+    """Тип маркера таймаута записи файлов по умолчанию"""
+
+
+UPLOAD_WRITE_TIMEOUT = _UploadWriteTimeout(PTB_UPLOAD_WRITE_TIMEOUT)
+
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """
+    HTTPXRequest с настраиваемым пулом соединений и таймаутами по методам.
+
+    httpx не сообщает, сколько запрос ждал соединения, поэтому число
+    одновременных запросов ограничивается собственным семафором размером с
+    пул и ожидание измеряется на нем.
+    """
+
+    def __init__(self, connection_pool_size: int = 1, *, bot_name: str = '', pool_name: str = 'api',
+                 keepalive_connections: Optional[int] = None, keepalive_expiry: float = 5.0,
+                 http2: bool = False, method_timeouts: Optional[Dict[str, float]] = None, **kwargs):
+        """
+        Args:
+            connection_pool_size (int): Максимум одновременных запросов и соединений
+            bot_name (str): Имя бота для метки bot в метриках
+            pool_name (str): Имя пула для метки pool в метриках (api, updates)
+            keepalive_connections (int, optional): Сколько простаивающих соединений держать
+                открытыми, по умолчанию все
+            keepalive_expiry (float): Время жизни простаивающего соединения, секунды
+            http2 (bool): HTTP/2, если установлен пакет h2
+            method_timeouts (Dict[str, float], optional): Таймауты чтения и записи по методам
+                Bot API, секунды; явно переданные в вызов таймауты не переопределяются
+            **kwargs: Аргументы HTTPXRequest (таймауты по умолчанию, proxy_url)
+        """
+        if keepalive_connections is None:
+            keepalive_connections = connection_pool_size
+        if http2 and h2 is None:
+            logger.warning('HTTP/2 для Bot API недоступен: пакет h2 не установлен, используется HTTP/1.1')
+            http2 = False
+        # Клиент создается один раз в конструкторе HTTPXRequest через _build_client,
+        # поэтому параметры пула задаются до его вызова
+        self.limits = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=min(keepalive_connections, connection_pool_size),
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self.bot_name = bot_name
+        self.pool_name = pool_name
+        self.pool_size = connection_pool_size
+        self.method_timeouts = dict(method_timeouts or {})
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # HTTPXRequest в PTB 20.0 не принимает limits и http2 в конструкторе
+        client_kwargs = dict(self._client_kwargs, limits=self.limits, http2=self.http2)
+        return httpx.AsyncClient(**client_kwargs)
+
+    async def initialize(self) -> None:
+        # Семафор создается в цикле событий, в котором будет работать бот
+        self._slots = asyncio.Semaphore(self.pool_size)
+        await super().initialize()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        # URL имеет вид https://api.telegram.org/bot<token>/<method>
+        api_method = url.rsplit('/', 1)[-1]
+        method_timeout = self.method_timeouts.get(api_method)
+        if method_timeout is not None:
+            if read_timeout is BaseRequest.DEFAULT_NONE:
+                read_timeout = method_timeout
+            if write_timeout is BaseRequest.DEFAULT_NONE or write_timeout is UPLOAD_WRITE_TIMEOUT:
+                write_timeout = method_timeout
+        if pool_timeout is BaseRequest.DEFAULT_NONE:
+            pool_timeout = self._client.timeout.pool
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), pool_timeout)
+        except asyncio.TimeoutError:
+            TELEGRAM_API_POOL_WAIT.observe(time.perf_counter() - started, self.bot_name, self.pool_name)
+            TELEGRAM_API_ERRORS.inc(self.bot_name, api_method, 'PoolTimeout')
+            raise TimedOut(
+                f'Pool timeout: все {self.pool_size} соединений пула {self.pool_name} заняты, '
+                f'запрос {api_method} не отправлен'
+            ) from None
+        acquired = time.perf_counter()
+        TELEGRAM_API_POOL_WAIT.observe(acquired - started, self.bot_name, self.pool_name)
+        try:
+            status, content = await super().do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout,
+            )
+        except Exception as e:
+            TELEGRAM_API_ERRORS.inc(self.bot_name, api_method, type(e).__name__)
+            raise
+        finally:
+            self._slots.release()
+        TELEGRAM_API_DURATION.observe(time.perf_counter() - acquired, self.bot_name, api_method, str(status))
+        return status, content
+
+
+def _upload_method(method):
+    @functools.wraps(method)
+    async def wrapper(self, *args, write_timeout=UPLOAD_WRITE_TIMEOUT, **kwargs):
+        return await method(self, *args, write_timeout=write_timeout, **kwargs)
+    return wrapper
+
+
+class UploadTimeoutBot(ExtBot):
+    """
+    ExtBot, методы загрузки файлов которого передают UPLOAD_WRITE_TIMEOUT,
+    если write_timeout не задан в вызове.
+    """
+
+
+# Методы загрузки - те, у которых PTB задает write_timeout=20 по умолчанию
+UPLOAD_METHODS = tuple(
+    name for name, method in inspect.getmembers(ExtBot, inspect.iscoroutinefunction)
+    if not name.startswith('_') and name.islower()
+    and getattr(inspect.signature(method).parameters.get('write_timeout'), 'default', None) == PTB_UPLOAD_WRITE_TIMEOUT
+)
+for _name in UPLOAD_METHODS:
+    setattr(UploadTimeoutBot, _name, _upload_method(getattr(ExtBot, _name)))
+
+
+def build_requests(bot_name: str) -> Tuple[InstrumentedHTTPXRequest, InstrumentedHTTPXRequest]:
+    """Запросы бота по настройкам TELEGRAM_API_*: для исходящих вызовов и для getUpdates"""
+    timeouts = {
+        'connect_timeout': settings.TELEGRAM_API_CONNECT_TIMEOUT,
+        'read_timeout': settings.TELEGRAM_API_READ_TIMEOUT,
+        'write_timeout': settings.TELEGRAM_API_WRITE_TIMEOUT,
+        'pool_timeout': settings.TELEGRAM_API_POOL_TIMEOUT,
+    }
+    request = InstrumentedHTTPXRequest(
+        settings.TELEGRAM_API_POOL_SIZE,
+        bot_name=bot_name,
+        pool_name='api',
+        keepalive_connections=settings.TELEGRAM_API_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.TELEGRAM_API_KEEPALIVE_EXPIRY,
+        http2=settings.TELEGRAM_API_HTTP2,
+        method_timeouts=settings.TELEGRAM_API_METHOD_TIMEOUTS,
+        **timeouts,
+    )
+    # getUpdates выполняется по одному запросу за раз, таймаут чтения передает
+    # сам PTB (длительность long polling + read_timeout); HTTP/2 здесь не нужен
+    updates = InstrumentedHTTPXRequest(
+        1,
+        bot_name=bot_name,
+        pool_name='updates',
+        keepalive_expiry=settings.TELEGRAM_API_KEEPALIVE_EXPIRY,
+        **timeouts,
+    )
+    return request, updates
@@ -0,0 +1,192 @@
+"""
+Очередь входящих обновлений бота в базе данных.
+
+Один приемник (long polling или webhook) записывает обновления в таблицу
+BotUpdate, несколько процессов-воркеров их обрабатывают. Обновление
+попадает в партицию ``chat_id % BOT_QUEUE_PARTITIONS``, каждая партиция
+принадлежит ровно одному воркеру, а внутри партиции обновления
+обрабатываются по возрастанию id - так сохраняется порядок сообщений чата
+без блокировок строк.
+
+telegram импортируется внутри функций воркера и приемника: enqueue_updates
+вызывается и из процесса API (webhook), которому эта зависимость не нужна.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from typing import Iterable, List, Optional
+from .models import BotUpdate
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _nested_id(obj, *keys) -> int:
+    for key in keys:
+        if not isinstance(obj, dict):
+            raise ValueError(f'ожидается объект с полем {key}')
+        obj = obj.get(key)
+    if not isinstance(obj, int):
+        raise ValueError(f"ожидается целое {'.'.join(keys)}")
+    return obj
+
+
+def get_chat_id(payload: dict):
+    """
+    ID чата обновления (или пользователя, если чата нет).
+
+    Raises:
+        ValueError: В сообщении или callback_query нет chat.id / from.id
+    """
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in payload:
+            return _nested_id(payload[key], 'chat', 'id')
+    callback_query = payload.get('callback_query')
+    if callback_query is not None:
+        message = callback_query.get('message') if isinstance(callback_query, dict) else None
+        if message:
+            return _nested_id(message, 'chat', 'id')
+        return _nested_id(callback_query, 'from', 'id')
+    for value in payload.values():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return _nested_id(value, 'from', 'id')
+    return None
+
+
+def partition_for(chat_id, partitions: int = None) -> int:
+    partitions = partitions or settings.BOT_QUEUE_PARTITIONS
+    return (chat_id or 0) % partitions
+
+
+def partitions_for_worker(index: int, workers: int, partitions: int = None) -> List[int]:
+    """Партиции, закрепленные за воркером с номером index"""
+    partitions = partitions or settings.BOT_QUEUE_PARTITIONS
+    return [partition for partition in range(partitions) if partition % workers == index]
+
+
+def enqueue_updates(payloads: Iterable[dict]) -> int:
+    """
+    Запись обновлений в очередь.
+
+    Повторно полученные обновления (например, повтор webhook) пропускаются
+    по уникальному update_id.
+
+    Raises:
+        ValueError: Обновление без ID чата в сообщении (см. get_chat_id)
+    """
+    rows = []
+    for payload in payloads:
+        chat_id = get_chat_id(payload)
+        rows.append(BotUpdate(
+            update_id=payload['update_id'],
+            chat_id=chat_id,
+            partition=partition_for(chat_id),
+            payload=payload,
+        ))
+    BotUpdate.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def claim_batch(partitions: List[int], limit: int) -> List[BotUpdate]:
+    """Следующие обновления партиций воркера в порядке поступления"""
+    return list(BotUpdate.objects.filter(partition__in=partitions).order_by('id')[:limit])
+
+
+def acknowledge(ids: List[int]) -> None:
+    """Удаление обработанных обновлений"""
+    BotUpdate.objects.filter(id__in=ids).delete()
+
+
+async def process_batch(application, partitions: List[int], limit: int,
+                        stopping: Optional[asyncio.Event] = None) -> int:
+    """
+    Обработка одной пачки обновлений.
+
+    Обновления удаляются из очереди только после обработки пачки, поэтому
+    при падении воркера пачка будет обработана повторно (at-least-once).
+    После установки stopping следующие обновления пачки не обрабатываются,
+    подтверждаются только уже обработанные.
+    """
+    from telegram import Update
+
+    rows = await sync_to_async(claim_batch)(partitions, limit)
+    processed = []
+    for row in rows:
+        if stopping is not None and stopping.is_set():
+            break
+        update = Update.de_json(row.payload, application.bot)
+        # Исключения обработчиков Application передает в error handlers
+        await application.process_update(update)
+        processed.append(row.id)
+    if processed:
+        await sync_to_async(acknowledge)(processed)
+    return len(processed)
+
+
+async def run_worker(application, index: int, workers: int, poll_interval: float = None,
+                     batch_size: int = None, stopping: Optional[asyncio.Event] = None) -> None:
+    """Цикл воркера: обработка своих партиций до SIGINT / SIGTERM или установки stopping"""
+    from .counters import POST_VIEWS
+    from .shutdown import install_stop_signals
+
+    poll_interval = poll_interval if poll_interval is not None else settings.BOT_QUEUE_POLL_INTERVAL
+    batch_size = batch_size or settings.BOT_QUEUE_BATCH_SIZE
+    partitions = partitions_for_worker(index, workers)
+    if stopping is None:
+        stopping = asyncio.Event()
+        install_stop_signals(stopping)
+    logger.info('Воркер %s/%s обрабатывает партиции %s', index + 1, workers, partitions)
+    POST_VIEWS.start()
+    async with application:
+        # start() нужен для периодического сохранения persistence
+        await application.start()
+        try:
+            while not stopping.is_set():
+                if not await process_batch(application, partitions, batch_size, stopping):
+                    try:
+                        await asyncio.wait_for(stopping.wait(), poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await application.stop()
+            await sync_to_async(POST_VIEWS.stop)()
+
+
+async def _receive_updates(bot, timeout: int) -> None:
+    from telegram import Update
+
+    offset = None
+    while True:
+        updates = await bot.get_updates(
+            offset=offset,
+            timeout=timeout,
+            read_timeout=timeout + 10,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        if not updates:
+            continue
+        # Смещение подтверждается только после записи в очередь
+        await sync_to_async(enqueue_updates)([update.to_dict() for update in updates])
+        offset = updates[-1].update_id + 1
+
+
+async def run_polling_receiver(bot, timeout: int = 30, stopping: Optional[asyncio.Event] = None) -> None:
+    """Приемник: long polling getUpdates с записью обновлений в очередь до SIGINT / SIGTERM"""
+    from .shutdown import install_stop_signals
+
+    if stopping is None:
+        stopping = asyncio.Event()
+        install_stop_signals(stopping)
+    async with bot:
+        await bot.delete_webhook()
+        # Прерванный getUpdates не подтверждает смещение: Telegram отдаст эти
+        # обновления снова, а повторная запись в очередь пропускается по update_id
+        receiving = asyncio.ensure_future(_receive_updates(bot, timeout))
+        waiting = asyncio.ensure_future(stopping.wait())
+        done, _ = await asyncio.wait({receiving, waiting}, return_when=asyncio.FIRST_COMPLETED)
+        if receiving in done:
+            receiving.result()
+        receiving.cancel()
+        waiting.cancel()
+        await asyncio.gather(receiving, waiting, return_exceptions=True)
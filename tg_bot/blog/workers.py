@@ -0,0 +1,83 @@
+"""
+Запуск бота в режиме приемник + пул процессов-воркеров.
+
+Модуль не импортирует модели на уровне модуля: воркеры запускаются через
+multiprocessing (spawn) и вызывают django.setup() сами.
+"""
+
+import asyncio
+import multiprocessing
+import signal
+import threading
+import time
+
+
+def worker_process(index, workers):
+    """Точка входа процесса-воркера"""
+    import django
+    django.setup()
+
+    from .bot import TelegramBot
+    from .update_queue import run_worker
+
+    try:
+        asyncio.run(run_worker(TelegramBot().application, index, workers))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_scaled(workers, receiver='polling'):
+    """
+    Запуск воркеров и приемника.
+
+    Args:
+        workers (int): Количество процессов-воркеров
+        receiver (str): 'polling' - приемник getUpdates в текущем процессе,
+            'webhook' - обновления пишет эндпоинт webhook процесса API
+    """
+    from django.conf import settings
+    from django.db import connections
+    from .shutdown import STOP_SIGNALS
+
+    # Открытые соединения не должны наследоваться дочерними процессами
+    connections.close_all()
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=worker_process, args=(index, workers), name=f'bot-worker-{index}', daemon=True)
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        if receiver == 'polling':
+            from .bot import TelegramBot
+            from .update_queue import run_polling_receiver
+
+            asyncio.run(run_polling_receiver(TelegramBot().application.bot))
+        else:
+            stopping = threading.Event()
+            for sig in STOP_SIGNALS:
+                signal.signal(sig, lambda signum, frame: stopping.set())
+            while not stopping.is_set() and any(process.is_alive() for process in processes):
+                stopping.wait(0.5)
+    finally:
+        stop_workers(processes, settings.BOT_SHUTDOWN_TIMEOUT)
+
+
+def stop_workers(processes, timeout):
+    """
+    Остановка воркеров: SIGTERM, ожидание до timeout секунд, затем SIGKILL.
+
+    Получив SIGTERM, воркер дообрабатывает текущее обновление; обновления,
+    которые он не успел подтвердить, остаются в очереди.
+    """
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(deadline - time.monotonic(), 0))
+        if process.is_alive():
+            process.kill()
+            process.join()
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from jobs.queue import TASKS, Worker
+from tg_bot.metrics import start_http_server
+import signal
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер очереди фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Количество потоков, выполняющих задачи')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Пауза опроса пустой очереди в секундах (по умолчанию JOBS_POLL_INTERVAL)')
+        parser.add_argument('--burst', action='store_true',
+                            help='Выполнить задачи из очереди и завершиться')
+        parser.add_argument('--metrics-port', type=int, default=0,
+                            help='Порт HTTP-сервера метрик (0 - не запускать)')
+
+    def handle(self, *args, **options):
+        worker = Worker(options['concurrency'], options['poll_interval'], options['burst'])
+        if options['metrics_port']:
+            start_http_server(options['metrics_port'])
+
+        def stop(signum, frame):
+            self.stdout.write(self.style.WARNING('Остановка после завершения текущих задач...'))
+            worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Воркер запущен, потоков: {options['concurrency']}, задачи: {', '.join(sorted(TASKS)) or 'нет'}"
+        ))
+        worker.run()
+        self.stdout.write(self.style.SUCCESS('Воркер остановлен'))
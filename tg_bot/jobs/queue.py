@@ -0,0 +1,196 @@
+"""
+Очередь фоновых задач в базе данных.
+
+Задача - функция, зарегистрированная декоратором @task('имя') в модуле
+tasks.py приложения (модули загружаются при старте Django). Побочные
+эффекты записи ставятся в очередь через enqueue_on_commit: задача
+появляется в таблице только после фиксации транзакции, HTTP-запрос не ждет
+ее выполнения, а воркер не увидит незафиксированных данных.
+
+Воркеры (manage.py runworker) забирают задачи на PostgreSQL через
+SELECT ... FOR UPDATE SKIP LOCKED, на SQLite - одним UPDATE: SQLite
+сериализует запись, поэтому задачу получит только один воркер. Выполненные
+задачи удаляются, упавшие повторяются с экспоненциальной паузой и после
+max_attempts остаются в статусе failed.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from typing import Callable, Dict, List, Optional
+from tg_bot.metrics import JOB_DURATION
+from tg_bot.slowlog import QUERY_SOURCE
+from .models import Job
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+TASKS: Dict[str, Callable] = {}
+
+
+def task(name: str):
+    """Регистрация функции как фоновой задачи с именем name"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name: str, payload: Optional[dict] = None, delay: float = 0,
+            max_attempts: Optional[int] = None) -> Job:
+    """
+    Постановка задачи в очередь.
+
+    Args:
+        name (str): Имя зарегистрированной задачи
+        payload (dict, optional): Именованные аргументы задачи (JSON)
+        delay (float): Задержка запуска в секундах
+        max_attempts (int, optional): Число попыток, по умолчанию JOBS_MAX_ATTEMPTS
+
+    Raises:
+        ValueError: Если задача не зарегистрирована
+    """
+    if name not in TASKS:
+        raise ValueError(f'Неизвестная задача: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_on_commit(name: str, payload: Optional[dict] = None, **kwargs) -> None:
+    """Постановка задачи в очередь после фиксации текущей транзакции"""
+    if name not in TASKS:
+        raise ValueError(f'Неизвестная задача: {name}')
+    transaction.on_commit(lambda: enqueue(name, payload, **kwargs))
+
+
+def retry_delay(attempt: int) -> float:
+    """Пауза перед повтором: экспоненциальный рост с небольшим разбросом"""
+    delay = min(settings.JOBS_RETRY_BACKOFF * 2 ** (attempt - 1), settings.JOBS_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(1.0, 1.1)
+
+
+def claim(worker_id: str, limit: int = 1) -> List[Job]:
+    """
+    Захват готовых к запуску задач воркером.
+
+    Кроме задач в очереди забираются задачи, зависшие в статусе running
+    дольше JOBS_LOCK_TIMEOUT (воркер упал, не завершив задачу).
+    """
+    now = timezone.now()
+    ready = (
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT))
+    )
+    candidates = Job.objects.filter(ready).order_by('run_at', 'id')
+    claimed = {'status': Job.RUNNING, 'locked_by': worker_id, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            if not ids:
+                return []
+            Job.objects.filter(id__in=ids).update(**claimed)
+    else:
+        # Один UPDATE с подзапросом атомарен: параллельный воркер увидит
+        # задачу уже в статусе running
+        if not Job.objects.filter(id__in=candidates.values('id')[:limit]).update(**claimed):
+            return []
+    return list(Job.objects.filter(locked_by=worker_id, locked_at=now, status=Job.RUNNING))
+
+
+def execute(job: Job) -> bool:
+    """Выполнение захваченной задачи, возвращает True при успехе"""
+    started = time.perf_counter()
+    owned = Job.objects.filter(id=job.id, locked_by=job.locked_by, locked_at=job.locked_at)
+    source = QUERY_SOURCE.set(f'job:{job.name}')
+    try:
+        func = TASKS.get(job.name)
+        if func is None:
+            raise LookupError(f'Неизвестная задача: {job.name}')
+        func(**job.payload)
+    except Exception:
+        QUERY_SOURCE.reset(source)
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Задача %s исчерпала попытки (%s)', job, job.attempts)
+            owned.update(status=Job.FAILED, locked_by='', locked_at=None, last_error=error)
+            outcome = 'failed'
+        else:
+            delay = retry_delay(job.attempts)
+            logger.warning('Задача %s упала, повтор через %.0f с', job, delay)
+            owned.update(
+                status=Job.QUEUED, locked_by='', locked_at=None, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+            outcome = 'retry'
+        JOB_DURATION.observe(time.perf_counter() - started, job.name, outcome)
+        return False
+    QUERY_SOURCE.reset(source)
+    owned.delete()
+    JOB_DURATION.observe(time.perf_counter() - started, job.name, 'ok')
+    return True
+
+
+class Worker:
+    """Пул потоков, выполняющих задачи из очереди"""
+
+    def __init__(self, concurrency: int = 1, poll_interval: Optional[float] = None, burst: bool = False):
+        """
+        Args:
+            concurrency (int): Количество потоков
+            poll_interval (float, optional): Пауза опроса пустой очереди, по умолчанию JOBS_POLL_INTERVAL
+            burst (bool): Завершиться, когда очередь опустеет
+        """
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval if poll_interval is not None else settings.JOBS_POLL_INTERVAL
+        self.burst = burst
+        self._stopping = threading.Event()
+        self._prefix = f'{socket.gethostname()[:40]}:{os.getpid()}'
+
+    def run_once(self, worker_id: str) -> bool:
+        """Захват и выполнение одной задачи, False - очередь пуста"""
+        close_old_connections()
+        jobs = claim(worker_id)
+        for job in jobs:
+            execute(job)
+        return bool(jobs)
+
+    def _loop(self, index: int) -> None:
+        worker_id = f'{self._prefix}:{index}'
+        try:
+            while not self._stopping.is_set():
+                if not self.run_once(worker_id):
+                    if self.burst:
+                        break
+                    self._stopping.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+    def run(self) -> None:
+        """Запуск потоков и ожидание их завершения"""
+        threads = [
+            threading.Thread(target=self._loop, args=(index,), name=f'job-worker-{index}')
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        # join с таймаутом, чтобы главный поток продолжал получать сигналы
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+
+    def stop(self) -> None:
+        """Остановка после завершения текущих задач"""
+        self._stopping.set()
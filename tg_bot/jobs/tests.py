@@ -0,0 +1,123 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from blog.services import create_post
+from blog.tasks import post_saved
+from .models import Job
+from .queue import Worker, claim, enqueue, enqueue_on_commit, execute, task
+
+User = get_user_model()
+
+CALLS = []
+
+
+@task('tests.record')
+def record(value):
+    CALLS.append(value)
+
+
+@task('tests.fail')
+def fail():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_on_commit(self):
+        """Тест постановки задачи только после фиксации транзакции"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            enqueue_on_commit('tests.record', {'value': 1})
+            self.assertFalse(Job.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Job.objects.get().payload, {'value': 1})
+        with self.assertRaises(ValueError):
+            enqueue_on_commit('tests.unknown')
+
+    def test_claim_and_execute(self):
+        """Тест захвата задачи одним воркером и удаления выполненной задачи"""
+        enqueue('tests.record', {'value': 'a'})
+        enqueue('tests.record', {'value': 'later'}, delay=60)
+        jobs = claim('worker-1', limit=10)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(claim('worker-2'), [])
+        self.assertTrue(execute(jobs[0]))
+        self.assertEqual(CALLS, ['a'])
+        self.assertEqual(Job.objects.count(), 1)
+
+    @override_settings(JOBS_RETRY_BACKOFF=10)
+    def test_retry_with_backoff(self):
+        """Тест повтора упавшей задачи с паузой и статуса failed после последней попытки"""
+        job = enqueue('tests.fail', max_attempts=2)
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertFalse(execute(claim('worker-1')[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=9))
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(execute(claim('worker-1')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(claim('worker-1'), [])
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_stale_job_reclaimed(self):
+        """Тест повторной выдачи задачи, зависшей у упавшего воркера"""
+        job = enqueue('tests.record', {'value': 'b'})
+        claim('worker-1')
+        self.assertEqual(claim('worker-2'), [])
+        Job.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(seconds=61))
+        jobs = claim('worker-2')
+        self.assertEqual([(item.id, item.attempts) for item in jobs], [(job.id, 2)])
+
+    def test_post_saved_runs_in_worker(self):
+        """Тест выполнения получателя post_saved воркером, а не в запросе"""
+        user = User.objects.create_user(username='author', password='testpass123')
+        received = []
+
+        def receiver(sender, post_id, created, **kwargs):
+            received.append((post_id, created))
+
+        post_saved.connect(receiver)
+        self.addCleanup(post_saved.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(user.id, 'Title', 'Content')
+        self.assertEqual(received, [])
+
+        self.assertTrue(Worker(burst=True).run_once('worker-1'))
+        self.assertEqual(received, [(post.id, True)])
+        self.assertFalse(Job.objects.exists())
+
+    def test_post_saved_delayed_until_publish(self):
+        """Тест запуска post_saved отложенного поста в момент публикации"""
+        user = User.objects.create_user(username='author', password='testpass123')
+        received = []
+
+        def receiver(sender, post_id, created, **kwargs):
+            received.append(post_id)
+
+        post_saved.connect(receiver)
+        self.addCleanup(post_saved.disconnect, receiver)
+        publish_at = timezone.now() + timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(user.id, 'Title', 'Content', publish_at=publish_at)
+        job = Job.objects.get(name='blog.post_saved')
+        self.assertAlmostEqual((job.run_at - publish_at).total_seconds(), 0, delta=1)
+        self.assertFalse(Worker(burst=True).run_once('worker-1'))
+
+        # Задача, запущенная до перенесенного времени публикации, сигнал не отправляет
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        self.assertTrue(Worker(burst=True).run_once('worker-1'))
+        self.assertEqual(received, [])
+        post.publish_at = timezone.now()
+        post.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_post(user.id, 'Now', 'Content')
+        Worker(burst=True).run_once('worker-1')
+        self.assertEqual(len(received), 1)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""Запуск Telegram бота с облегченными настройками (tg_bot.settings_bot)."""
+import os
+import sys
+import time
+
+# Засекаем как можно раньше, до импорта Django
+STARTED = time.perf_counter()
+
+
+def main():
+    """Запуск бота"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tg_bot.settings_bot')
+
+    from tg_bot.startup import StartupProfile
+    profile = StartupProfile(started=STARTED)
+
+    with profile.phase('django.setup()'):
+        import django
+        django.setup()
+
+    with profile.phase('import blog.bot'):
+        from blog.bot import run_bot
+
+    run_bot(profile=profile, dry_run='--dry-run' in sys.argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Общие инструменты админки для больших таблиц.
+
+EstimatedCountPaginator заменяет COUNT(*) по всей таблице оценкой из
+статистики базы, а для отфильтрованных списков считает строки только до
+ADMIN_COUNT_LIMIT. IndexedSearchMixin ищет по индексам (префикс и точное
+совпадение) вместо LIKE '%...%' по всем search_fields.
+"""
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+from typing import Optional
+
+INTEGER_PK_TYPES = ('AutoField', 'BigAutoField', 'SmallAutoField')
+
+# Максимум ключей связанной модели, подставляемых в поиск по search_exact_fields
+MAX_RELATED_KEYS = 100
+
+# Верхняя граница символов Unicode для префиксного поиска диапазоном
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+# Базы, где строки по умолчанию сравниваются по кодам символов (BINARY в
+# SQLite), и префикс можно искать диапазоном
+CODEPOINT_ORDER_VENDORS = ('sqlite',)
+
+
+def prefix_query(field: str, term: str, vendor: str) -> Q:
+    """
+    Условие "значение field начинается с term" с учетом регистра.
+
+    Диапазон field >= term AND field < term + U+10FFFF верен только при
+    сравнении строк по кодам символов, поэтому используется лишь в SQLite
+    (там LIKE без учета регистра). В остальных базах - startswith
+    (LIKE 'term%'): в PostgreSQL он идет по B-tree индексу только при
+    collation "C" или индексе с varchar_pattern_ops, иначе просматривается
+    таблица.
+    """
+    if vendor in CODEPOINT_ORDER_VENDORS:
+        return Q(**{f'{field}__gte': term, f'{field}__lt': term + PREFIX_UPPER_BOUND})
+    return Q(**{f'{field}__startswith': term})
+
+
+def table_estimate(queryset) -> Optional[int]:
+    """
+    Оценка числа строк таблицы без полного сканирования.
+
+    PostgreSQL - reltuples из pg_class (обновляется ANALYZE/autovacuum),
+    остальные базы - максимальный целочисленный первичный ключ по индексу.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 - таблица еще не анализировалась
+        return int(row[0]) if row and row[0] >= 0 else None
+    if model._meta.pk.get_internal_type() in INTEGER_PK_TYPES:
+        return model._default_manager.using(queryset.db).aggregate(value=Max('pk'))['value'] or 0
+    return None
+
+
+def estimated_count(queryset) -> int:
+    """
+    Количество строк для пагинации за ограниченное время.
+
+    Без фильтров при большой таблице возвращается оценка, при малой -
+    точное значение. С фильтрами строки считаются до ADMIN_COUNT_LIMIT.
+    """
+    if not queryset.query.where:
+        estimate = table_estimate(queryset)
+        if estimate is not None and estimate >= settings.ADMIN_EXACT_COUNT_THRESHOLD:
+            return estimate
+        return queryset.count()
+    return queryset.order_by()[:settings.ADMIN_COUNT_LIMIT].count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор с оценкой количества вместо полного COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class IndexedSearchMixin:
+    """
+    Поиск в changelist только по индексированным полям.
+
+    search_prefix_fields - поиск по началу значения (с учетом регистра,
+    см. prefix_query); search_exact_fields - точное совпадение. Числовой
+    запрос дополнительно ищется по первичному ключу. Поле связанной модели
+    (author__username) допускается только в search_exact_fields.
+    """
+    search_prefix_fields = ()
+    search_exact_fields = ()
+
+    def get_search_fields(self, request):
+        # Непустой список нужен, чтобы changelist показал строку поиска
+        return tuple(self.search_prefix_fields) + tuple(self.search_exact_fields)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        query = Q()
+        vendor = connections[queryset.db].vendor
+        if term.isdigit():
+            query |= Q(pk=int(term))
+        for field in self.search_prefix_fields:
+            query |= prefix_query(field, term, vendor)
+        for field in self.search_exact_fields:
+            relation, _, remote_field = field.partition('__')
+            if remote_field:
+                # Поле связанной модели: сначала находим ключи по ее индексу,
+                # чтобы основной запрос фильтровал по внешнему ключу без JOIN
+                related_model = queryset.model._meta.get_field(relation).related_model
+                keys = related_model._default_manager.filter(**{remote_field: term}).values_list('pk', flat=True)
+                query |= Q(**{f'{relation}__in': list(keys[:MAX_RELATED_KEYS])})
+            else:
+                query |= Q(**{field: term})
+        return queryset.filter(query), False
@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tg_bot.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from .background import BackgroundThreadsASGI  # noqa: E402
+from .lifespan import Lifespan  # noqa: E402
+
+# Бот в том же цикле событий при ASGI_RUN_BOT (запуск и остановка по lifespan);
+# запись просмотров и отложенные публикации - фоновые потоки, которые
+# запускаются в каждом процессе при первом запросе (tg_bot.background)
+application = Lifespan(BackgroundThreadsASGI(django_application), run_bot=settings.ASGI_RUN_BOT)
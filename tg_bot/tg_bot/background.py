@@ -0,0 +1,61 @@
+"""
+Фоновые потоки процесса API.
+
+Запись буфера просмотров (blog.counters.POST_VIEWS) и планировщик
+отложенных публикаций (blog.scheduler.PUBLICATIONS) работают в потоках
+процесса. Потоки не переживают fork, поэтому они запускаются не при
+импорте wsgi/asgi: gunicorn --preload импортирует приложение в главном
+процессе до создания воркеров, и потоки остались бы только в нем.
+Обертки приложения запускают их в каждом процессе при первом запросе.
+
+Вместо первого запроса потоки можно запускать хуком сервера, например
+в gunicorn.conf.py:
+
+    def post_fork(server, worker):
+        from tg_bot.background import start_background_threads
+        start_background_threads()
+"""
+
+import os
+import threading
+
+_lock = threading.Lock()
+_started_pid = None
+
+
+def start_background_threads() -> None:
+    """Запуск фоновых потоков один раз в каждом процессе"""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _lock:
+        if _started_pid == os.getpid():
+            return
+        from blog.counters import POST_VIEWS
+        from blog.scheduler import PUBLICATIONS
+
+        POST_VIEWS.start()
+        PUBLICATIONS.start()
+        _started_pid = os.getpid()
+
+
+class BackgroundThreadsWSGI:
+    """WSGI-приложение, запускающее фоновые потоки процесса при первом запросе"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        start_background_threads()
+        return self.app(environ, start_response)
+
+
+class BackgroundThreadsASGI:
+    """ASGI-приложение, запускающее фоновые потоки процесса при первом запросе"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        start_background_threads()
+        return await self.app(scope, receive, send)
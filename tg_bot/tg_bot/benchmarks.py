@@ -0,0 +1,224 @@
+"""
+Набор бенчмарков производительности API и сервисов бота.
+
+Каждый сценарий выполняется несколько раз через полный стек Django
+(тестовый клиент, middleware, роутеры ninja). Для каждого сценария
+задан бюджет SQL-запросов: его превышение означает регрессию вроде N+1
+независимо от времени выполнения.
+"""
+
+import json
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from blog.models import Post
+from blog.services import get_post_by_id, get_post_titles, get_posts_by_ids
+from users.models import User
+from users.revocation import REVOCATIONS
+from users.services import issue_tokens
+
+BENCH_PASSWORD = 'benchpass123'
+
+
+@dataclass
+class BenchmarkCase:
+    """Сценарий бенчмарка"""
+    name: str
+    run: Callable[[], object]
+    query_budget: int
+    setup: Optional[Callable[[], None]] = None
+    repeat: Optional[int] = None
+
+
+@dataclass
+class BenchmarkResult:
+    """Результат сценария"""
+    name: str
+    median_ms: float
+    p95_ms: float
+    queries: int
+    query_budget: int
+    errors: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {'median_ms': round(self.median_ms, 3), 'p95_ms': round(self.p95_ms, 3), 'queries': self.queries}
+
+
+def seed(posts: int, content_length: int = 500, posts_per_author: int = 100) -> User:
+    """
+    Заполнение базы тестовыми данными.
+
+    Пароль хешируется один раз и переиспользуется для всех авторов.
+    Возвращает пользователя, от имени которого выполняются сценарии.
+    """
+    password = make_password(BENCH_PASSWORD)
+    authors = User.objects.bulk_create(
+        [
+            User(username=f'bench{index}', email=f'bench{index}@example.com', password=password)
+            for index in range(max(posts // posts_per_author, 1))
+        ],
+        batch_size=1000,
+    )
+    content = ('Benchmark content. ' * (content_length // 19 + 1))[:content_length]
+    batch = []
+    for index in range(posts):
+        batch.append(Post(title=f'Post {index}', content=content, author=authors[index % len(authors)]))
+        if len(batch) == 1000:
+            Post.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Post.objects.bulk_create(batch)
+    return authors[0]
+
+
+def build_cases(user: User) -> List[BenchmarkCase]:
+    """Сценарии бенчмарков с бюджетами SQL-запросов"""
+    tokens = issue_tokens(user.id)
+    client = Client()
+    auth = {'HTTP_AUTHORIZATION': f'Bearer {tokens["access"]}'}
+    post_id = Post.objects.filter(author=user).values_list('id', flat=True).first()
+    batch_ids = list(Post.objects.values_list('id', flat=True)[:20])
+    state = {'registered': 0, 'deleted': None, 'refresh': None}
+
+    def warm_revocations():
+        # Подгрузка отзывов JWT выполняется раз в JWT_REVOCATION_REFRESH_INTERVAL
+        # и в бюджет отдельного запроса не входит
+        REVOCATIONS.refresh(force=True)
+
+    def issue_refresh():
+        # Использованный refresh-токен отзывается, каждому повтору нужен новый
+        state['refresh'] = issue_tokens(user.id)['refresh']
+        warm_revocations()
+
+    def register():
+        state['registered'] += 1
+        name = f'newbench{state["registered"]}'
+        return client.post(
+            '/api/users/register', {'username': name, 'password': BENCH_PASSWORD, 'email': f'{name}@example.com'},
+            content_type='application/json',
+        )
+
+    def create_post_to_delete():
+        state['deleted'] = Post.objects.create(title='To delete', content='', author=user).id
+        warm_revocations()
+
+    return [
+        BenchmarkCase('blog.list_posts', lambda: client.get('/api/blog/posts'), 1),
+        BenchmarkCase('blog.get_post', lambda: client.get(f'/api/blog/posts/{post_id}'), 2),
+        BenchmarkCase('blog.create_post', lambda: client.post(
+            '/api/blog/posts', {'title': 'Bench', 'content': 'Bench content'},
+            content_type='application/json', **auth,
+        ), 2, setup=warm_revocations),
+        # Условный UPDATE версии, чтение прежней редакции, запись истории и
+        # UPDATE измененных полей в одной транзакции
+        BenchmarkCase('blog.update_post', lambda: client.put(
+            f'/api/blog/posts/{post_id}', {'title': 'Bench updated'},
+            content_type='application/json', **auth,
+        ), 6, setup=warm_revocations),
+        # Имена файлов вложений, каскад Django (ID поста, ID вложений, DELETE
+        # истории и поста) в одной транзакции
+        BenchmarkCase('blog.delete_post', lambda: client.delete(
+            f'/api/blog/posts/{state["deleted"]}', **auth,
+        ), 7, setup=create_post_to_delete),
+        BenchmarkCase('users.register', register, 3, repeat=3),
+        BenchmarkCase('users.login', lambda: client.post(
+            '/api/users/login', {'username': user.username, 'password': BENCH_PASSWORD},
+            content_type='application/json',
+        ), 1, repeat=3),
+        BenchmarkCase('users.refresh', lambda: client.post(
+            '/api/users/refresh', {'refresh': state['refresh']}, content_type='application/json',
+        ), 4, setup=issue_refresh),
+        BenchmarkCase('users.me', lambda: client.get('/api/users/me', **auth), 1, setup=warm_revocations),
+        BenchmarkCase('bot.get_post_titles', lambda: [post.title for post in get_post_titles()], 1),
+        BenchmarkCase('bot.get_post_by_id', lambda: get_post_by_id(post_id, bot_id=1).author.username, 2),
+        # Пакет загрузчика бота (blog.loaders): запросов столько же, сколько для одного поста
+        BenchmarkCase('bot.get_posts_by_ids', lambda: [
+            post.author.username for post in get_posts_by_ids(batch_ids, bot_id=1).values()
+        ], 2),
+    ]
+
+
+def run_case(case: BenchmarkCase, repeat: int) -> BenchmarkResult:
+    """Выполнение сценария и сбор времени и числа запросов"""
+    timings = []
+    queries = 0
+    errors = []
+    for _ in range(case.repeat or repeat):
+        if case.setup:
+            case.setup()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            result = case.run()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(captured))
+        status = getattr(result, 'status_code', 200)
+        if status >= 400:
+            errors.append(f'HTTP {status}')
+    timings.sort()
+    result = BenchmarkResult(
+        name=case.name,
+        median_ms=statistics.median(timings),
+        p95_ms=timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        queries=queries,
+        query_budget=case.query_budget,
+        errors=sorted(set(errors)),
+    )
+    if queries > case.query_budget:
+        result.errors.append(f'{queries} SQL-запросов при бюджете {case.query_budget}')
+    return result
+
+
+def run_benchmarks(posts: int, repeat: int, content_length: int = 500) -> List[BenchmarkResult]:
+    """Заполнение базы и выполнение всех сценариев"""
+    user = seed(posts, content_length)
+    # Повторы сценария превысили бы лимиты частоты; бенчмарк измеряет обработку запроса
+    with override_settings(API_THROTTLE_RATES={}):
+        return [run_case(case, repeat) for case in build_cases(user)]
+
+
+def load_baseline(path) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, baseline: dict) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict[str, dict], threshold: float,
+            min_delta_ms: float = 1.0) -> List[str]:
+    """
+    Сравнение с базовой линией.
+
+    Возвращает список регрессий: медиана выросла больше чем на ``threshold``
+    (доля) и не меньше чем на ``min_delta_ms``, или выросло число SQL-запросов.
+    Абсолютный порог отсекает шум на сценариях, выполняющихся за доли миллисекунды.
+    """
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if not reference:
+            continue
+        delta = result.median_ms - reference['median_ms']
+        if delta > reference['median_ms'] * threshold and delta >= min_delta_ms:
+            regressions.append(
+                f"{result.name}: медиана {result.median_ms:.3f} мс, "
+                f"базовая {reference['median_ms']:.3f} мс (+{result.median_ms / reference['median_ms'] - 1:.0%})"
+            )
+        if result.queries > reference['queries']:
+            regressions.append(
+                f"{result.name}: {result.queries} SQL-запросов, в базовой линии {reference['queries']}"
+            )
+    return regressions
@@ -0,0 +1,67 @@
+"""
+Проверки состояния процесса API для балансировщика и оркестратора.
+
+/healthz (liveness) отвечает, пока процесс обслуживает запросы, и не
+обращается к базе: недоступность базы не должна приводить к перезапуску
+всех экземпляров. /readyz (readiness) проверяет соединение с базой, а
+при первом вызове прогревает кеши процесса (таблицы reverse(), отзывы
+JWT), поэтому новый экземпляр получает трафик уже прогретым и первые
+запросы после деплоя не платят за ленивую инициализацию.
+"""
+
+from django.db import DatabaseError, connection
+from django.http import JsonResponse
+from django.urls import get_resolver
+from users.revocation import REVOCATIONS
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_warmup_lock = threading.Lock()
+_warmed = False
+
+
+def check_database() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def warm_caches() -> None:
+    """Однократный прогрев кешей процесса"""
+    global _warmed
+    with _warmup_lock:
+        if _warmed:
+            return
+        # Таблицы reverse() строятся лениво при первом обращении
+        get_resolver().reverse_dict
+        REVOCATIONS.refresh(force=True)
+        _warmed = True
+
+
+def healthz(request):
+    """Liveness: процесс жив"""
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    """Readiness: база доступна, кеши прогреты; 503 - не направлять трафик"""
+    checks = {}
+    started = time.perf_counter()
+    try:
+        check_database()
+        checks['database'] = 'ok'
+        warm_caches()
+        checks['caches'] = 'ok'
+    except DatabaseError as e:
+        logger.warning('Проверка готовности не пройдена: %s', e)
+        checks.setdefault('database', 'error')
+        checks.setdefault('caches', 'error')
+        return JsonResponse({'status': 'unavailable', 'checks': checks}, status=503)
+    return JsonResponse({
+        'status': 'ok',
+        'checks': checks,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+    })
@@ -0,0 +1,75 @@
+"""
+Запуск бота в процессе ASGI-сервера.
+
+При ASGI_RUN_BOT=True боты из TELEGRAM_BOTS (long polling) запускаются по
+событию lifespan.startup в цикле событий сервера и плавно останавливаются
+по lifespan.shutdown - после того, как сервер перестал принимать запросы.
+API и боты работают в одном процессе: у них общие кеши (отзывы JWT,
+буфер просмотров), соединения с базой и реестр метрик - метрики ботов
+отдаются тем же /metrics, отдельный BOT_METRICS_PORT не нужен.
+
+Бот должен работать в одном процессе: при нескольких воркерах сервера
+(uvicorn --workers N) каждый начал бы свой long polling, и Telegram
+отвечал бы ошибкой конфликта. Для нескольких процессов остается
+runbot --workers с приемом обновлений через webhook.
+
+Запуск: uvicorn tg_bot.asgi:application --lifespan on
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Lifespan:
+    """ASGI-приложение с обработкой lifespan поверх приложения Django"""
+
+    def __init__(self, app, run_bot: bool = False):
+        """
+        Args:
+            app: ASGI-приложение Django
+            run_bot (bool): Запускать ботов в процессе сервера
+        """
+        self.app = app
+        self.run_bot = run_bot
+        self.bots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception('Не удалось запустить бота в процессе ASGI')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await self.shutdown()
+                except Exception as e:
+                    logger.exception('Ошибка остановки бота в процессе ASGI')
+                    await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self) -> None:
+        if not self.run_bot:
+            return
+        from blog.bot import BotGroup
+
+        bots = BotGroup.from_settings()
+        await bots.start()
+        self.bots = bots
+        logger.info('Боты запущены в процессе ASGI: %s', ', '.join(bot.name for bot in bots.running))
+
+    async def shutdown(self) -> None:
+        if self.bots is None:
+            return
+        bots, self.bots = self.bots, None
+        await bots.stop()
+        logger.info('Боты в процессе ASGI остановлены')
@@ -0,0 +1,385 @@
+"""
+Метрики API и бота в текстовом формате Prometheus.
+
+Счетчики и гистограммы пишутся без блокировок: у каждого потока свой шард
+(обычный dict), который обновляется только этим потоком. Блокировка берется
+лишь при регистрации нового потока и при сборе метрик, когда шарды
+завершившихся потоков сворачиваются в общий итог.
+"""
+
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .slowlog import QUERY_SOURCE
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class _ThreadShards:
+    """Набор per-thread словарей со значениями метрики"""
+
+    def __init__(self, merge: Callable[[dict, dict], None]):
+        self._merge = merge
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+
+    def get(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            self._local.shard = shard
+            return shard
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    # Поток завершился и больше не пишет в шард
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            result = {}
+            self._merge(result, self._retired)
+            for _, shard in alive:
+                # dict.copy() атомарен относительно записи из другого потока
+                self._merge(result, shard.copy())
+        return result
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Монотонный счетчик"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._shards = _ThreadShards(self._merge)
+
+    @staticmethod
+    def _merge(target: dict, source: dict) -> None:
+        for key, value in source.items():
+            target[key] = target.get(key, 0) + value
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._shards.snapshot().get(labels, 0)
+
+    def collect(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+            for labels, value in sorted(self._shards.snapshot().items())
+        ]
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._shards = _ThreadShards(self._merge)
+
+    @staticmethod
+    def _merge(target: dict, source: dict) -> None:
+        for key, values in source.items():
+            current = target.get(key)
+            if current is None:
+                target[key] = list(values)
+            else:
+                for index, value in enumerate(values):
+                    current[index] += value
+
+    def observe(self, value: float, *labels) -> None:
+        shard = self._shards.get()
+        values = shard.get(labels)
+        if values is None:
+            # Корзины (некумулятивно), затем +Inf, сумма и количество
+            values = shard[labels] = [0] * (len(self.buckets) + 3)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def count(self, *labels) -> int:
+        values = self._shards.snapshot().get(labels)
+        return values[-1] if values else 0
+
+    def collect(self) -> List[str]:
+        lines = []
+        for labels, values in sorted(self._shards.snapshot().items()):
+            cumulative = 0
+            for bound, value in zip(self.buckets + (float('inf'),), values):
+                cumulative += value
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(values[-2])}')
+            lines.append(f'{self.name}_count{label_text} {_format_value(values[-1])}')
+        return lines
+
+
+class Gauge:
+    """Мгновенное значение, вычисляемое функцией при сборе метрик"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._funcs: Dict[tuple, Callable[[], float]] = {}
+
+    def set_function(self, func: Optional[Callable[[], float]], *labels) -> None:
+        """Функция значения для набора меток; None - убрать значение"""
+        if func is None:
+            self._funcs.pop(labels, None)
+        else:
+            self._funcs[labels] = func
+
+    def collect(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(func())}'
+            for labels, func in sorted(self._funcs.items())
+        ]
+
+
+class Registry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            samples = metric.collect()
+            if not samples:
+                continue
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# API
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Длительность обработки HTTP-запроса',
+    ('route', 'method', 'status'),
+))
+DB_QUERIES_PER_REQUEST = REGISTRY.register(Histogram(
+    'http_request_db_queries', 'Количество SQL-запросов на HTTP-запрос',
+    ('route',), buckets=COUNT_BUCKETS,
+))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    'http_request_db_duration_seconds', 'Суммарное время SQL-запросов на HTTP-запрос',
+    ('route',),
+))
+API_THROTTLED = REGISTRY.register(Counter(
+    'http_requests_throttled_total', 'Запросы, отклоненные ограничением частоты (429)',
+    ('scope',),
+))
+
+# Бот
+# Метка bot - имя бота из TELEGRAM_BOTS (несколько ботов в одном процессе)
+BOT_HANDLER_DURATION = REGISTRY.register(Histogram(
+    'bot_handler_duration_seconds', 'Длительность обработчика бота',
+    ('bot', 'handler', 'outcome'),
+))
+BOT_UPDATE_LAG = REGISTRY.register(Histogram(
+    'bot_update_lag_seconds', 'Задержка между отправкой сообщения и началом его обработки',
+    ('bot',), buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+))
+BOT_UPDATE_QUEUE_SIZE = REGISTRY.register(Gauge(
+    'bot_update_queue_size', 'Количество обновлений в очереди бота',
+    ('bot',),
+))
+BOT_POST_BATCH_SIZE = REGISTRY.register(Histogram(
+    'bot_post_batch_size', 'Количество постов в одном запросе пакетной загрузки бота',
+    ('bot',), buckets=COUNT_BUCKETS,
+))
+TELEGRAM_API_DURATION = REGISTRY.register(Histogram(
+    'telegram_api_request_duration_seconds', 'Длительность запроса к Telegram Bot API',
+    ('bot', 'method', 'status'),
+))
+TELEGRAM_API_POOL_WAIT = REGISTRY.register(Histogram(
+    'telegram_api_pool_wait_seconds', 'Ожидание свободного соединения пула запросов к Telegram Bot API',
+    ('bot', 'pool'), buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+))
+TELEGRAM_API_ERRORS = REGISTRY.register(Counter(
+    'telegram_api_errors_total', 'Сетевые ошибки и таймауты запросов к Telegram Bot API',
+    ('bot', 'method', 'error'),
+))
+
+# Фоновые задачи
+JOB_DURATION = REGISTRY.register(Histogram(
+    'job_duration_seconds', 'Длительность выполнения фоновой задачи',
+    ('name', 'outcome'),
+))
+
+
+class QueryTimer:
+    """Обертка для connection.execute_wrapper, считающая запросы и их время"""
+
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Сбор латентности и SQL-статистики по маршрутам API"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        source = QUERY_SOURCE.set(request)
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            QUERY_SOURCE.reset(source)
+        duration = time.perf_counter() - started
+
+        # Шаблон маршрута вместо пути, чтобы не плодить метки по ID
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        HTTP_REQUEST_DURATION.observe(duration, route, request.method, str(response.status_code))
+        DB_QUERIES_PER_REQUEST.observe(timer.count, route)
+        DB_QUERY_DURATION.observe(timer.duration, route)
+        return response
+
+
+def metrics_allowed(request) -> bool:
+    """
+    Доступ к /metrics: с адреса из METRICS_ALLOWED_IPS или с токеном METRICS_TOKEN.
+
+    Адрес берется из REMOTE_ADDR без X-Forwarded-For: заголовок может
+    подставить любой клиент.
+    """
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR', '') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    """Отдача метрик в текстовом формате Prometheus"""
+    if not metrics_allowed(request):
+        # Метрики раскрывают маршруты, обработчики и частоту ошибок
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def track_handler(func):
+    """Декоратор обработчика бота: латентность, задержка обновления и выборочное профилирование"""
+    from .profiling import Profile, sample_handler
+
+    name = func.__name__.removeprefix('_handle_')
+
+    @wraps(func)
+    async def wrapper(self, update, context, *args, **kwargs):
+        started = time.perf_counter()
+        bot = getattr(self, 'name', '')
+        message = getattr(update, 'message', None)
+        if message is not None and message.date is not None:
+            BOT_UPDATE_LAG.observe(max(time.time() - message.date.timestamp(), 0.0), bot)
+        outcome = 'ok'
+        source = QUERY_SOURCE.set(f'bot:{name}')
+        try:
+            if sample_handler():
+                with Profile('bot', name):
+                    return await func(self, update, context, *args, **kwargs)
+            return await func(self, update, context, *args, **kwargs)
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            QUERY_SOURCE.reset(source)
+            BOT_HANDLER_DURATION.observe(time.perf_counter() - started, bot, name, outcome)
+
+    return wrapper
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Запуск HTTP-сервера метрик в фоновом потоке (для процесса бота)"""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
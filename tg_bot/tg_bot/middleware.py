@@ -0,0 +1,88 @@
+"""
+Middleware проекта.
+"""
+
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .renderers import parse_accept_header
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - зависит от окружения
+    zstandard = None
+
+
+def _gzip_compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+# Поддерживаемые кодировки в порядке предпочтения сервера
+COMPRESSORS = {}
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _zstd_compress
+COMPRESSORS['gzip'] = _gzip_compress
+
+
+def select_encoding(accept_encoding: str, encodings) -> str:
+    """
+    Выбор кодировки сжатия по заголовку Accept-Encoding.
+
+    Среди принимаемых клиентом кодировок с максимальным q выбирается первая
+    по порядку предпочтения сервера. Возвращает пустую строку, если сжимать
+    не нужно.
+    """
+    accepted = dict(parse_accept_header(accept_encoding))
+    wildcard = accepted.get('*', 0.0)
+    best, best_quality = '', 0.0
+    for encoding in encodings:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов gzip/zstd по заголовку Accept-Encoding.
+
+    Ответы меньше ``API_COMPRESSION_MIN_SIZE`` байт не сжимаются: на маленьких
+    телах выигрыш в размере не окупает заголовков и CPU.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024)
+        allowed = getattr(settings, 'API_COMPRESSION_ENCODINGS', list(COMPRESSORS))
+        self.encodings = [encoding for encoding in COMPRESSORS if encoding in allowed]
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_size:
+            return response
+
+        encoding = select_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if not encoding:
+            return response
+
+        compressed = COMPRESSORS[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # Сильный ETag перестает соответствовать телу после сжатия
+        if response.has_header('ETag') and not response['ETag'].startswith('W/'):
+            response['ETag'] = f"W/{response['ETag']}"
+        return response
@@ -0,0 +1,205 @@
+"""
+Профилирование отдельных запросов API и обработчиков бота по требованию.
+
+Запрос API профилируется, если его путь начинается с одного из
+PROFILE_API_PATHS или если он пришел с заголовком ``X-Profile: 1`` от
+сотрудника (is_staff по сессии админки или по JWT). Обработчик бота
+профилируется с вероятностью PROFILE_BOT_SAMPLE_RATE.
+
+Для каждого профиля в PROFILE_DIR пишутся два файла: статистика cProfile
+(.prof, открывается pstats / snakeviz) и .json с длительностью и
+выполненными SQL-запросами. Хранятся последние PROFILE_MAX_FILES профилей.
+Сводку по горячим функциям и запросам выводит manage.py profilesummary.
+
+SQL учитывается через execute_wrapper, установленный на каждое соединение,
+и контекстную переменную: sync_to_async переносит ее в поток, где
+обработчик бота обращается к базе. cProfile же видит только поток, в
+котором начат профиль, поэтому у обработчиков бота работа ORM видна в
+списке запросов, а не в статистике функций, а задачи цикла событий,
+выполнявшиеся во время await обработчика, попадают в его статистику.
+"""
+
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from pathlib import Path
+from typing import List, Optional
+import cProfile
+import json
+import logging
+import random
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_active: ContextVar[Optional['Profile']] = ContextVar('profiling_active', default=None)
+
+
+def record_sql(execute, sql, params, many, context):
+    """execute_wrapper: учет запроса в активном профиле"""
+    profile = _active.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries.append({'sql': sql, 'duration_ms': round((time.perf_counter() - started) * 1000, 3)})
+
+
+def install_sql_hook(connection, **kwargs) -> None:
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+connection_created.connect(install_sql_hook)
+for _connection in connections.all(initialized_only=True):
+    install_sql_hook(_connection)
+
+
+def _slug(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', value).strip('_')[:60] or 'root'
+
+
+def rotate(directory: Path, keep: int) -> None:
+    """Удаление старых профилей сверх keep"""
+    profiles = sorted(directory.glob('*.prof'), key=lambda path: path.stat().st_mtime)
+    for path in profiles[:max(len(profiles) - keep, 0)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.json').unlink(missing_ok=True)
+
+
+class Profile:
+    """
+    Контекстный менеджер профиля запроса или обработчика.
+
+    Вложенный профиль (обработчик, вызванный из другого обработчика) не
+    создается: его работа попадает во внешний профиль.
+    """
+
+    def __init__(self, kind: str, target: str):
+        self.kind = kind
+        self.target = target
+        self.name = ''
+        self.queries: List[dict] = []
+        self._profiler = None
+        self._token = None
+
+    def __enter__(self):
+        if _active.get() is not None:
+            return self
+        self._token = _active.set(self)
+        self._profiler = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        duration = time.perf_counter() - self._started
+        _active.reset(self._token)
+        try:
+            self.save(duration, error=exc_type.__name__ if exc_type else '')
+        except OSError:
+            logger.exception('Не удалось сохранить профиль %s %s', self.kind, self.target)
+
+    def save(self, duration: float, error: str = '') -> None:
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        now = timezone.now()
+        self.name = f'{now:%Y%m%d-%H%M%S}-{self.kind}-{_slug(self.target)}-{uuid.uuid4().hex[:6]}'
+        self._profiler.dump_stats(directory / f'{self.name}.prof')
+        meta = {
+            'kind': self.kind,
+            'target': self.target,
+            'created_at': now.isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'error': error,
+            'queries': self.queries,
+        }
+        with open(directory / f'{self.name}.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        rotate(directory, settings.PROFILE_MAX_FILES)
+
+
+def is_staff_request(request) -> bool:
+    """Запрос сотрудника: сессия админки или JWT пользователя с is_staff"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    import jwt
+    from users.models import User
+    from users.services import decode_token
+
+    try:
+        payload = decode_token(token, 'access')
+    except jwt.InvalidTokenError:
+        return False
+    return User.objects.filter(id=payload.get('user_id'), is_staff=True).exists()
+
+
+def should_profile_request(request) -> bool:
+    if any(request.path.startswith(path) for path in settings.PROFILE_API_PATHS):
+        return True
+    return request.headers.get('X-Profile') == '1' and is_staff_request(request)
+
+
+class ProfilingMiddleware:
+    """Профилирование запросов API по настройке или заголовку X-Profile"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile_request(request):
+            return self.get_response(request)
+        with Profile('api', request.path) as profile:
+            response = self.get_response(request)
+            # Шаблон маршрута известен только после выполнения view
+            match = getattr(request, 'resolver_match', None)
+            if match is not None:
+                profile.target = f'{request.method} {match.route}'
+        if profile.name:
+            response['X-Profile-Id'] = profile.name
+        return response
+
+
+def sample_handler() -> bool:
+    """Решение о профилировании очередного обработчика бота"""
+    rate = settings.PROFILE_BOT_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def load_profiles(directory, kind: str = '', target: str = '') -> List[tuple]:
+    """Сохраненные профили (путь к .prof, метаданные) с фильтром по типу и подстроке цели"""
+    profiles = []
+    for path in sorted(Path(directory).glob('*.prof')):
+        try:
+            with open(path.with_suffix('.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (kind and meta['kind'] != kind) or (target and target not in meta['target']):
+            continue
+        profiles.append((path, meta))
+    return profiles
+
+
+def top_queries(metas, limit: int) -> List[dict]:
+    """SQL-запросы профилей по суммарному времени"""
+    totals = {}
+    for meta in metas:
+        for query in meta['queries']:
+            entry = totals.setdefault(query['sql'], {'sql': query['sql'], 'count': 0, 'total_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += query['duration_ms']
+    return sorted(totals.values(), key=lambda entry: entry['total_ms'], reverse=True)[:limit]
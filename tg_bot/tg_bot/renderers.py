@@ -0,0 +1,136 @@
+"""
+Рендереры ответов API с выбором формата по заголовку Accept.
+
+По умолчанию ответы отдаются в JSON. Если клиент явно запрашивает
+``application/msgpack`` (или ``application/x-msgpack``) и установлен пакет
+``msgpack``, ответ сериализуется в MessagePack.
+"""
+
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+from ninja import NinjaAPI
+from ninja.renderers import BaseRenderer, JSONRenderer
+from ninja.responses import NinjaJSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - зависит от окружения
+    msgpack = None
+
+
+def parse_accept_header(value: str) -> List[Tuple[str, float]]:
+    """
+    Разбор заголовков Accept / Accept-Encoding в список (значение, q).
+
+    Значения с q=0 сохраняются, чтобы вызывающий код мог явно их исключить.
+    """
+    result = []
+    for item in value.split(','):
+        parts = [part.strip() for part in item.split(';')]
+        token = parts[0].lower()
+        if not token:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        result.append((token, quality))
+    return result
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Рендерер MessagePack"""
+
+    media_type = 'application/msgpack'
+    media_type_aliases = ('application/msgpack', 'application/x-msgpack')
+    encoder_class = NinjaJSONEncoder
+
+    def __init__(self):
+        self._encoder = self.encoder_class()
+
+    @staticmethod
+    def is_available() -> bool:
+        return msgpack is not None
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        # Типы, которые msgpack не знает (datetime, UUID, Decimal, pydantic),
+        # приводим так же, как это делает JSON-рендерер
+        return msgpack.packb(data, default=self._encoder.default, use_bin_type=True)
+
+
+class NegotiatingRenderer(BaseRenderer):
+    """
+    Рендерер, выбирающий формат ответа по заголовку Accept.
+
+    Первый рендерер в списке используется по умолчанию, если клиент не
+    прислал Accept или не принимает ни один из поддерживаемых форматов.
+    """
+
+    def __init__(self, renderers: Optional[Sequence[BaseRenderer]] = None):
+        if renderers is None:
+            renderers = [JSONRenderer(), MessagePackRenderer()]
+        self.renderers = [
+            renderer for renderer in renderers
+            if getattr(renderer, 'is_available', lambda: True)()
+        ]
+        self.default = self.renderers[0]
+
+    @property
+    def media_type(self) -> str:
+        return self.default.media_type
+
+    @property
+    def charset(self) -> str:
+        return self.default.charset
+
+    def select(self, request: HttpRequest) -> BaseRenderer:
+        """Выбор рендерера для запроса"""
+        accept = request.META.get('HTTP_ACCEPT', '')
+        if not accept:
+            return self.default
+
+        best, best_quality = None, 0.0
+        for media_type, quality in parse_accept_header(accept):
+            if quality <= best_quality:
+                continue
+            if media_type in ('*/*', 'application/*'):
+                candidate = self.default
+            else:
+                candidate = next(
+                    (
+                        renderer for renderer in self.renderers
+                        if media_type in getattr(renderer, 'media_type_aliases', (renderer.media_type,))
+                    ),
+                    None,
+                )
+            if candidate is not None:
+                best, best_quality = candidate, quality
+        return best or self.default
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        renderer = self.select(request)
+        request.renderer = renderer
+        return renderer.render(request, data, response_status=response_status)
+
+
+class NegotiatingNinjaAPI(NinjaAPI):
+    """NinjaAPI, проставляющий Content-Type выбранного рендерера"""
+
+    def create_response(self, request: HttpRequest, data: Any, *, status: Optional[int] = None,
+                        temporal_response: Optional[HttpResponse] = None) -> HttpResponse:
+        response = super().create_response(
+            request, data, status=status, temporal_response=temporal_response
+        )
+        renderer = getattr(request, 'renderer', None)
+        if renderer is not None:
+            if renderer.media_type.startswith('application/json'):
+                response['Content-Type'] = f"{renderer.media_type}; charset={renderer.charset}"
+            else:
+                response['Content-Type'] = renderer.media_type
+            patch_vary_headers(response, ('Accept',))
+        return response
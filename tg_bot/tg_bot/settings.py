@@ -49,15 +49,19 @@ INSTALLED_APPS = [
     'ninja',
     'blog',
     'users',
+    'jobs',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'tg_bot.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'tg_bot.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tg_bot.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -130,6 +134,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Загруженные файлы (вложения постов)
+MEDIA_URL = os.getenv('MEDIA_URL', 'media/')
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', str(BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -148,8 +156,8 @@ REST_FRAMEWORK = {
 # Настройки JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
-    'ROTATE_REFRESH_TOKENS': False,
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
@@ -161,8 +169,111 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Текст поста длиннее порога (байты) хранится сжатым zlib с этим уровнем
+COMPRESSED_TEXT_THRESHOLD = int(os.getenv('COMPRESSED_TEXT_THRESHOLD', '1024'))
+COMPRESSED_TEXT_LEVEL = int(os.getenv('COMPRESSED_TEXT_LEVEL', '6'))
+
+# Период записи накопленных просмотров постов в базу, секунды
+POST_VIEWS_FLUSH_INTERVAL = float(os.getenv('POST_VIEWS_FLUSH_INTERVAL', '5'))
+
+# История правок постов (blog.revisions): каждая N-я редакция хранится целиком,
+# остальные - разницей с более новой; N ограничивает цепочку при восстановлении
+POST_REVISION_SNAPSHOT_INTERVAL = int(os.getenv('POST_REVISION_SNAPSHOT_INTERVAL', '20'))
+
+# Период перезагрузки кучи отложенных публикаций (blog.scheduler), секунды: подхватывает
+# публикации, назначенные другими процессами
+PUBLISH_SCHEDULER_RELOAD_INTERVAL = float(os.getenv('PUBLISH_SCHEDULER_RELOAD_INTERVAL', '300'))
+
+# Пагинация changelist в админке: до этой оценки размера таблицы количество
+# считается точно, отфильтрованные списки считаются не дальше ADMIN_COUNT_LIMIT строк
+ADMIN_EXACT_COUNT_THRESHOLD = int(os.getenv('ADMIN_EXACT_COUNT_THRESHOLD', '10000'))
+ADMIN_COUNT_LIMIT = int(os.getenv('ADMIN_COUNT_LIMIT', '10000'))
+
+# Проверка отзыва JWT в памяти процесса: период подгрузки новых отзывов и
+# полного перестроения фильтра Блума (секунды), емкость и доля ложных срабатываний
+JWT_REVOCATION_REFRESH_INTERVAL = float(os.getenv('JWT_REVOCATION_REFRESH_INTERVAL', '5'))
+JWT_REVOCATION_REBUILD_INTERVAL = float(os.getenv('JWT_REVOCATION_REBUILD_INTERVAL', '300'))
+JWT_REVOCATION_BLOOM_CAPACITY = int(os.getenv('JWT_REVOCATION_BLOOM_CAPACITY', '100000'))
+JWT_REVOCATION_BLOOM_ERROR_RATE = float(os.getenv('JWT_REVOCATION_BLOOM_ERROR_RATE', '0.001'))
+
 # Настройки Telegram бота
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Несколько ботов в одном процессе: имя=токен через запятую, например ru=123:AAA,en=456:BBB
+# (имя - метка в метриках); пустой - один бот main с TELEGRAM_BOT_TOKEN
+TELEGRAM_BOTS = [item.split('=', 1) for item in os.getenv('TELEGRAM_BOTS', '').split(',') if item]
+# Адрес Bot API, например http://127.0.0.1:8081/bot для runfaketelegram
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+# Транспорт Bot API (blog.transport): соединений в пуле исходящих вызовов каждого бота,
+# сколько из них держать открытыми и время жизни простаивающего соединения (секунды),
+# HTTP/2 (нужен пакет h2), таймауты по умолчанию и ожидания свободного соединения, секунды
+TELEGRAM_API_POOL_SIZE = int(os.getenv('TELEGRAM_API_POOL_SIZE', '256'))
+TELEGRAM_API_KEEPALIVE_CONNECTIONS = int(os.getenv('TELEGRAM_API_KEEPALIVE_CONNECTIONS', '32'))
+TELEGRAM_API_KEEPALIVE_EXPIRY = float(os.getenv('TELEGRAM_API_KEEPALIVE_EXPIRY', '60'))
+TELEGRAM_API_HTTP2 = os.getenv('TELEGRAM_API_HTTP2', 'False') == 'True'
+TELEGRAM_API_CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_API_CONNECT_TIMEOUT', '5'))
+TELEGRAM_API_READ_TIMEOUT = float(os.getenv('TELEGRAM_API_READ_TIMEOUT', '5'))
+TELEGRAM_API_WRITE_TIMEOUT = float(os.getenv('TELEGRAM_API_WRITE_TIMEOUT', '5'))
+TELEGRAM_API_POOL_TIMEOUT = float(os.getenv('TELEGRAM_API_POOL_TIMEOUT', '1'))
+# Таймауты чтения и записи по методам Bot API: метод=секунды через запятую
+TELEGRAM_API_METHOD_TIMEOUTS = {
+    method: float(seconds)
+    for method, seconds in (
+        item.split('=', 1) for item in os.getenv(
+            'TELEGRAM_API_METHOD_TIMEOUTS',
+            'answerCallbackQuery=2,sendPhoto=30,sendDocument=60,sendMediaGroup=60',
+        ).split(',') if item
+    )
+}
+# Доступ к /metrics API: адреса клиентов (REMOTE_ADDR) через запятую и/или токен
+# (Authorization: Bearer <токен>); остальные запросы получают 403
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Порт HTTP-сервера метрик процесса бота (0 - не запускать)
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT', '0'))
+# Целевое время запуска процесса бота в секундах (0 - не проверять)
+BOT_STARTUP_TARGET_SECONDS = float(os.getenv('BOT_STARTUP_TARGET_SECONDS', '1.0'))
+# Хранение user_data / chat_data / bot_data бота в базе и период передачи изменений, секунды
+BOT_PERSISTENCE = os.getenv('BOT_PERSISTENCE', 'True') == 'True'
+BOT_PERSISTENCE_INTERVAL = float(os.getenv('BOT_PERSISTENCE_INTERVAL', '10'))
+# Время на обработку уже полученных обновлений при остановке бота, секунды
+BOT_SHUTDOWN_TIMEOUT = float(os.getenv('BOT_SHUTDOWN_TIMEOUT', '25'))
+# Сколько обновлений бот обрабатывает одновременно (1 - по очереди, с сохранением порядка)
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '1'))
+# Пакетная загрузка постов ботом (blog.loaders): окно объединения, секунды, и максимум постов в пакете
+BOT_POST_BATCH_WINDOW = float(os.getenv('BOT_POST_BATCH_WINDOW', '0.005'))
+BOT_POST_BATCH_MAX = int(os.getenv('BOT_POST_BATCH_MAX', '100'))
+# Очередь обновлений для runbot --workers: число партиций, размер пачки и пауза опроса
+BOT_QUEUE_PARTITIONS = int(os.getenv('BOT_QUEUE_PARTITIONS', '64'))
+BOT_QUEUE_BATCH_SIZE = int(os.getenv('BOT_QUEUE_BATCH_SIZE', '50'))
+BOT_QUEUE_POLL_INTERVAL = float(os.getenv('BOT_QUEUE_POLL_INTERVAL', '0.1'))
+# Секрет webhook (заголовок X-Telegram-Bot-Api-Secret-Token); пустой - webhook отключен
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
+# Запуск бота (long polling) в процессе ASGI-сервера вместе с API (tg_bot.lifespan)
+ASGI_RUN_BOT = os.getenv('ASGI_RUN_BOT', 'False') == 'True'
+
+# Очередь фоновых задач (manage.py runworker): пауза опроса пустой очереди,
+# время, после которого задача зависшего воркера снова выдается, число попыток
+# и пауза перед повтором (удваивается с каждой попыткой), секунды
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '1.0'))
+JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', '300'))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '5'))
+JOBS_RETRY_BACKOFF = float(os.getenv('JOBS_RETRY_BACKOFF', '5'))
+JOBS_RETRY_BACKOFF_MAX = float(os.getenv('JOBS_RETRY_BACKOFF_MAX', '3600'))
+
+# Журнал медленных SQL-запросов (tg_bot.slowlog): порог в миллисекундах (0 - отключен),
+# файл журнала, его максимальный размер в байтах и количество ротированных копий
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '100'))
+SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE', str(BASE_DIR / 'logs' / 'slow_queries.log'))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv('SLOW_QUERY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv('SLOW_QUERY_LOG_BACKUPS', '5'))
+
+# Профилирование (tg_bot.profiling): каталог профилей и сколько последних хранить,
+# префиксы путей API, которые профилируются всегда (запросы сотрудников - также
+# по заголовку X-Profile: 1), доля профилируемых обработчиков бота
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+PROFILE_API_PATHS = [path for path in os.getenv('PROFILE_API_PATHS', '').split(',') if path]
+PROFILE_BOT_SAMPLE_RATE = float(os.getenv('PROFILE_BOT_SAMPLE_RATE', '0'))
 
 # Настройки API документации
 API_TITLE = "Blog API"
@@ -188,3 +299,21 @@ API_TAGS = [
     },
 ]
 
+# Сжатие ответов: минимальный размер тела в байтах и допустимые кодировки
+API_COMPRESSION_MIN_SIZE = int(os.getenv('API_COMPRESSION_MIN_SIZE', '1024'))
+API_COMPRESSION_ENCODINGS = os.getenv('API_COMPRESSION_ENCODINGS', 'zstd,gzip').split(',')
+
+# Ограничение частоты запросов (tg_bot.throttling): лимиты по областям в виде N/период
+# (s, min, hour, day); переменная окружения задает область=лимит через запятую и
+# дополняет значения по умолчанию, пустой лимит отключает область
+API_THROTTLE_RATES = {
+    'post_create': '30/min',
+    'register': '10/hour',
+    'login': '10/min',
+    'refresh': '30/min',
+    **dict(item.split('=', 1) for item in os.getenv('API_THROTTLE_RATES', '').split(',') if item),
+}
+# Алиас кеша Django для лимитов, общих для процессов; пустой - лимит в памяти каждого процесса
+API_THROTTLE_CACHE = os.getenv('API_THROTTLE_CACHE', '')
+# Число доверенных прокси перед API: IP клиента берется из X-Forwarded-For
+API_THROTTLE_PROXIES = int(os.getenv('API_THROTTLE_PROXIES', '0'))
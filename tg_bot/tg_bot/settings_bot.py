@@ -0,0 +1,21 @@
+"""
+Облегченные настройки для процесса Telegram бота.
+
+Бот не обслуживает HTTP-запросы, поэтому админка, сессии, сообщения,
+статика, ninja и rest_framework ему не нужны: без них django.setup()
+импортирует и инициализирует заметно меньше модулей.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'blog',
+    'users',
+    'jobs',
+]
+
+MIDDLEWARE = []
+
+TEMPLATES = []
@@ -0,0 +1,218 @@
+"""
+Журнал медленных SQL-запросов.
+
+На каждое соединение с базой устанавливается execute_wrapper, который
+записывает запросы дольше SLOW_QUERY_THRESHOLD_MS в журнал
+SLOW_QUERY_LOG_FILE (JSON-строки, ротация по размеру). Каждый процесс
+пишет в свой файл с PID в имени (slow_queries.<pid>.log): ротация одного
+файла несколькими процессами (воркеры gunicorn, runbot --workers)
+теряла бы записи. Команда slowqueries читает файлы всех процессов. Запись содержит
+нормализованный SQL и идентификатор его формы, хеш параметров,
+длительность и источник запроса - маршрут API, обработчик бота или
+фоновую задачу (контекстная переменная QUERY_SOURCE переносится
+sync_to_async в поток, где выполняется ORM). Для каждой новой формы
+запроса процесс один раз сохраняет план выполнения (EXPLAIN QUERY PLAN в
+SQLite, EXPLAIN в PostgreSQL).
+
+Ранжирование форм по суммарному времени: manage.py slowqueries.
+"""
+
+from contextlib import nullcontext
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Источник запроса: строка или HttpRequest (маршрут известен только после разрешения URL)
+QUERY_SOURCE: ContextVar[object] = ContextVar('query_source', default='')
+
+# Максимум форм запросов, для которых процесс помнит, что план уже сохранен
+MAX_EXPLAINED_SHAPES = 10000
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+
+_explained = set()
+_lock = threading.Lock()
+_handlers: Dict[Tuple[str, int], logging.Handler] = {}
+_local = threading.local()
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL без значений: литералы и плейсхолдеры - ?, списки IN и строки VALUES - (...)"""
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    sql = _ROWS.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _digest(value: str) -> str:
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def describe_source() -> str:
+    source = QUERY_SOURCE.get()
+    if isinstance(source, str):
+        return source
+    match = getattr(source, 'resolver_match', None)
+    route = match.route if match is not None else source.path
+    return f'{source.method} {route}'
+
+
+def explain(connection, sql: str, params) -> str:
+    """План выполнения запроса; ошибка EXPLAIN не влияет на транзакцию вызывающего кода"""
+    # Ошибка в PostgreSQL прерывает транзакцию, поэтому EXPLAIN выполняется в точке
+    # сохранения. В SQLite ошибка транзакцию не прерывает, а точку сохранения нельзя
+    # открыть, пока не дочитан результат INSERT ... RETURNING.
+    guard = nullcontext() if connection.vendor == 'sqlite' else transaction.atomic(using=connection.alias)
+    try:
+        with guard:
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN не выполнен: {e}'
+    # SQLite: (id, parent, notused, detail), PostgreSQL: одна колонка с текстом
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def process_log_path(path, pid: int) -> Path:
+    """Файл журнала процесса pid: slow_queries.log -> slow_queries.<pid>.log"""
+    path = Path(path)
+    return path.with_name(f'{path.stem}.{pid}{path.suffix}')
+
+
+def _write(entry: dict) -> None:
+    # PID входит в ключ: процесс, созданный fork, открывает свой файл, а не
+    # продолжает писать в унаследованный файл родителя
+    key = (settings.SLOW_QUERY_LOG_FILE, os.getpid())
+    with _lock:
+        handler = _handlers.get(key)
+        if handler is None:
+            path = process_log_path(*key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                backupCount=settings.SLOW_QUERY_LOG_BACKUPS,
+                encoding='utf-8',
+            )
+            _handlers[key] = handler
+    handler.handle(logging.makeLogRecord({'msg': json.dumps(entry, ensure_ascii=False), 'levelno': logging.INFO}))
+
+
+def record_slow_query(execute, sql, params, many, context):
+    """execute_wrapper: запись запроса дольше порога в журнал"""
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold <= 0 or getattr(_local, 'active', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms < threshold:
+        return result
+
+    # Запросы самого журнала (EXPLAIN, точки сохранения) не записываются
+    _local.active = True
+    try:
+        normalized = normalize_sql(sql)
+        shape = _digest(normalized)
+        entry = {
+            'time': timezone.now().isoformat(),
+            'shape': shape,
+            'sql': normalized,
+            'params_hash': _digest(repr(params)),
+            'duration_ms': round(duration_ms, 3),
+            'source': describe_source(),
+            'many': many,
+        }
+        with _lock:
+            new_shape = shape not in _explained and len(_explained) < MAX_EXPLAINED_SHAPES
+            if new_shape:
+                _explained.add(shape)
+        if new_shape and not many and normalized.upper().startswith(EXPLAINABLE):
+            entry['explain'] = explain(context['connection'], sql, params)
+        _write(entry)
+    except Exception:
+        # Сбой журнала не должен ломать запрос
+        logger.exception('Не удалось записать медленный запрос')
+    finally:
+        _local.active = False
+    return result
+
+
+def install_slow_query_log(connection, **kwargs) -> None:
+    if record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_query)
+
+
+def install() -> None:
+    """Подключение журнала ко всем соединениям процесса"""
+    connection_created.connect(install_slow_query_log)
+    for connection in connections.all(initialized_only=True):
+        install_slow_query_log(connection)
+
+
+def log_files(path) -> List[Path]:
+    """Файлы журнала всех процессов (process_log_path) с ротированными копиями"""
+    path = Path(path)
+    pattern = re.compile(rf'{re.escape(path.stem)}\.\d+{re.escape(path.suffix)}')
+    files = []
+    for current in sorted(item for item in path.parent.glob('*') if pattern.fullmatch(item.name)):
+        # Ротированные копии: .1 - самая новая, старшие номера - старее
+        backups = [item for item in path.parent.glob(f'{current.name}.*') if item.suffix[1:].isdigit()]
+        backups.sort(key=lambda item: int(item.suffix[1:]), reverse=True)
+        files.extend([*backups, current])
+    return files
+
+
+def read_entries(path) -> Iterable[dict]:
+    """Записи журнала всех процессов, в каждом файле - от старых к новым"""
+    for file in log_files(path):
+        try:
+            f = open(file, encoding='utf-8')
+        except FileNotFoundError:
+            # Процесс переименовал файл при ротации
+            continue
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def rank_shapes(entries: Iterable[dict]) -> List[dict]:
+    """Формы запросов по убыванию суммарного времени"""
+    shapes = {}
+    for entry in entries:
+        shape = shapes.setdefault(entry['shape'], {
+            'shape': entry['shape'], 'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'sources': {}, 'explain': '',
+        })
+        shape['count'] += 1
+        shape['total_ms'] += entry['duration_ms']
+        shape['max_ms'] = max(shape['max_ms'], entry['duration_ms'])
+        shape['sources'][entry['source']] = shape['sources'].get(entry['source'], 0) + 1
+        if entry.get('explain'):
+            shape['explain'] = entry['explain']
+    return sorted(shapes.values(), key=lambda shape: shape['total_ms'], reverse=True)
@@ -0,0 +1,53 @@
+"""
+Замер времени запуска процесса по этапам.
+"""
+
+from contextlib import contextmanager
+import sys
+import time
+
+# Подпись итоговой строки отчета, по ней benchstartup определяет готовность процесса
+TOTAL_LABEL = 'итого'
+
+
+class StartupProfile:
+    """
+    Время и количество импортированных модулей для каждого этапа запуска.
+
+    Новые модули этапа группируются по пакету верхнего уровня, чтобы было
+    видно, какие зависимости тянет каждый этап.
+    """
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        modules_before = set(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            packages = {}
+            for module in set(sys.modules) - modules_before:
+                package = module.split('.', 1)[0]
+                packages[package] = packages.get(package, 0) + 1
+            self.phases.append((name, duration, packages))
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def lines(self, top=5):
+        result = []
+        for name, duration, packages in self.phases:
+            top_packages = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+            details = ', '.join(f'{package}: {count}' for package, count in top_packages)
+            result.append(
+                f'{name:<24} {duration * 1000:>8.1f} мс  модулей: {sum(packages.values()):>4}'
+                + (f'  ({details})' if details else '')
+            )
+        result.append(f"{TOTAL_LABEL:<24} {self.total * 1000:>8.1f} мс")
+        return result
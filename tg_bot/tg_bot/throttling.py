@@ -0,0 +1,173 @@
+"""
+Ограничение частоты запросов к API (token bucket).
+
+Эндпоинты, которые нагружают единственного писателя SQLite или CPU
+(хеширование паролей PBKDF2), помечаются декоратором throttle(scope) под
+декоратором роутера ninja. Лимит области задается в API_THROTTLE_RATES
+строкой «N/период» (s, min, hour, day): корзина вмещает N запросов и
+пополняется равномерно за период, поэтому короткий всплеск проходит, а
+постоянный поток выше лимита - нет. Корзина ведется на пользователя
+(request.auth) или, для анонимных запросов, на IP клиента.
+
+Отклоненный запрос получает 429 с заголовком Retry-After (обработчик
+Throttled подключен в tg_bot.urls) и не доходит до view.
+
+Корзины хранятся в памяти процесса - у каждого процесса свой лимит. Общий
+для процессов лимит дает API_THROTTLE_CACHE - алиас кеша Django (например,
+Redis). Обновление корзины в кеше не атомарно: одновременные запросы одного
+клиента могут пройти сверх лимита на несколько штук.
+"""
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from functools import lru_cache, wraps
+from typing import Tuple
+from .metrics import API_THROTTLED
+import math
+import threading
+import time
+
+PERIODS = {
+    's': 1, 'sec': 1,
+    'm': 60, 'min': 60,
+    'h': 3600, 'hour': 3600,
+    'd': 86400, 'day': 86400,
+}
+
+# Корзин в памяти процесса; при переполнении удаляются давно не использованные
+MAX_LOCAL_BUCKETS = 100000
+
+
+class Throttled(Exception):
+    """Запрос превысил лимит частоты"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Слишком много запросов, повторите позже")
+        # Retry-After - целое число секунд
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@lru_cache(maxsize=64)
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """«10/min» -> (емкость корзины, период в секундах)"""
+    try:
+        count, period = rate.split('/', 1)
+        count = int(count)
+        seconds = PERIODS[period.strip()]
+    except (KeyError, ValueError):
+        raise ValueError(f"Неверный лимит {rate!r}, ожидается N/s, N/min, N/hour или N/day")
+    if count < 1:
+        raise ValueError(f"Неверный лимит {rate!r}: N должно быть больше 0")
+    return count, float(seconds)
+
+
+def refill(state, capacity: int, rate: float, now: float) -> Tuple[float, float]:
+    """
+    Списание одного запроса из корзины.
+
+    Returns:
+        Tuple[float, float]: Токены после запроса и время ожидания, 0 - запрос разрешен
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class LocalBucketStore:
+    """Корзины в памяти процесса"""
+
+    def __init__(self, max_buckets: int = MAX_LOCAL_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key: str, capacity: int, rate: float, now: float) -> float:
+        with self._lock:
+            tokens, wait = refill(self._buckets.pop(key, None), capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """Корзины в кеше Django, общие для процессов"""
+
+    def __init__(self, alias: str):
+        self.cache = caches[alias]
+
+    def take(self, key: str, capacity: int, rate: float, now: float) -> float:
+        tokens, wait = refill(self.cache.get(key), capacity, rate, now)
+        # Запись живет, пока корзина не наполнится снова
+        self.cache.set(key, (tokens, now), timeout=math.ceil(capacity / rate) + 1)
+        return wait
+
+    def reset(self) -> None:
+        pass
+
+
+LOCAL_BUCKETS = LocalBucketStore()
+_stores = {}
+
+
+def get_store():
+    alias = settings.API_THROTTLE_CACHE
+    if not alias:
+        return LOCAL_BUCKETS
+    store = _stores.get(alias)
+    if store is None:
+        store = _stores[alias] = CacheBucketStore(alias)
+    return store
+
+
+def client_ip(request) -> str:
+    """
+    IP клиента.
+
+    За API_THROTTLE_PROXIES доверенными прокси адрес клиента берется из
+    X-Forwarded-For: каждый прокси дописывает адрес, с которого к нему
+    пришел запрос, поэтому нужный адрес - N-й с конца.
+    """
+    proxies = settings.API_THROTTLE_PROXIES
+    if proxies:
+        forwarded = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_rate(request, scope: str) -> None:
+    """
+    Списание запроса из корзины клиента в области scope.
+
+    Raises:
+        Throttled: Если корзина пуста
+    """
+    rate = settings.API_THROTTLE_RATES.get(scope)
+    if not rate:
+        return
+    capacity, period = parse_rate(rate)
+    user_id = getattr(request, 'auth', None)
+    client = f'user:{user_id}' if user_id else f'ip:{client_ip(request)}'
+    wait = get_store().take(f'throttle:{scope}:{client}', capacity, capacity / period, time.time())
+    if wait:
+        API_THROTTLED.inc(scope)
+        raise Throttled(wait)
+
+
+def throttle(scope: str):
+    """Декоратор view ninja: лимит частоты API_THROTTLE_RATES[scope]"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            check_rate(request, scope)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -14,21 +14,33 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 from blog.api import router as blog_router
 from users.api import router as users_router
-from ninja import NinjaAPI
 from django.conf import settings
+from .health import healthz, readyz
+from .metrics import metrics_view
+from .renderers import NegotiatingNinjaAPI, NegotiatingRenderer
+from .throttling import Throttled
 
 # Создаем основной API роутер
-api = NinjaAPI(
+api = NegotiatingNinjaAPI(
     title=settings.API_TITLE,
     description=settings.API_DESCRIPTION,
     version=settings.API_VERSION,
-    csrf=False
+    csrf=False,
+    renderer=NegotiatingRenderer(),
 )
 
+@api.exception_handler(Throttled)
+def throttled(request, exc):
+    """Превышен лимит частоты (tg_bot.throttling): 429 и время до следующей попытки"""
+    response = api.create_response(request, {"message": str(exc)}, status=429)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
 # Подключаем API приложений к основному роутеру
 api.add_router("/users/", users_router)
 api.add_router("/blog/", blog_router)
@@ -36,4 +48,10 @@ api.add_router("/blog/", blog_router)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api.urls),  # Единый путь для всех API эндпоинтов
+    path('metrics', metrics_view, name='metrics'),
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
 ]
+
+# Вложения постов в режиме разработки; в продакшене MEDIA_ROOT отдает веб-сервер
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -13,4 +13,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tg_bot.settings')
 
-application = get_wsgi_application()
+from .background import BackgroundThreadsWSGI  # noqa: E402
+
+# Запись просмотров и отложенные публикации - фоновые потоки, которые
+# запускаются в каждом процессе при первом запросе (tg_bot.background)
+application = BackgroundThreadsWSGI(get_wsgi_application())
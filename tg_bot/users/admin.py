@@ -1,10 +1,23 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User
+from tg_bot.admin_tools import EstimatedCountPaginator, IndexedSearchMixin
+from .models import RevokedToken, User
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(IndexedSearchMixin, UserAdmin):
     list_display = ('username', 'email', 'is_staff', 'is_active')
     list_filter = ('is_staff', 'is_active')
-    search_fields = ('username', 'email')
+    search_prefix_fields = ('username',)
+    search_exact_fields = ('email',)
+    search_help_text = 'Начало имени пользователя (с учетом регистра), точный email или ID'
     ordering = ('username',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('jti', 'revoked_at', 'expires_at')
+    search_exact_fields = ('jti',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('jti', 'revoked_at', 'expires_at')
@@ -1,30 +1,32 @@
 from ninja import Router, Schema
 from ninja.security import HttpBearer
 from .models import User
-from .services import create_user, authenticate_user, get_user_by_id
+from .services import (
+    create_user, authenticate_user, get_user_by_id, issue_tokens, decode_token, revoke_token, rotate_refresh_token,
+)
 from django.conf import settings
+from tg_bot.throttling import throttle
 import jwt
 from .schemas import UserSchema, UserCreateSchema, LoginSchema, TokenSchema, ErrorSchema, RefreshSchema
 from django.contrib.auth import authenticate
 from typing import Optional
-from datetime import datetime, timedelta
 
 
 class AuthBearer(HttpBearer):
     def authenticate(self, request, token):
         try:
-            payload = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
-            user_id = payload.get('user_id')
-            if user_id:
-                return user_id
-        except:
-            pass
-        return None
+            payload = decode_token(token, 'access')
+        except jwt.InvalidTokenError:
+            return None
+        # Данные токена нужны для отзыва при выходе
+        request.jwt_payload = payload
+        return payload.get('user_id')
 
 # Создаем роутер вместо API
 router = Router(auth=AuthBearer(), tags=["Пользователи"])
 
 @router.post("/register", response={201: UserSchema, 400: ErrorSchema}, auth=None, summary="Регистрация нового пользователя")
+@throttle('register')
 def register(request, data: UserCreateSchema):
     """
     Регистрация нового пользователя.
@@ -46,6 +48,7 @@ def register(request, data: UserCreateSchema):
         return 400, {"detail": str(e)}
 
 @router.post("/login", response={200: TokenSchema, 401: ErrorSchema}, auth=None, summary="Авторизация пользователя")
+@throttle('login')
 def login(request, payload: LoginSchema):
     """
     Авторизация пользователя.
@@ -62,68 +65,44 @@ def login(request, payload: LoginSchema):
     if user is None:
         return 401, {"detail": "Неверные учетные данные"}
     
-    # Создаем токены
-    access_token = jwt.encode(
-        {
-            'user_id': user.id,
-            'exp': datetime.utcnow() + timedelta(minutes=60)
-        },
-        settings.SIMPLE_JWT['SIGNING_KEY'],
-        algorithm=settings.SIMPLE_JWT['ALGORITHM']
-    )
-    
-    refresh_token = jwt.encode(
-        {
-            'user_id': user.id,
-            'exp': datetime.utcnow() + timedelta(days=7)
-        },
-        settings.SIMPLE_JWT['SIGNING_KEY'],
-        algorithm=settings.SIMPLE_JWT['ALGORITHM']
-    )
-    
-    return 200, {
-        "access": access_token,
-        "refresh": refresh_token
-    }
+    return 200, issue_tokens(user.id)
 
 @router.post("/refresh", response={200: TokenSchema, 400: ErrorSchema}, auth=None, summary="Обновление токена")
+@throttle('refresh')
 def refresh_token(request, data: RefreshSchema):
     """
     Обновление токена доступа.
     
     - **refresh**: Токен обновления
     
-    Возвращает новые JWT токены.
+    Возвращает новые JWT токены. Использованный токен обновления
+    отзывается и повторно не принимается.
     """
     try:
-        payload = jwt.decode(data.refresh, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
-        user_id = payload.get('user_id')
-        if not user_id:
-            raise Exception("Недействительный токен")
-        
-        user = get_user_by_id(user_id)
-        if not user:
-            raise Exception("Пользователь не найден")
-        
-        access_token = jwt.encode(
-            {'user_id': user.id},
-            settings.SIMPLE_JWT['SIGNING_KEY'],
-            algorithm=settings.SIMPLE_JWT['ALGORITHM']
-        )
-        
-        refresh_token = jwt.encode(
-            {'user_id': user.id},
-            settings.SIMPLE_JWT['SIGNING_KEY'],
-            algorithm=settings.SIMPLE_JWT['ALGORITHM']
-        )
-        
-        return 200, {
-            'access': access_token,
-            'refresh': refresh_token
-        }
+        return 200, rotate_refresh_token(data.refresh)
     except Exception as e:
         return 400, {"detail": str(e)}
 
+@router.post("/logout", response={204: None, 400: ErrorSchema}, summary="Выход из системы")
+def logout(request, data: RefreshSchema):
+    """
+    Завершение сессии: отзыв токена обновления и текущего токена доступа.
+    
+    Требуется аутентификация.
+    
+    - **refresh**: Токен обновления
+    """
+    try:
+        payload = decode_token(data.refresh, 'refresh')
+    except jwt.InvalidTokenError as e:
+        return 400, {"detail": str(e)}
+    if payload.get('user_id') != request.auth:
+        return 400, {"detail": "Токен принадлежит другому пользователю"}
+    revoke_token(payload)
+    if request.jwt_payload.get('jti'):
+        revoke_token(request.jwt_payload)
+    return 204, None
+
 @router.get("/me", response={200: UserSchema, 401: ErrorSchema}, summary="Информация о текущем пользователе")
 def get_current_user(request):
     """
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users.services import purge_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = 'Удаляет записи об отозванных токенах с истекшим сроком действия (запускать периодически, например из cron)'
+
+    def handle(self, *args, **options):
+        deleted = purge_revoked_tokens()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
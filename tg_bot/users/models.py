@@ -2,4 +2,23 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 class User(AbstractUser):
-    pass
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Точный поиск по email в админке
+            models.Index(fields=['email'], name='users_user_email_idx'),
+        ]
+
+
+class RevokedToken(models.Model):
+    """Отозванный JWT (использованный refresh-токен или токен завершенной сессии)"""
+    jti = models.CharField(max_length=64, unique=True, verbose_name='ID токена')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Истекает')
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата отзыва')
+
+    class Meta:
+        verbose_name = 'Отозванный токен'
+        verbose_name_plural = 'Отозванные токены'
+
+    def __str__(self):
+        return self.jti
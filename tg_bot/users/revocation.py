@@ -0,0 +1,128 @@
+"""
+Проверка отзыва JWT без запроса к базе на каждый запрос.
+
+Каждый процесс держит в памяти фильтр Блума по всем действующим отозванным
+jti и точное множество недавно отозванных jti. Раз в
+JWT_REVOCATION_REFRESH_INTERVAL секунд множество дополняется записями,
+отозванными с прошлой проверки (индексированный запрос по revoked_at), а раз
+в JWT_REVOCATION_REBUILD_INTERVAL секунд фильтр строится заново без
+истекших токенов. К базе обращается только проверка jti, на котором фильтр
+сработал; для реально отозванных токенов и ложных срабатываний результат
+запоминается.
+
+Отзыв в другом процессе становится виден не позже чем через
+JWT_REVOCATION_REFRESH_INTERVAL секунд.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import RevokedToken
+import hashlib
+import math
+import threading
+import time
+
+# Максимальный размер множества jti, для которых срабатывание фильтра оказалось ложным
+MAX_FALSE_POSITIVES = 10000
+
+
+class BloomFilter:
+    """Фильтр Блума с двойным хешированием blake2b"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.size for index in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationCache:
+    """Состояние проверки отзыва в процессе"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._recent = set()
+        self._false_positives = set()
+        self._since = None
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+
+    def _due(self, now: float) -> bool:
+        return self._bloom is None or now - self._refreshed_at >= settings.JWT_REVOCATION_REFRESH_INTERVAL
+
+    def refresh(self, force: bool = False) -> None:
+        """Подгрузка новых отзывов, если прошел интервал обновления"""
+        now = time.monotonic()
+        if not force and not self._due(now):
+            return
+        with self._lock:
+            if not force and not self._due(now):
+                return
+            if (self._bloom is None or now - self._rebuilt_at >= settings.JWT_REVOCATION_REBUILD_INTERVAL
+                    or len(self._recent) > settings.JWT_REVOCATION_BLOOM_CAPACITY):
+                self._rebuild(now)
+            else:
+                # Перекрытие на интервал обновления, чтобы не пропустить записи,
+                # зафиксированные во время предыдущего запроса
+                since = timezone.now() - timedelta(seconds=settings.JWT_REVOCATION_REFRESH_INTERVAL)
+                self._recent.update(
+                    RevokedToken.objects.filter(revoked_at__gte=self._since).values_list('jti', flat=True)
+                )
+                self._since = since
+            self._refreshed_at = now
+
+    def _rebuild(self, now: float) -> None:
+        since = timezone.now() - timedelta(seconds=settings.JWT_REVOCATION_REFRESH_INTERVAL)
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list('jti', flat=True))
+        bloom = BloomFilter(
+            max(settings.JWT_REVOCATION_BLOOM_CAPACITY, 2 * len(jtis)),
+            settings.JWT_REVOCATION_BLOOM_ERROR_RATE,
+        )
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom, self._recent, self._false_positives = bloom, set(), set()
+        self._since = since
+        self._rebuilt_at = now
+
+    def add(self, jti: str) -> None:
+        """Учет отзыва, сделанного в этом процессе"""
+        self._recent.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        self.refresh()
+        bloom = self._bloom
+        if jti in self._recent:
+            return True
+        if bloom is None or jti not in bloom or jti in self._false_positives:
+            return False
+        # Фильтр мог сработать ложно, проверяем по базе
+        if RevokedToken.objects.filter(jti=jti).exists():
+            self._recent.add(jti)
+            return True
+        if len(self._false_positives) >= MAX_FALSE_POSITIVES:
+            self._false_positives = set()
+        self._false_positives.add(jti)
+        return False
+
+    def reset(self) -> None:
+        """Сброс состояния: следующая проверка перестроит фильтр"""
+        with self._lock:
+            self._bloom = None
+
+
+REVOCATIONS = RevocationCache()
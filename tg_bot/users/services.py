@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from datetime import datetime, timezone
 from typing import Optional, Dict, Any
+from .models import RevokedToken
+from .revocation import REVOCATIONS
+import jwt
+import uuid
 
 User = get_user_model()
 
@@ -41,4 +48,96 @@ def get_user_by_id(user_id: int) -> Optional[User]:
     try:
         return User.objects.get(id=user_id)
     except User.DoesNotExist:
-        return None 
\ No newline at end of file
+        return None 
+
+def issue_tokens(user_id: int) -> Dict[str, str]:
+    """
+    Выпуск пары токенов доступа и обновления.
+
+    Каждый токен содержит уникальный jti, по которому его можно отозвать,
+    и тип (access или refresh).
+    """
+    now = datetime.now(timezone.utc)
+    tokens = {}
+    for token_type, lifetime in (
+        ('access', settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']),
+        ('refresh', settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME']),
+    ):
+        tokens[token_type] = jwt.encode(
+            {
+                'user_id': user_id,
+                'token_type': token_type,
+                'jti': uuid.uuid4().hex,
+                'iat': now,
+                'exp': now + lifetime,
+            },
+            settings.SIMPLE_JWT['SIGNING_KEY'],
+            algorithm=settings.SIMPLE_JWT['ALGORITHM']
+        )
+    return tokens
+
+def decode_token(token: str, token_type: str = 'access') -> Dict[str, Any]:
+    """
+    Проверка подписи, срока действия, типа и отзыва токена.
+
+    Токены доступа без типа и jti (выпущенные до ротации) принимаются, но не
+    могут быть отозваны. Отзыв проверяется по REVOCATIONS без запроса к базе.
+
+    Raises:
+        jwt.InvalidTokenError: Если токен недействителен или отозван
+    """
+    required = ['exp', 'jti'] if token_type == 'refresh' else ['exp']
+    payload = jwt.decode(
+        token,
+        settings.SIMPLE_JWT['SIGNING_KEY'],
+        algorithms=[settings.SIMPLE_JWT['ALGORITHM']],
+        options={'require': required},
+    )
+    if payload.get('token_type', 'access') != token_type:
+        raise jwt.InvalidTokenError("Неверный тип токена")
+    if payload.get('jti') and REVOCATIONS.is_revoked(payload['jti']):
+        raise jwt.InvalidTokenError("Токен отозван")
+    return payload
+
+def revoke_token(payload: Dict[str, Any]) -> bool:
+    """
+    Отзыв токена по jti.
+
+    Returns:
+        bool: False, если токен уже был отозван
+    """
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(
+                jti=payload['jti'],
+                expires_at=datetime.fromtimestamp(payload['exp'], tz=timezone.utc),
+            )
+    except IntegrityError:
+        return False
+    finally:
+        REVOCATIONS.add(payload['jti'])
+    return True
+
+def rotate_refresh_token(token: str) -> Dict[str, str]:
+    """
+    Обмен refresh-токена на новую пару токенов.
+
+    Использованный refresh-токен отзывается; уникальный индекс по jti
+    гарантирует, что при параллельных запросах обмен пройдет только один раз.
+
+    Raises:
+        jwt.InvalidTokenError: Если токен недействителен или уже использован
+        ValueError: Если пользователь не найден
+    """
+    payload = decode_token(token, 'refresh')
+    user = get_user_by_id(payload.get('user_id'))
+    if not user:
+        raise ValueError("Пользователь не найден")
+    if not revoke_token(payload):
+        raise jwt.InvalidTokenError("Токен отозван")
+    return issue_tokens(user.id)
+
+def purge_revoked_tokens() -> int:
+    """Удаление записей об истекших токенах, возвращает количество удаленных"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=datetime.now(timezone.utc)).delete()
+    return deleted
@@ -1,12 +1,20 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.utils import timezone
+from django.db.models import Q
 import jwt
 from datetime import datetime, timedelta
+from .models import RevokedToken
+from .revocation import REVOCATIONS, BloomFilter
+from .services import issue_tokens, purge_revoked_tokens
+from tg_bot.admin_tools import PREFIX_UPPER_BOUND, prefix_query
 
 User = get_user_model()
 
+# Лимиты частоты отключены: корзины в памяти общие для всех тестов процесса
+@override_settings(API_THROTTLE_RATES={})
 class UserAPITests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -94,4 +102,90 @@ class UserAPITests(TestCase):
     def test_get_current_user_unauthorized(self):
         """Тест получения информации о пользователе без авторизации"""
         response = self.client.get('/api/users/me')
-        self.assertEqual(response.status_code, 401) 
\ No newline at end of file
+        self.assertEqual(response.status_code, 401) 
+
+# Лимиты частоты отключены: корзины в памяти общие для всех тестов процесса
+@override_settings(API_THROTTLE_RATES={})
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        REVOCATIONS.reset()
+        self.tokens = issue_tokens(self.user.id)
+
+    def me(self, access):
+        return self.client.get('/api/users/me', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def refresh(self, refresh):
+        return self.client.post('/api/users/refresh', {'refresh': refresh}, content_type='application/json')
+
+    def test_refresh_rotation(self):
+        """Тест ротации: использованный refresh-токен повторно не принимается"""
+        response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 400)
+        self.assertEqual(self.refresh(response.json()['refresh']).status_code, 200)
+        # Токен доступа не подходит для обновления
+        self.assertEqual(self.refresh(self.tokens['access']).status_code, 400)
+
+    def test_logout(self):
+        """Тест отзыва токенов доступа и обновления при выходе"""
+        response = self.client.post('/api/users/logout', {'refresh': self.tokens['refresh']},
+                                    content_type='application/json',
+                                    HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me(self.tokens['access']).status_code, 401)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 400)
+
+    @override_settings(JWT_REVOCATION_REFRESH_INTERVAL=3600)
+    def test_check_without_queries(self):
+        """Тест проверки отзыва без запросов к базе и подгрузки отзывов из других процессов"""
+        REVOCATIONS.refresh(force=True)
+        with self.assertNumQueries(1):  # только загрузка пользователя
+            self.assertEqual(self.me(self.tokens['access']).status_code, 200)
+
+        # Отзыв, сделанный другим процессом, виден после подгрузки
+        payload = jwt.decode(self.tokens['access'], options={'verify_signature': False})
+        RevokedToken.objects.create(jti=payload['jti'], expires_at=timezone.now() + timedelta(hours=1))
+        REVOCATIONS.refresh(force=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(self.tokens['access']).status_code, 401)
+
+    def test_bloom_filter(self):
+        """Тест отсутствия ложноотрицательных ответов фильтра Блума"""
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'revoked-{index}' for index in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'valid-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_purge(self):
+        """Тест удаления записей об истекших токенах"""
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='active', expires_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(purge_revoked_tokens(), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['active'])
+
+
+class UserAdminTests(TestCase):
+    def test_indexed_search(self):
+        """Тест поиска пользователей по началу имени и точному email"""
+        admin_user = User.objects.create_superuser(username='admin', password='adminpass123', email='a@example.com')
+        User.objects.create_user(username='alice', password='testpass123', email='alice@example.com')
+        User.objects.create_user(username='bob', password='testpass123', email='bob@example.com')
+        self.client.force_login(admin_user)
+
+        def found(term):
+            response = self.client.get('/admin/users/user/', {'q': term})
+            return sorted(user.username for user in response.context['cl'].result_list)
+
+        self.assertEqual(found('al'), ['alice'])
+        self.assertEqual(found('bob@example.com'), ['bob'])
+        self.assertEqual(found('example'), [])
+
+    def test_prefix_query_by_vendor(self):
+        """Тест префиксного условия: диапазон только в SQLite, startswith в PostgreSQL"""
+        self.assertEqual(prefix_query('username', 'al', 'sqlite'),
+                         Q(username__gte='al', username__lt='al' + PREFIX_UPPER_BOUND))
+        self.assertEqual(prefix_query('username', 'al', 'postgresql'), Q(username__startswith='al'))